@@ -18,6 +18,7 @@ Utility modules
 .. autosummary::
   :toctree:
 
+  COT.checksum_cache
   COT.data_validation
   COT.file_reference
   COT.utilities
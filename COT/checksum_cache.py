@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# checksum_cache.py - Persistent cache of file checksums
+#
+# October 2026, the COT project developers.
+# Copyright (c) 2026 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Persistent on-disk cache of file checksums.
+
+Computing the checksum of a multi-gigabyte disk image is expensive, and
+the same unchanged images are often processed by COT over and over again.
+This module stores previously computed checksums in a small SQLite database
+under ``$XDG_CACHE_HOME/cot`` (by default ``~/.cache/cot``), keyed on the
+identity of the file (path, device, inode, size, and modification time),
+so that an unchanged file costs a single ``stat`` rather than a full read.
+
+The cache can be disabled by setting the ``COT_NO_CHECKSUM_CACHE``
+environment variable, or for a single block of code with
+:meth:`ChecksumCache.enabled_if` (as done by the ``--no-checksum-cache``
+CLI option).
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  ChecksumCache
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ChecksumCache(object):
+    """Persistent cache mapping file identity and algorithm to checksum.
+
+    Use :meth:`shared` to get the process-wide instance, if enabled.
+    All database errors are logged and otherwise ignored - a broken
+    cache simply behaves as an empty one.
+    """
+
+    ENABLED = (os.environ.get('COT_NO_CHECKSUM_CACHE') is None)
+    """Set to False to disable use of the persistent cache."""
+
+    MAX_ENTRIES = 10000
+    """Maximum number of checksums to retain in the cache."""
+
+    MAX_AGE = 90 * 24 * 60 * 60
+    """Discard entries that have not been used in this many seconds."""
+
+    MIN_FILE_AGE = 2
+    """Don't cache files modified less than this many seconds ago.
+
+    A file that is still being written might be modified again without any
+    visible change to its modification time, so caching it is unsafe.
+    """
+
+    _shared = None
+
+    @staticmethod
+    def default_path():
+        """Get the default location of the cache database.
+
+        Returns:
+          str: ``$XDG_CACHE_HOME/cot/checksums.sqlite``
+        """
+        cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                      os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(cache_home, 'cot', 'checksums.sqlite')
+
+    @classmethod
+    def shared(cls):
+        """Get the shared process-wide cache instance, if enabled.
+
+        Returns:
+          ChecksumCache: Cache instance, or None if caching is disabled.
+        """
+        if not cls.ENABLED:
+            return None
+        path = cls.default_path()
+        if cls._shared is None or cls._shared.path != path:
+            cls._shared = cls(path)
+        return cls._shared
+
+    @classmethod
+    @contextmanager
+    def enabled_if(cls, condition):
+        """Context manager to use the cache only if the condition holds.
+
+        :attr:`ENABLED` is restored to its previous value on exit.
+
+        Args:
+          condition (bool): If False, disable the cache within this block.
+        """
+        enabled = cls.ENABLED
+        cls.ENABLED = enabled and condition
+        try:
+            yield
+        finally:
+            cls.ENABLED = enabled
+
+    @classmethod
+    def file_key(cls, path, *extra):
+        """Construct a cache key identifying the current state of a file.
+
+        Args:
+          path (str): Path to the file.
+          *extra: Additional values (such as the offset of a member within
+            an archive) to include in the key.
+
+        Returns:
+          str: Cache key, or None if the file is not currently cacheable.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if time.time() - stat.st_mtime < cls.MIN_FILE_AGE:
+            return None
+        mtime = getattr(stat, 'st_mtime_ns', None) or repr(stat.st_mtime)
+        return ":".join(str(x) for x in
+                        [os.path.realpath(path), stat.st_dev, stat.st_ino,
+                         stat.st_size, mtime] + list(extra))
+
+    def __init__(self, path):
+        """Open (creating if needed) the cache database at the given path.
+
+        Args:
+          path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            self._db = sqlite3.connect(path, timeout=5,
+                                       check_same_thread=False)
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS checksums ("
+                                 "key TEXT, algorithm TEXT, checksum TEXT, "
+                                 "last_used REAL, "
+                                 "PRIMARY KEY (key, algorithm))")
+            self.evict()
+        except (sqlite3.Error, OSError) as exc:
+            self._disable(exc)
+
+    def _disable(self, exc):
+        """Stop using the database after an error.
+
+        Args:
+          exc (Exception): Error encountered
+        """
+        logger.debug("Unable to use checksum cache %s: %s", self.path, exc)
+        if self._db is not None:
+            try:
+                self._db.close()
+            except sqlite3.Error:
+                pass
+        self._db = None
+
+    def lookup(self, key, algorithm):
+        """Look up a previously stored checksum.
+
+        Args:
+          key (str): Key as returned by :meth:`file_key`.
+          algorithm (str): Checksum algorithm such as 'sha1'.
+
+        Returns:
+          str: Cached checksum, or None if not found.
+        """
+        if self._db is None or key is None:
+            return None
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT checksum FROM checksums "
+                    "WHERE key = ? AND algorithm = ?",
+                    (key, algorithm)).fetchone()
+                if row is None:
+                    return None
+                with self._db:
+                    self._db.execute(
+                        "UPDATE checksums SET last_used = ? "
+                        "WHERE key = ? AND algorithm = ?",
+                        (time.time(), key, algorithm))
+            except sqlite3.Error as exc:
+                self._disable(exc)
+                return None
+        logger.spam("Found cached %s checksum for %s", algorithm, key)
+        return row[0]
+
+    def store(self, key, algorithm, checksum):
+        """Store a newly computed checksum.
+
+        Args:
+          key (str): Key as returned by :meth:`file_key`.
+          algorithm (str): Checksum algorithm such as 'sha1'.
+          checksum (str): Checksum value to store.
+        """
+        if self._db is None or key is None:
+            return
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO checksums "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, algorithm, checksum, time.time()))
+            except sqlite3.Error as exc:
+                self._disable(exc)
+
+    def evict(self):
+        """Discard stale entries and enforce :attr:`MAX_ENTRIES`."""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute(
+                        "DELETE FROM checksums WHERE last_used < ?",
+                        (time.time() - self.MAX_AGE,))
+                    self._db.execute(
+                        "DELETE FROM checksums WHERE rowid NOT IN "
+                        "(SELECT rowid FROM checksums "
+                        "ORDER BY last_used DESC LIMIT ?)",
+                        (self.MAX_ENTRIES,))
+            except sqlite3.Error as exc:
+                self._disable(exc)
+
+    def clear(self):
+        """Discard all entries in the cache."""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute("DELETE FROM checksums")
+            except sqlite3.Error as exc:
+                self._disable(exc)
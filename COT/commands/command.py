@@ -117,14 +117,15 @@ class Command(object):
     def working_dir_disk_space_required(self):
         """How much space this module will require in :attr:`working_dir`.
 
-        By default, assumes the entire VM may be written to working directory.
-        Subclasses may wish to extend or override this.
+        By default, assumes the entire VM may be written to working directory,
+        except for any files whose copies would share storage with the
+        originals. Subclasses may wish to extend or override this.
 
         Returns:
           int: Predicted temporary storage requirements.
         """
         if self.vm is not None:
-            return self.vm.predicted_output_size()
+            return self.vm.predicted_working_dir_size()
         return 0
 
     def check_disk_space(self, required_size, location,
@@ -238,7 +239,8 @@ class ReadCommand(Command):
             self.vm.destroy()
             self.vm = None
         if value is not None:
-            self.vm = VMDescription.factory(value, None)
+            self.vm = VMDescription.factory(
+                value, None, verify=self.ui.verify_checksums)
         self._package = value
 
     def ready_to_run(self):
@@ -298,7 +300,8 @@ class ReadWriteCommand(ReadCommand):
             self.vm = None
         if value is not None:
             # Unlike ReadCommand, we pass self.output to the VM factory
-            self.vm = VMDescription.factory(value, self.output)
+            self.vm = VMDescription.factory(
+                value, self.output, verify=self.ui.verify_checksums)
         self._package = value
 
     @property
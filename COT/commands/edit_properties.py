@@ -214,21 +214,24 @@ class COTEditProperties(ReadWriteCommand):
                                               self.user_configurable)
 
         if self.properties:
+            entries = []
             for index in range(0, len(self.properties)):
                 key, value, prop_type = self.properties[index]
-                label = self.labels[index] if self.labels else None
-                desc = self.descriptions[index] if self.descriptions else None
                 curr_value = self.vm.get_property_value(key)
                 if curr_value is None:
                     self.ui.confirm_or_die(
                         "Property '{0}' does not yet exist.\n"
                         "Create it?".format(key))
-                self.vm.set_property_value(
-                    key, value,
-                    user_configurable=self.user_configurable,
-                    property_type=prop_type,
-                    label=label,
-                    description=desc)
+                entries.append({
+                    'key': key,
+                    'value': value,
+                    'user_configurable': self.user_configurable,
+                    'property_type': prop_type,
+                    'label': self.labels[index] if self.labels else None,
+                    'description': (self.descriptions[index]
+                                    if self.descriptions else None),
+                })
+            self.vm.import_properties(entries)
 
         if self.transports:
             self.vm.environment_transports = self.transports
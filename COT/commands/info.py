@@ -99,7 +99,9 @@ class COTInfo(Command):
             if not first:
                 print("")
             try:
-                with VMDescription.factory(package, None) as vm:
+                with VMDescription.factory(
+                        package, None,
+                        verify=self.ui.verify_checksums) as vm:
                     print(vm.info_string(self.ui.terminal_width - 1,
                                          self.verbosity))
             except VMInitError as exc:
@@ -27,6 +27,7 @@ import textwrap
 from pkg_resources import resource_listdir, resource_filename
 
 from COT.helpers import Helper, HelperError, HelperNotFoundError, helpers
+from COT.helpers.cache import HelperCache, HelperRegistry
 from .command import command_classes, Command
 
 logger = logging.getLogger(__name__)
@@ -156,6 +157,7 @@ class COTInstallHelpers(Command):
         super(COTInstallHelpers, self).__init__(ui)
         self.ignore_errors = False
         self.verify_only = False
+        self.refresh = False
 
     def install_helper(self, helper):
         """Install the given helper module.
@@ -183,6 +185,22 @@ class COTInstallHelpers(Command):
                     HelperNotFoundError) as exc:
                 return (False, "INSTALLATION FAILED: " + str(exc))
 
+    @staticmethod
+    def refresh_helpers():
+        """Discard all cached information about helpers.
+
+        Clears the persistent :class:`~COT.helpers.cache.HelperRegistry`
+        and :class:`~COT.helpers.cache.HelperCache`, so that each helper's
+        path and version will be rediscovered and recorded afresh.
+        """
+        logger.info("Discarding cached information about helper programs")
+        registry = HelperRegistry.shared()
+        if registry is not None:
+            registry.clear()
+        HelperCache.shared().clear()
+        for helper in helpers.values():
+            helper.refresh()
+
     def manpages_helper(self):
         """Verify or install COT's manual pages.
 
@@ -203,6 +221,8 @@ class COTInstallHelpers(Command):
 
     def run(self):
         """Verify all helper tools and install any that are missing."""
+        if self.refresh:
+            self.refresh_helpers()
         result = True
         results = {}
         for name in ['fatdisk', 'ovftool', 'qemu-img', 'vmdktool']:
@@ -241,12 +261,16 @@ class COTInstallHelpers(Command):
             help=("Install/verify COT manual pages and any third-party helper "
                   "programs that COT may require"),
             usage=self.ui.fill_usage('install-helpers',
-                                     ["--verify-only",
-                                      "[--ignore-errors]"]),
+                                     ["--verify-only [--refresh]",
+                                      "[--ignore-errors] [--refresh]"]),
             description="""
 Install or verify the installation of COT manual pages and various required
 third-party helper programs for COT.
 
+COT remembers the location and version of each helper program it finds
+(under $XDG_CACHE_HOME/cot) until the program itself changes;
+use --refresh to discard this information and check again from scratch.
+
 * qemu-img (http://www.qemu.org/)
 * mkisofs  (http://cdrecord.org/)
 * ovftool  (https://www.vmware.com/support/developer/ovf/)
@@ -302,6 +326,11 @@ vmdktool:     successfully installed to /usr/local/bin/vmdktool
                            help="Do not fail even if helper installation "
                            "fails.")
 
+        parser.add_argument('--refresh', action='store_true',
+                            help="Discard any cached information about "
+                            "helpers (locations, versions, etc.) and "
+                            "rediscover them.")
+
         parser.set_defaults(instance=self)
 
 
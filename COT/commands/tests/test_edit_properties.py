@@ -307,6 +307,49 @@ ovf:userConfigurable="true" ovf:value="end" />
                           "jabberwock",
                           "short")
 
+    def test_set_property_values(self):
+        """Set many property values at once."""
+        self.command.package = self.input_ovf
+        vm = self.command.vm
+
+        self.assertEqual(
+            ['abc', 'true', 'false', None, 'xyz'],
+            vm.set_property_values([("login-username", "abc"),
+                                    ("enable-ssh-server", "yes"),
+                                    ("enable-ssh-server", "0"),
+                                    ("new-property", None),
+                                    ("new-property", "xyz")]))
+        self.assertEqual("abc", vm.get_property_value("login-username"))
+        self.assertEqual("false", vm.get_property_value("enable-ssh-server"))
+        self.assertEqual("xyz", vm.get_property_value("new-property"))
+        self.assertEqual(
+            ['', 'hello'],
+            vm.set_property_values({"login-username": ""},
+                                   user_configurable=False) +
+            vm.set_property_values({"new-property": "hello"}))
+        self.assertEqual("hello", vm.get_property_value("new-property"))
+        self.assertEqual(
+            "false", vm.find_child(
+                vm.product_section, vm.PROPERTY,
+                attrib={vm.PROP_KEY: "login-username"}).get(
+                    vm.PROP_USER_CONFIGABLE))
+
+    def test_import_properties_invalid(self):
+        """No properties are changed if any value is invalid."""
+        self.command.package = self.input_ovf
+        vm = self.command.vm
+
+        with self.assertRaises(ValueUnsupportedError):
+            vm.import_properties([
+                {'key': "login-username", 'value': "admin"},
+                {'key': "new-property", 'value': "hello",
+                 'label': "New Property"},
+                {'key': "login-password", 'value': "x" * 26},
+            ])
+        self.assertEqual("", vm.get_property_value("login-username"))
+        self.assertIsNone(vm.get_property_value("new-property"))
+        self.assertEqual("", vm.get_property_value("login-password"))
+
     def test_update_label_and_description(self):
         """Update label and description for existing properties."""
         self.command.package = self.input_ovf
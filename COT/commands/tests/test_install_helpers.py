@@ -19,6 +19,7 @@
 
 import os
 import sys
+from distutils.version import StrictVersion
 
 import mock
 
@@ -196,6 +197,22 @@ vmdktool:     INSTALLATION FAILED: [Errno 1] not really installing!
         helpers["genisoimage"]._installed = False
         self.check_cot_output(expected_output)
 
+    @mock.patch('COT.commands.install_helpers.HelperRegistry.shared')
+    def test_refresh(self, mock_registry):
+        """With --refresh, cached information about helpers is discarded."""
+        helpers['qemu-img']._path = "/foo/bar/qemu-img"
+        helpers['qemu-img']._installed = True
+        helpers['qemu-img']._version = StrictVersion("2.1.0")
+        self.command.refresh_helpers()
+        mock_registry.return_value.clear.assert_called_once_with()
+        self.assertIsNone(helpers['qemu-img']._path)
+        self.assertIsNone(helpers['qemu-img']._installed)
+        self.assertIsNone(helpers['qemu-img']._version)
+
+        # No registry to clear if disabled
+        mock_registry.return_value = None
+        self.command.refresh_helpers()
+
     @mock.patch('os.path.exists', return_value=False)
     def test_manpages_helper_verify_dir_not_found(self, *_):
         """Call manpages_helper with verify-only, directory not found."""
@@ -244,7 +261,7 @@ vmdktool:     INSTALLATION FAILED: [Errno 1] not really installing!
     @mock.patch('filecmp.cmp', return_value=False)
     @mock.patch('COT.helpers.helper.check_call',
                 side_effect=HelperError)
-    @mock.patch('shutil.copy')
+    @mock.patch('COT.helpers.helper.materialize')
     def test_manpages_helper_create_file_fail(self, mock_copy, *_):
         """Call manpages_helper with a simulated copy() failure."""
         mock_copy.side_effect = IOError(13, "Permission denied",
@@ -257,7 +274,7 @@ vmdktool:     INSTALLATION FAILED: [Errno 1] not really installing!
                          .format(self.manpath),
                          message)
 
-    @mock.patch('shutil.copy')
+    @mock.patch('COT.helpers.helper.materialize')
     @mock.patch('filecmp.cmp', return_value=False)
     @mock.patch('os.makedirs', return_value=False)
     def test_manpages_helper_all_new(self, *_):
@@ -269,7 +286,7 @@ vmdktool:     INSTALLATION FAILED: [Errno 1] not really installing!
 
     @mock.patch('os.path.exists', return_value=True)
     @mock.patch('os.path.isdir', return_value=True)
-    @mock.patch('shutil.copy')
+    @mock.patch('COT.helpers.helper.materialize')
     @mock.patch('filecmp.cmp', return_value=False)
     def test_manpages_helper_update(self, *_):
         """Call manpages_helper to simulate updating existing manpages."""
@@ -40,6 +40,7 @@
   check_for_conflict
   device_address
   file_checksum
+  file_checksums
   mac_address
   match_or_die
   natural_sort
@@ -327,17 +328,31 @@ def file_checksum(path_or_obj, checksum_type):
     Returns:
       str: Hexadecimal file checksum
     """
-    # pylint: disable=redefined-variable-type
-    if checksum_type == 'md5':
-        hash_obj = hashlib.md5()
-    elif checksum_type == 'sha1':
-        hash_obj = hashlib.sha1()
-    elif checksum_type == 'sha256':
-        hash_obj = hashlib.sha256()
-    else:
-        raise NotImplementedError(
-            "No support for generating checksum type {0}"
-            .format(checksum_type))
+    return file_checksums(path_or_obj, [checksum_type])[checksum_type]
+
+
+CHECKSUM_BLOCKSIZE = 1024 * 1024
+"""Bytes to read at a time when computing a file checksum."""
+
+
+def file_checksums(path_or_obj, checksum_types):
+    """Get multiple checksums of the given file in a single pass over its data.
+
+    Args:
+      path_or_obj (str): File path to checksum OR an opened file object
+      checksum_types (list): Any of 'md5', 'sha1', 'sha256'.
+    Returns:
+      dict: Hexadecimal file checksum for each requested checksum type.
+    Raises:
+      NotImplementedError: if an unsupported checksum type is requested.
+    """
+    hash_objs = {}
+    for checksum_type in checksum_types:
+        if checksum_type not in ['md5', 'sha1', 'sha256']:
+            raise NotImplementedError(
+                "No support for generating checksum type {0}"
+                .format(checksum_type))
+        hash_objs[checksum_type] = hashlib.new(checksum_type)
 
     # Is it a file or do we need to open it?
     try:
@@ -346,19 +361,19 @@ def file_checksum(path_or_obj, checksum_type):
     except AttributeError:
         file_obj = open(path_or_obj, 'rb')
 
-    blocksize = 65536
-
     try:
         while True:
-            buf = file_obj.read(blocksize)
+            buf = file_obj.read(CHECKSUM_BLOCKSIZE)
             if len(buf) == 0:
                 break
-            hash_obj.update(buf)
+            for hash_obj in hash_objs.values():
+                hash_obj.update(buf)
     finally:
         if file_obj != path_or_obj:
             file_obj.close()
 
-    return hash_obj.hexdigest()
+    return dict((checksum_type, hash_obj.hexdigest()) for
+                (checksum_type, hash_obj) in hash_objs.items())
 
 
 def mac_address(string):
@@ -21,6 +21,7 @@ API
 .. autosummary::
   :nosignatures:
 
+  DiskReader
   DiskRepresentation
 
 Disk modules
@@ -37,12 +38,13 @@ Disk modules
 
 # flake8: noqa: F401
 
-from .disk import DiskRepresentation
+from .disk import DiskReader, DiskRepresentation
 from .iso import ISO
 from .qcow2 import QCOW2
 from .raw import RAW
 from .vmdk import VMDK
 
 __all__ = (
+    'DiskReader',
     'DiskRepresentation',
 )
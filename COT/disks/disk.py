@@ -10,17 +10,163 @@
 # of COT, including this file, may be copied, modified, propagated, or
 # distributed except according to the terms contained in the LICENSE.txt file.
 
-"""Abstract base class for representations of disk image files."""
+"""Abstract base class for representations of disk image files.
 
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  DiskReader
+  DiskRepresentation
+"""
+
+import errno
 import logging
 import os
 import re
+import time
+
+from multiprocessing import cpu_count
 
 from COT.helpers import helpers, HelperError
+from COT.utilities import pretty_bytes
 
 logger = logging.getLogger(__name__)
 
 
+class DiskReader(object):
+    """Reader of the guest-visible contents of a disk image file.
+
+    This base class reads RAW images, whose contents are simply those of the
+    file itself; readers of other formats override :meth:`read`.
+    Reads are random-access, but are most efficient when sequential.
+    Use :meth:`DiskRepresentation.open_reader` to get an appropriate reader.
+    """
+
+    def __init__(self, path, capacity=None):
+        """Open the given disk image for reading.
+
+        Args:
+          path (str): Path to the disk image file.
+          capacity (int): Capacity of the disk, in bytes, if known.
+            Defaults to the size of the file.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        if capacity is None:
+            capacity = os.path.getsize(path)
+        self.capacity = int(capacity)
+        """Capacity of the disk, in bytes."""
+        # Start and end of the last hole found with SEEK_DATA, if any;
+        # the end is None if SEEK_DATA isn't supported for this file
+        self._hole = (0, 0)
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+
+    def __enter__(self):
+        """Use this reader as a context manager.
+
+        Returns:
+          DiskReader: self
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        """Close the reader when exiting the context.
+
+        For the parameters, see :meth:`object.__exit__`.
+        """
+        self.close()
+
+    def _in_hole(self, offset, length):
+        """Check whether a range of the file lies entirely within a hole.
+
+        Uses ``SEEK_DATA`` where the platform and file system support it,
+        so that large unallocated regions of sparse files needn't be read.
+
+        Args:
+          offset (int): Byte offset into the file.
+          length (int): Number of bytes in the range.
+
+        Returns:
+          bool: True if the range is known to contain no data.
+        """
+        (hole_start, hole_end) = self._hole
+        if hole_end is None or not hasattr(os, 'SEEK_DATA'):
+            return False
+        if hole_start <= offset and offset + length <= hole_end:
+            return True
+        try:
+            hole_end = os.lseek(self._file.fileno(), offset, os.SEEK_DATA)
+        except OSError as exc:
+            if exc.errno != errno.ENXIO:
+                # Not supported by this file system
+                self._hole = (0, None)
+                return False
+            # No more data at all beyond this offset
+            hole_end = self.capacity
+        self._hole = (offset, hole_end)
+        return offset + length <= hole_end
+
+    def read(self, offset, length):
+        """Read a range of the disk's contents.
+
+        Args:
+          offset (int): Byte offset into the disk.
+          length (int): Number of bytes to read.
+
+        Returns:
+          bytes: Exactly ``length`` bytes of data, padded with zeros beyond
+          the end of the disk if needed, or None if the entire range is
+          known to be unallocated (and therefore reads as all zeros).
+        """
+        if self._in_hole(offset, length):
+            return None
+        self._file.seek(offset)
+        data = self._file.read(length)
+        if len(data) < length:
+            data += b"\0" * (length - len(data))
+        return data
+
+    def _read_clusters(self, offset, length, cluster_size, read_cluster):
+        """Read a range of a disk whose contents are mapped in clusters.
+
+        Helper function for implementations of :meth:`read`.
+
+        Args:
+          offset (int): Byte offset into the disk.
+          length (int): Number of bytes to read.
+          cluster_size (int): Size of each cluster, in bytes.
+          read_cluster (function): Function taking a cluster index and
+            returning its full contents, or None if it is unallocated.
+
+        Returns:
+          bytes: See :meth:`read`.
+        """
+        pieces = []
+        allocated = False
+        end = offset + length
+        while offset < end:
+            index = offset // cluster_size
+            start = offset - index * cluster_size
+            size = min(cluster_size - start, end - offset)
+            data = None
+            if offset < self.capacity:
+                data = read_cluster(index)
+            if data is None:
+                pieces.append(b"\0" * size)
+            else:
+                allocated = True
+                pieces.append(data[start:start + size])
+            offset += size
+        if not allocated:
+            return None
+        return b"".join(pieces)
+
+
 class DiskRepresentation(object):
     """Abstract disk image file representation."""
 
@@ -57,6 +203,11 @@ class DiskRepresentation(object):
     def from_file(path):
         """Get a DiskRepresentation instance appropriate to the given file.
 
+        The file header is first checked natively by each subclass's
+        :meth:`probe_header`; helper programs such as ``qemu-img``
+        are only consulted (via :meth:`file_is_this_type`) if no subclass
+        recognizes the header.
+
         Args:
           path (str): Path of existing file to represent.
 
@@ -69,10 +220,39 @@ class DiskRepresentation(object):
         """
         if not os.path.exists(path):
             raise IOError(2, "No such file or directory: {0}".format(path))
+        header = DiskRepresentation.read_header(path)
+        guesses = []
+        for subclass in DiskRepresentation.subclasses():
+            result = subclass.probe_header(path, header)
+            if result is not None:
+                guesses.append((subclass, result[0]))
+        if not guesses:
+            logger.debug("File header of %s not recognized, falling back to "
+                         "helper programs to identify it", path)
+            guesses = [(subclass, subclass.file_is_this_type(path))
+                       for subclass in DiskRepresentation.subclasses()]
+        best_guess = DiskRepresentation._best_guess(path, guesses)
+        disk = best_guess(path)
+        disk._probe(header)
+        return disk
+
+    @staticmethod
+    def _best_guess(path, guesses):
+        """Select the most likely DiskRepresentation subclass for a file.
+
+        Args:
+          path (str): Path of the file being identified.
+          guesses (list): List of ``(subclass, confidence)`` tuples.
+
+        Returns:
+          class: DiskRepresentation subclass with the highest confidence.
+
+        Raises:
+          NotImplementedError: if no subclass has any confidence at all.
+        """
         best_guess = None
         best_confidence = 0
-        for subclass in DiskRepresentation.subclasses():
-            confidence = subclass.file_is_this_type(path)
+        for subclass, confidence in guesses:
             if confidence > best_confidence:
                 logger.debug("File %s may be a %s, with confidence %d%%",
                              path, subclass.disk_format, confidence)
@@ -83,17 +263,16 @@ class DiskRepresentation(object):
                                "classes %s and %s. Using %s",
                                path, confidence, best_guess,
                                subclass, best_guess)
-        if best_guess is not None:
-            logger.verbose("File %s appears to be a %s, with confidence %s%%",
-                           path, best_guess.disk_format, best_confidence)
-            if best_confidence < 50:
-                logger.warning("File %s has been guessed to be a %s disk "
-                               "image, but COT has low confidence (%s%%) "
-                               "in this guess.",
-                               path, best_guess.disk_format, best_confidence)
-            return best_guess(path)
-        else:
+        if best_guess is None:
             raise NotImplementedError("No support for files of this type")
+        logger.verbose("File %s appears to be a %s, with confidence %s%%",
+                       path, best_guess.disk_format, best_confidence)
+        if best_confidence < 50:
+            logger.warning("File %s has been guessed to be a %s disk "
+                           "image, but COT has low confidence (%s%%) "
+                           "in this guess.",
+                           path, best_guess.disk_format, best_confidence)
+        return best_guess
 
     @classmethod
     def for_new_file(cls, path, disk_format, **kwargs):
@@ -135,20 +314,45 @@ class DiskRepresentation(object):
         self._disk_subformat = None
         self._capacity = None
         self._files = None
+        self._probed = False
 
     @property
     def path(self):
         """System path to this disk file."""
         return self._path
 
+    def _probe(self, header=None):
+        """Fill in the subformat and capacity from the file header if we can.
+
+        Only the first call does anything; see :meth:`probe_header`.
+
+        Args:
+          header (bytes): File header, if already read by the caller.
+        """
+        if self._probed:
+            return
+        self._probed = True
+        if header is None:
+            header = self.read_header(self.path)
+        result = self.probe_header(self.path, header)
+        if result is None:
+            return
+        (_, disk_subformat, capacity) = result
+        if self._disk_subformat is None:
+            self._disk_subformat = disk_subformat
+        if self._capacity is None:
+            self._capacity = capacity
+
     @property
     def disk_subformat(self):
         """Sub-format of the disk, such as 'rockridge' or 'streamOptimized'."""
+        self._probe()
         return self._disk_subformat
 
     @property
     def capacity(self):
         """Capacity of this disk image, in bytes."""
+        self._probe()
         # default implementation - qemu-img handles most types we need
         if self._capacity is None:
             output = helpers['qemu-img'].call(['info', self.path])
@@ -200,7 +404,121 @@ class DiskRepresentation(object):
         if subclass is None:
             raise NotImplementedError("No support for converting to type '{0}'"
                                       .format(new_format))
-        return subclass.from_other_image(self, new_directory, new_subformat)
+        start = time.time()
+        new_disk = subclass.from_other_image(self, new_directory,
+                                             new_subformat)
+        logger.info("Converted %s (%s) to %s (%s) in %.1f seconds",
+                    self.path, pretty_bytes(os.path.getsize(self.path)),
+                    new_disk.path,
+                    pretty_bytes(os.path.getsize(new_disk.path)),
+                    time.time() - start)
+        return new_disk
+
+    QEMU_IMG_COROUTINES = min(16, max(8, 2 * cpu_count()))
+    """Number of parallel ``qemu-img convert`` coroutines (``-m``) to use.
+
+    ``qemu-img`` defaults to 8 and permits at most 16.
+    """
+
+    QEMU_IMG_DIRECT_IO_SIZE = 1 << 30
+    """Size above which ``qemu-img convert`` bypasses the host page cache.
+
+    Reading large images with ``-T none`` avoids evicting everything else
+    from the page cache for data that will only be read once.
+    """
+
+    QEMU_IMG_SPARSE_SIZE = None
+    """Minimum run of zeros for ``qemu-img convert`` to leave unallocated.
+
+    If None, the ``qemu-img`` default (4 KiB) is used; subclasses whose
+    format allocates space in larger clusters set this (``-S``) to match.
+    """
+
+    @staticmethod
+    def _supports_direct_io(path):
+        """Check whether the given file can be opened with ``O_DIRECT``.
+
+        Args:
+          path (str): Path to file.
+
+        Returns:
+          bool: False if the platform or file system doesn't support it.
+        """
+        if not hasattr(os, 'O_DIRECT'):
+            return False
+        try:
+            os.close(os.open(path, os.O_RDONLY | os.O_DIRECT))
+        except OSError:
+            return False
+        return True
+
+    @classmethod
+    def qemu_img_convert_options(cls, input_image):
+        """Get ``qemu-img convert`` options tuned to convert to this type.
+
+        Options are only used if the installed ``qemu-img`` supports them.
+
+        Args:
+          input_image (DiskRepresentation): Image to be converted.
+
+        Returns:
+          list: Options such as ``['-m', '16', '-W']``.
+        """
+        capabilities = helpers['qemu-img'].capabilities
+        options = []
+        if capabilities.get('convert_coroutines'):
+            options += ['-m', str(cls.QEMU_IMG_COROUTINES)]
+            # Out-of-order writes would fragment formats that allocate
+            # clusters as they go, and are forbidden by streamOptimized VMDK
+            if cls.disk_format == 'raw':
+                options.append('-W')
+        # The output cache mode (-t) is left at the qemu-img convert
+        # default of 'unsafe', which is already the fastest.
+        if (capabilities.get('convert_source_cache') and
+                os.path.getsize(input_image.path) >=
+                cls.QEMU_IMG_DIRECT_IO_SIZE and
+                cls._supports_direct_io(input_image.path)):
+            options += ['-T', 'none']
+        if (capabilities.get('convert_sparse_size') and
+                cls.QEMU_IMG_SPARSE_SIZE):
+            options += ['-S', cls.QEMU_IMG_SPARSE_SIZE]
+        if options:
+            logger.debug("Tuning options for conversion of %s to %s: %s",
+                         input_image.path, cls.disk_format, options)
+        return options
+
+    @classmethod
+    def _qemu_img_convert(cls, input_image, output_path, output_options=None):
+        """Convert the other disk image into this type using ``qemu-img``.
+
+        Args:
+          input_image (DiskRepresentation): Existing image representation.
+          output_path (str): Path of the image file to create.
+          output_options (list): Additional ``-o`` options for the new image,
+            such as ``['subformat=streamOptimized']``.
+
+        Returns:
+          DiskRepresentation: Representation of the new image.
+        """
+        args = ['convert', '-O', cls.disk_format]
+        for option in output_options or []:
+            args += ['-o', option]
+        args += cls.qemu_img_convert_options(input_image)
+        helpers['qemu-img'].call(args + [input_image.path, output_path])
+        return cls(output_path)
+
+    def open_reader(self):
+        """Open this disk image to read its contents natively.
+
+        Returns:
+          DiskReader: Reader of the guest-visible contents of this disk.
+
+        Raises:
+          NotImplementedError: if COT can't read this image natively,
+            in which case helper programs must be used instead.
+        """
+        raise NotImplementedError("No native reader for {0} images"
+                                  .format(self.disk_format))
 
     @classmethod
     def from_other_image(cls, input_image, output_dir, output_subformat=None):
@@ -216,6 +534,48 @@ class DiskRepresentation(object):
         """
         raise NotImplementedError("Not a valid target for conversion")
 
+    PROBE_SIZE = 64 * 1024
+    """Number of leading bytes of a file examined by :meth:`probe_header`.
+
+    This is enough to cover the VMDK and QCOW2 headers, the embedded VMDK
+    descriptor, and the ISO 9660 volume descriptors and root directory.
+    """
+
+    @staticmethod
+    def read_header(path):
+        """Read the leading bytes of the given file for header probing.
+
+        Args:
+          path (str): Path to file to read.
+
+        Returns:
+          bytes: Up to :attr:`PROBE_SIZE` bytes from the start of the file.
+        """
+        with open(path, 'rb') as fileobj:
+            return fileobj.read(DiskRepresentation.PROBE_SIZE)
+
+    @classmethod
+    def probe_header(cls, path, header):
+        """Check natively whether a file header matches this image type.
+
+        Unlike :meth:`file_is_this_type`, this never runs a helper program.
+        The default implementation recognizes nothing; subclasses that
+        understand their on-disk format override it.
+
+        Args:
+          path (str): Path to the file being checked.
+          header (bytes): Leading bytes of the file, as returned by
+            :meth:`read_header`.
+
+        Returns:
+          tuple: ``(confidence, disk_subformat, capacity)`` if the header is
+          recognized as this type, where ``disk_subformat`` may be None if
+          it can't be determined from the header alone and ``capacity`` is
+          a string giving the size in bytes; else None.
+        """
+        # pylint: disable=unused-argument
+        return None
+
     @classmethod
     def file_is_this_type(cls, path):
         """Check if the given file is image type represented by this class.
@@ -234,6 +594,10 @@ class DiskRepresentation(object):
             raise HelperError(2, "No such file or directory: '{0}'"
                               .format(path))
 
+        result = cls.probe_header(path, cls.read_header(path))
+        if result is not None:
+            return result[0]
+
         # Default implementation using qemu-img
         logger.debug("Using 'qemu-img' to check whether %s is a %s",
                      path, cls.disk_format)
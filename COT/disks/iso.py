@@ -15,6 +15,7 @@
 import logging
 import os
 import re
+import struct
 
 from COT.disks.disk import DiskRepresentation
 from COT.helpers import helpers, HelperError, helper_select
@@ -27,6 +28,77 @@ class ISO(DiskRepresentation):
 
     disk_format = "iso"
 
+    SECTOR_SIZE = 2048
+    """Size of an ISO 9660 volume descriptor."""
+
+    VOLUME_DESCRIPTOR_OFFSET = 16 * SECTOR_SIZE
+    """Location of the first volume descriptor."""
+
+    @classmethod
+    def probe_header(cls, path, header):
+        """Check whether the given file header is an ISO 9660 header.
+
+        Finds the Primary Volume Descriptor, whose volume space size and
+        logical block size give the capacity. If the root directory also
+        lies within the header, its System Use area tells us whether the
+        image has Rock Ridge extensions.
+
+        For the parameters, see :meth:`DiskRepresentation.probe_header`.
+        """
+        offset = cls.VOLUME_DESCRIPTOR_OFFSET
+        while offset + cls.SECTOR_SIZE <= len(header):
+            (vd_type, identifier) = struct.unpack_from("<B5s", header, offset)
+            if identifier != b"CD001" or vd_type == 255:
+                # Not ISO 9660, or end of volume descriptor set
+                return None
+            if vd_type == 1:
+                break
+            offset += cls.SECTOR_SIZE
+        else:
+            return None
+        # Both-endian fields - we only need to read the little-endian half
+        (volume_size,) = struct.unpack_from("<I", header, offset + 80)
+        (block_size,) = struct.unpack_from("<H", header, offset + 128)
+        # Root directory record is at offset 156; extent location at +2
+        (root_extent,) = struct.unpack_from("<I", header, offset + 158)
+        disk_subformat = cls._probe_rock_ridge(header,
+                                               root_extent * block_size)
+        capacity = volume_size * block_size
+        logger.debug("ISO header of %s: subformat %s, capacity %d bytes",
+                     path, disk_subformat, capacity)
+        return (100, disk_subformat, str(capacity))
+
+    @staticmethod
+    def _probe_rock_ridge(header, offset):
+        """Check the root directory's "." record for Rock Ridge entries.
+
+        Args:
+          header (bytes): File header.
+          offset (int): Offset of the root directory within the file.
+
+        Returns:
+          str: "rockridge", "" if no SUSP entries are present, or None if
+          this can't be determined from the header.
+        """
+        if offset + 34 > len(header):
+            return None
+        (record_len,) = struct.unpack_from("<B", header, offset)
+        (name_len,) = struct.unpack_from("<B", header, offset + 32)
+        # System Use area follows the name and its padding byte, if any
+        start = offset + 33 + name_len + (1 - name_len % 2)
+        system_use = header[start:offset + record_len]
+        if not system_use.startswith(b"SP\x07\x01\xbe\xef"):
+            return ""
+        while len(system_use) >= 4:
+            if system_use[:2] in (b"RR", b"PX"):
+                return "rockridge"
+            (entry_len,) = struct.unpack_from("<B", system_use, 2)
+            if entry_len < 4:
+                break
+            system_use = system_use[entry_len:]
+        # SUSP is in use but no Rock Ridge entries seen here - ask isoinfo
+        return None
+
     @property
     def disk_subformat(self):
         """ISO sub-format.
@@ -36,6 +108,7 @@ class ISO(DiskRepresentation):
         - "" - not Rock Ridge
         - "rockridge" - has Rock Ridge extensions
         """
+        self._probe()
         if self._disk_subformat is None:
             output = helpers['isoinfo'].call(['-i', self.path, '-d'])
             if re.search(r"Rock Ridge.*found", output):
@@ -120,6 +193,8 @@ class ISO(DiskRepresentation):
         if not os.path.exists(path):
             raise HelperError(2, "No such file or directory: '{0}'"
                               .format(path))
+        if cls.probe_header(path, cls.read_header(path)) is not None:
+            return 100
         if helpers['isoinfo']:
             logger.debug("Using 'isoinfo' to check whether %s is an ISO", path)
             try:
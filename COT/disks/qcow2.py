@@ -12,10 +12,142 @@
 
 """Handling of QCOW2 files."""
 
+import logging
 import os
+import struct
+import zlib
 
-from COT.disks.disk import DiskRepresentation
-from COT.helpers import helpers, helper_select
+from COT.disks.disk import DiskReader, DiskRepresentation
+from COT.helpers import helper_select
+
+logger = logging.getLogger(__name__)
+
+
+class QCOW2Reader(DiskReader):
+    """Native reader of the contents of a standalone QCOW2 image.
+
+    Images with a backing file, encryption, an external data file,
+    extended L2 entries, or non-zlib compression are not supported.
+    """
+
+    OFFSET_MASK = 0x00fffffffffffe00
+    """Mask of the host offset in L1 and uncompressed L2 table entries."""
+
+    COMPRESSED = 1 << 62
+    """Flag bit of L2 table entries describing compressed clusters."""
+
+    ZERO = 1
+    """Flag bit of (version 3) L2 table entries describing zero clusters."""
+
+    DIRTY = 1
+    """The only incompatible feature bit that doesn't affect reading."""
+
+    def __init__(self, path):
+        """Open the given QCOW2 image for reading.
+
+        Args:
+          path (str): Path to the QCOW2 image file.
+
+        Raises:
+          NotImplementedError: if the image uses unsupported features.
+        """
+        super(QCOW2Reader, self).__init__(path, 0)
+        try:
+            header = self._file.read(104)
+            if not header.startswith(QCOW2.MAGIC) or len(header) < 72:
+                raise NotImplementedError("Not a QCOW2 image")
+            # uint32 magic, version; uint64 backing_file_offset;
+            # uint32 backing_file_size, cluster_bits; uint64 size;
+            # uint32 crypt_method, l1_size; uint64 l1_table_offset - big-endian
+            (version, backing_file_offset, _, cluster_bits, self.capacity,
+             crypt_method, l1_size, l1_table_offset) = struct.unpack_from(
+                 ">IQIIQIIQ", header, 4)
+            incompatible_features = 0
+            if version == 3 and len(header) >= 80:
+                (incompatible_features,) = struct.unpack_from(">Q", header,
+                                                              72)
+            if version not in (2, 3):
+                raise NotImplementedError("QCOW version {0} is not supported"
+                                          .format(version))
+            if backing_file_offset:
+                raise NotImplementedError("QCOW2 backing files are not "
+                                          "supported")
+            if crypt_method:
+                raise NotImplementedError("QCOW2 encryption is not supported")
+            if incompatible_features & ~self.DIRTY:
+                raise NotImplementedError(
+                    "QCOW2 incompatible features 0x{0:x} are not supported"
+                    .format(incompatible_features))
+        except Exception:
+            self.close()
+            raise
+        self.cluster_bits = cluster_bits
+        self.cluster_size = 1 << cluster_bits
+        self._file.seek(l1_table_offset)
+        self._l1_table = struct.unpack(">{0}Q".format(l1_size),
+                                       self._file.read(8 * l1_size))
+        self._l2_offset = None
+        self._l2_table = None
+
+    def _l2_entry(self, index):
+        """Look up the L2 table entry describing the given cluster.
+
+        Args:
+          index (int): Index of the cluster within the disk.
+
+        Returns:
+          int: L2 table entry, or 0 if the cluster is unallocated.
+        """
+        l2_entries = self.cluster_size // 8
+        l1_index = index // l2_entries
+        if l1_index >= len(self._l1_table):
+            return 0
+        l2_offset = self._l1_table[l1_index] & self.OFFSET_MASK
+        if not l2_offset:
+            return 0
+        if l2_offset != self._l2_offset:
+            self._file.seek(l2_offset)
+            self._l2_table = struct.unpack(
+                ">{0}Q".format(l2_entries), self._file.read(self.cluster_size))
+            self._l2_offset = l2_offset
+        return self._l2_table[index % l2_entries]
+
+    def _read_cluster(self, index):
+        """Read the given cluster of the disk.
+
+        Args:
+          index (int): Index of the cluster within the disk.
+
+        Returns:
+          bytes: Contents of the cluster, or None if it reads as all zeros.
+        """
+        entry = self._l2_entry(index)
+        if entry & self.COMPRESSED:
+            # Host offset and number of additional 512-byte sectors,
+            # with the split between them depending on the cluster size
+            offset_bits = 62 - (self.cluster_bits - 8)
+            offset = entry & ((1 << offset_bits) - 1)
+            sectors = ((entry >> offset_bits) &
+                       ((1 << (self.cluster_bits - 8)) - 1)) + 1
+            self._file.seek(offset)
+            data = self._file.read(sectors * 512 - (offset & 511))
+            # Raw deflate data, without any zlib header
+            data = zlib.decompressobj(-15).decompress(data, self.cluster_size)
+            return data + b"\0" * (self.cluster_size - len(data))
+        offset = entry & self.OFFSET_MASK
+        if not offset or entry & self.ZERO:
+            return None
+        self._file.seek(offset)
+        data = self._file.read(self.cluster_size)
+        return data + b"\0" * (self.cluster_size - len(data))
+
+    def read(self, offset, length):
+        """Read a range of the disk's contents.
+
+        For the parameters, see :meth:`DiskReader.read`.
+        """
+        return self._read_clusters(offset, length, self.cluster_size,
+                                   self._read_cluster)
 
 
 class QCOW2(DiskRepresentation):
@@ -23,6 +155,44 @@ class QCOW2(DiskRepresentation):
 
     disk_format = "qcow2"
 
+    MAGIC = b"QFI\xfb"
+    """Magic number shared by all QCOW versions."""
+
+    QEMU_IMG_SPARSE_SIZE = "64k"
+    """Default QCOW2 cluster size."""
+
+    @classmethod
+    def probe_header(cls, path, header):
+        """Check whether the given file header is a QCOW2 header.
+
+        QCOW version 1 files share the same magic number but are not
+        supported, so they are left for the helpers to identify.
+
+        For the parameters, see :meth:`DiskRepresentation.probe_header`.
+        """
+        if not header.startswith(cls.MAGIC) or len(header) < 32:
+            return None
+        # uint32 magic, version; uint64 backing_file_offset;
+        # uint32 backing_file_size, cluster_bits; uint64 size - big-endian
+        (version, _, _, _, capacity) = struct.unpack_from(">IQIIQ", header, 4)
+        if version not in (2, 3):
+            logger.debug("%s is QCOW version %d, not QCOW2", path, version)
+            return None
+        logger.debug("QCOW2 header of %s: version %d, capacity %d bytes",
+                     path, version, capacity)
+        return (100, None, str(capacity))
+
+    def open_reader(self):
+        """Open this QCOW2 image to read its contents natively.
+
+        Returns:
+          QCOW2Reader: Reader of the guest-visible contents of this disk.
+
+        Raises:
+          NotImplementedError: if the image uses unsupported features.
+        """
+        return QCOW2Reader(self.path)
+
     @classmethod
     def from_other_image(cls, input_image, output_dir, output_subformat=None):
         """Convert the other disk image into an image of this type.
@@ -55,8 +225,4 @@ class QCOW2(DiskRepresentation):
                 finally:
                     os.remove(temp_image.path)
 
-        helpers['qemu-img'].call(['convert',
-                                  '-O', 'qcow2',
-                                  input_image.path,
-                                  output_path])
-        return cls(output_path)
+        return cls._qemu_img_convert(input_image, output_path)
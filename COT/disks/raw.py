@@ -16,7 +16,7 @@ import logging
 import os
 import re
 
-from COT.disks.disk import DiskRepresentation
+from COT.disks.disk import DiskReader, DiskRepresentation
 from COT.helpers import helpers, helper_select
 
 logger = logging.getLogger(__name__)
@@ -27,6 +27,24 @@ class RAW(DiskRepresentation):
 
     disk_format = "raw"
 
+    OTHER_FORMAT_SIGNATURES = (
+        (0, b"KDMV"),                      # VMDK sparse extent
+        (0, b"COWD"),                      # VMDK ESX sparse extent
+        (0, b"# Disk DescriptorFile"),     # VMDK descriptor
+        (0, b"QFI\xfb"),                   # QCOW, QCOW2
+        (0, b"QED\x00"),                   # QED
+        (0, b"conectix"),                  # VHD (dynamic)
+        (0, b"vhdxfile"),                  # VHDX
+        (0x40, b"\x7f\x10\xda\xbe"),       # VDI
+        (0, b"WithoutFreeSpace"),          # Parallels
+        (0, b"WithouFreSpacExt"),          # Parallels
+        (0, b"Bochs Virtual HD Image"),    # Bochs
+        (0, b"#!/bin/sh\n#V2.0 Format"),   # cloop
+        (0, b"LUKS\xba\xbe"),              # LUKS
+        (0x8001, b"CD001"),                # ISO 9660
+    )
+    """(offset, magic) signatures of image formats that are not raw."""
+
     @property
     def files(self):
         """List of files on the FAT32 file system of this disk."""
@@ -55,6 +73,30 @@ class RAW(DiskRepresentation):
             self._files = result
         return self._files
 
+    def open_reader(self):
+        """Open this RAW image to read its contents natively.
+
+        Returns:
+          DiskReader: Reader of the contents of this file.
+        """
+        return DiskReader(self.path)
+
+    @classmethod
+    def probe_header(cls, path, header):
+        """Check whether the given file header could be a RAW image.
+
+        There's no file magic number for RAW images, so any file that doesn't
+        have the signature of some other image format is assumed to be one.
+        Files that do have such a signature are left for the helpers to
+        identify, as the format may well not be one that COT supports.
+
+        For the parameters, see :meth:`DiskRepresentation.probe_header`.
+        """
+        for offset, magic in cls.OTHER_FORMAT_SIGNATURES:
+            if header[offset:offset + len(magic)] == magic:
+                return None
+        return (cls._confidence(path), None, str(os.path.getsize(path)))
+
     @classmethod
     def file_is_this_type(cls, path):
         """Whether this file is a RAW image.
@@ -63,24 +105,36 @@ class RAW(DiskRepresentation):
 
         For the parameters, see :meth:`DiskRepresentation.file_is_this_type`.
         """
-        # Any file *could* be a RAW image, so let that be our fallback option,
-        # i.e., less than 100% confidence:
         confidence = super(RAW, cls).file_is_this_type(path)
         if confidence == 100:
-            # If it explicitly has a .raw or .img extension, we're more
-            # confident than if it doesn't.
-            extension = os.path.splitext(path)[1]
-            if extension in ['.raw', '.img']:
-                logger.debug("Based on '%s' extension, this file probably"
-                             " is a raw image.", extension)
-                confidence = 60
-            else:
-                logger.debug("Any file could possibly be a raw file, but the"
-                             " '%s' extension doesn't give us confidence.",
-                             extension)
-                confidence = 10
+            # qemu-img says it's raw, but qemu-img says that about anything
+            confidence = cls._confidence(path)
         return confidence
 
+    @staticmethod
+    def _confidence(path):
+        """Confidence that a file that could be a RAW image actually is one.
+
+        Args:
+          path (str): Path to the file.
+
+        Returns:
+          int: Confidence level.
+        """
+        # Any file *could* be a RAW image, so let that be our fallback option,
+        # i.e., less than 100% confidence.
+        # If it explicitly has a .raw or .img extension, we're more
+        # confident than if it doesn't.
+        extension = os.path.splitext(path)[1]
+        if extension in ['.raw', '.img']:
+            logger.debug("Based on '%s' extension, this file probably"
+                         " is a raw image.", extension)
+            return 60
+        logger.debug("Any file could possibly be a raw file, but the"
+                     " '%s' extension doesn't give us confidence.",
+                     extension)
+        return 10
+
     @classmethod
     def _create_file(cls, path, files=None, capacity=None, **kwargs):
         """Create a raw disk image file.
@@ -144,8 +198,4 @@ class RAW(DiskRepresentation):
                 helper.call(['-s', output_path, input_image.path])
                 return cls(output_path)
 
-        helpers['qemu-img'].call(['convert',
-                                  '-O', 'raw',
-                                  input_image.path,
-                                  output_path])
-        return cls(output_path)
+        return cls._qemu_img_convert(input_image, output_path)
@@ -21,7 +21,7 @@ import os
 import mock
 
 from COT.tests import COTTestCase
-from COT.disks import DiskRepresentation
+from COT.disks import DiskRepresentation, QCOW2, RAW, VMDK
 from COT.helpers import helpers, HelperError
 
 logger = logging.getLogger(__name__)
@@ -84,17 +84,43 @@ class TestDiskRepresentation(COTTestCase):
                           "/foo/bar/baz")
         self.assertRaises(TypeError, DiskRepresentation.from_file,
                           None)
+        # Headers that aren't recognized natively are checked by qemu-img
+        temp_path = os.path.join(self.temp_dir, "foo.vdi")
+        with open(temp_path, 'wb') as fileobj:
+            fileobj.write(b"\0" * 0x40 + b"\x7f\x10\xda\xbe")
         with mock.patch('COT.helpers.helper.check_output') as mock_co:
             mock_co.return_value = "qemu-img info: unsupported command"
             self.assertRaises(RuntimeError,
                               DiskRepresentation.from_file,
-                              self.input_vmdk)
+                              temp_path)
         # We support QCOW2 but not QCOW at present
         temp_path = os.path.join(self.temp_dir, "foo.qcow")
         helpers['qemu-img'].call(['create', '-f', 'qcow', temp_path, '8M'])
         self.assertRaises(NotImplementedError,
                           DiskRepresentation.from_file, temp_path)
 
+    @mock.patch('COT.helpers.helper.check_output')
+    def test_disk_representation_from_file_native(self, mock_check_output):
+        """DiskRepresentation.from_file() doesn't need helpers to identify."""
+        diskrep = DiskRepresentation.from_file(self.input_vmdk)
+        self.assertEqual(diskrep.disk_format, "vmdk")
+        self.assertEqual(diskrep.disk_subformat, "streamOptimized")
+        self.assertEqual(diskrep.capacity, "1073741824")
+
+        diskrep = DiskRepresentation.from_file(self.input_iso)
+        self.assertEqual(diskrep.disk_format, "iso")
+        self.assertEqual(diskrep.disk_subformat, "")
+        self.assertEqual(diskrep.capacity, str(self.FILE_SIZE['input.iso']))
+
+        temp_disk = os.path.join(self.temp_dir, 'foo.img')
+        with open(temp_disk, 'wb') as fileobj:
+            fileobj.write(b"\0" * 65536)
+        diskrep = DiskRepresentation.from_file(temp_disk)
+        self.assertEqual(diskrep.disk_format, "raw")
+        self.assertEqual(diskrep.capacity, "65536")
+
+        mock_check_output.assert_not_called()
+
     @mock.patch('COT.helpers.helper.check_output')
     def test_capacity_qemu_error(self, mock_check_output):
         """Test error handline if qemu-img reports an error."""
@@ -156,3 +182,53 @@ class TestDiskRepresentation(COTTestCase):
             NotImplementedError,
             DiskRepresentation.from_file(self.blank_vmdk).convert_to,
             "frobozz", self.temp_dir)
+
+    def test_convert_to_report(self):
+        """Conversion reports the sizes involved and the time taken."""
+        temp_disk = os.path.join(self.temp_dir, 'foo.img')
+        with open(temp_disk, 'wb') as fileobj:
+            fileobj.truncate(16 << 20)
+        output_dir = os.path.join(self.temp_dir, "output")
+        os.makedirs(output_dir)
+        vmdk = RAW(temp_disk).convert_to("vmdk", output_dir,
+                                         "streamOptimized")
+        self.assertEqual(vmdk.path, os.path.join(output_dir, "foo.vmdk"))
+        self.assertLogged(levelname='INFO',
+                          msg="Converted %s .* in %.1f seconds",
+                          args=(temp_disk, "16 MiB", vmdk.path))
+
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.capabilities',
+                new_callable=mock.PropertyMock)
+    def test_qemu_img_convert_options(self, mock_capabilities):
+        """Tuning of qemu-img convert depends on its version and target."""
+        raw = RAW(self.input_iso)
+        mock_capabilities.return_value = {}
+        self.assertEqual(RAW.qemu_img_convert_options(raw), [])
+        self.assertEqual(QCOW2.qemu_img_convert_options(raw), [])
+
+        mock_capabilities.return_value = {
+            'convert_sparse_size': True,
+            'convert_source_cache': False,
+            'convert_coroutines': False,
+        }
+        self.assertEqual(RAW.qemu_img_convert_options(raw), [])
+        self.assertEqual(QCOW2.qemu_img_convert_options(raw), ['-S', '64k'])
+
+        mock_capabilities.return_value = {
+            'convert_sparse_size': True,
+            'convert_source_cache': True,
+            'convert_coroutines': True,
+        }
+        coroutines = str(DiskRepresentation.QEMU_IMG_COROUTINES)
+        self.assertEqual(RAW.qemu_img_convert_options(raw),
+                         ['-m', coroutines, '-W'])
+        self.assertEqual(VMDK.qemu_img_convert_options(raw),
+                         ['-m', coroutines, '-S', '64k'])
+
+        # Only large images are read with the host page cache bypassed
+        with mock.patch.object(DiskRepresentation, 'QEMU_IMG_DIRECT_IO_SIZE',
+                               0), \
+                mock.patch.object(DiskRepresentation, '_supports_direct_io',
+                                  return_value=True):
+            self.assertEqual(QCOW2.qemu_img_convert_options(raw),
+                             ['-m', coroutines, '-T', 'none', '-S', '64k'])
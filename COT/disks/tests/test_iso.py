@@ -18,6 +18,7 @@
 
 import logging
 import os
+import struct
 import mock
 
 from COT.tests import COTTestCase
@@ -170,6 +171,29 @@ Setting input-charset to 'UTF-8' from locale.
             ['-output', self.foo_iso, '-full-iso9660-filenames',
              '-iso-level', '2', '-allow-lowercase', self.input_ovf])
 
+    def test_probe_header(self):
+        """Native detection of ISO 9660 headers."""
+        header = ISO.read_header(self.input_iso)
+        self.assertEqual(ISO.probe_header(self.input_iso, header),
+                         (100, "", str(self.FILE_SIZE['input.iso'])))
+        self.assertIsNone(ISO.probe_header(self.blank_vmdk,
+                                           ISO.read_header(self.blank_vmdk)))
+        # Too short to include the primary volume descriptor
+        self.assertIsNone(ISO.probe_header(self.input_iso, header[:0x8000]))
+
+    def test_probe_rock_ridge(self):
+        """Native detection of Rock Ridge extensions."""
+        record = (b"\0" * 32 + b"\x01\x00" + b"SP\x07\x01\xbe\xef\x00" +
+                  b"PX\x24\x01" + b"\0" * 32)
+        record = struct.pack("<B", len(record) + 1) + record[1:] + b"\0"
+        self.assertEqual(ISO._probe_rock_ridge(record, 0), "rockridge")
+        # SUSP without any Rock Ridge entries
+        self.assertIsNone(ISO._probe_rock_ridge(record[:41], 0))
+        # No SUSP at all
+        self.assertEqual(ISO._probe_rock_ridge(record[:34], 0), "")
+        # Root directory not included in header
+        self.assertIsNone(ISO._probe_rock_ridge(record, 2048))
+
     def test_file_is_this_type_nonexistent(self):
         """Call file_is_this_type should fail if file doesn't exist."""
         self.assertRaises(HelperError,
@@ -18,6 +18,8 @@
 
 import logging
 import os
+import struct
+import zlib
 
 from distutils.version import StrictVersion
 import mock
@@ -40,6 +42,60 @@ class TestQCOW2(COTTestCase):
         self.temp_disk = os.path.join(self.temp_dir, "blank.img")
         helpers['qemu-img'].call(['create', '-f', 'raw', self.temp_disk, "8M"])
 
+    def test_probe_header(self):
+        """Native detection of QCOW2 headers."""
+        header = (b"QFI\xfb" + struct.pack(">IQII", 3, 0, 0, 16) +
+                  struct.pack(">Q", 8 << 20))
+        self.assertEqual(QCOW2.probe_header(self.temp_disk, header),
+                         (100, None, "8388608"))
+        # QCOW version 1 is not supported
+        header = b"QFI\xfb" + struct.pack(">IQIBBHIQ", 1, 0, 0, 0, 0, 0, 0,
+                                          8 << 20)
+        self.assertIsNone(QCOW2.probe_header(self.temp_disk, header))
+        self.assertIsNone(QCOW2.probe_header(self.temp_disk, b"QFI"))
+        self.assertIsNone(QCOW2.probe_header(self.temp_disk, b"\0" * 512))
+
+    def test_open_reader(self):
+        """Native reading of the contents of a QCOW2 image."""
+        # Version 3 header with 64 KiB clusters and a 1 MiB capacity, then
+        # an L1 table, an L2 table, and a data cluster, one cluster each.
+        # Guest cluster 0 is stored as-is, cluster 2 is compressed,
+        # cluster 3 is explicitly zeroed, and the rest are unallocated.
+        cluster = 1 << 16
+        data = os.urandom(1000) * 65 + b"\0" * 536
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -12)
+        compressed = compressor.compress(data) + compressor.flush()
+        sectors = (len(compressed) + 511) // 512
+        header = (b"QFI\xfb" +
+                  struct.pack(">IQIIQIIQ", 3, 0, 0, 16, 1 << 20, 0, 1,
+                              cluster) +
+                  b"\0" * 24 + struct.pack(">QQQII", 0, 0, 0, 4, 104))
+        l1_table = struct.pack(">Q", (1 << 63) | 2 * cluster)
+        l2_table = struct.pack(">QQQQ", (1 << 63) | 3 * cluster, 0,
+                               (1 << 62) | ((sectors - 1) << 54) |
+                               4 * cluster, 5 * cluster | 1)
+        path = os.path.join(self.temp_dir, "foo.qcow2")
+        with open(path, 'wb') as fileobj:
+            for table in [header, l1_table, l2_table, data]:
+                fileobj.write(table + b"\0" * (cluster - len(table)))
+            fileobj.write(compressed)
+
+        with QCOW2(path).open_reader() as reader:
+            self.assertEqual(reader.capacity, 1 << 20)
+            self.assertEqual(reader.read(0, cluster), data)
+            self.assertEqual(reader.read(1000, 10), data[1000:1010])
+            self.assertIsNone(reader.read(cluster, cluster))
+            self.assertEqual(reader.read(2 * cluster, cluster), data)
+            self.assertEqual(reader.read(cluster, 2 * cluster),
+                             b"\0" * cluster + data)
+            self.assertIsNone(reader.read(3 * cluster, 5 * cluster))
+
+        # Images with a backing file aren't supported
+        with open(path, 'r+b') as fileobj:
+            fileobj.seek(8)
+            fileobj.write(struct.pack(">Q", 1024))
+        self.assertRaises(NotImplementedError, QCOW2(path).open_reader)
+
     def test_init_with_files_unsupported(self):
         """Creation of a QCOW2 with specific file contents is not supported."""
         self.assertRaises(NotImplementedError,
@@ -79,7 +135,7 @@ class TestQCOW2(COTTestCase):
         QCOW2.from_other_image(VMDK(self.blank_vmdk), self.temp_dir)
 
         mock_qemuimg.assert_called_with([
-            'convert', '-O', 'qcow2', self.temp_disk,
+            'convert', '-O', 'qcow2', '-S', '64k', self.temp_disk,
             os.path.join(self.temp_dir, 'blank.qcow2')
         ])
 
@@ -95,5 +151,5 @@ class TestQCOW2(COTTestCase):
 
         mock_vmdktool.assert_not_called()
         mock_qemuimg.assert_called_with([
-            'convert', '-O', 'qcow2', self.blank_vmdk,
+            'convert', '-O', 'qcow2', '-S', '64k', self.blank_vmdk,
             os.path.join(self.temp_dir, "blank.qcow2")])
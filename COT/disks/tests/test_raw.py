@@ -40,6 +40,51 @@ class TestRAW(COTTestCase):
         with self.assertRaises(HelperError):
             assert fake_raw.files
 
+    def test_probe_header(self):
+        """Native detection of RAW images."""
+        temp_disk = os.path.join(self.temp_dir, "foo.img")
+        with open(temp_disk, 'wb') as fileobj:
+            fileobj.write(b"\0" * 4096)
+        self.assertEqual(RAW.probe_header(temp_disk, b"\0" * 4096),
+                         (60, None, "4096"))
+        self.assertEqual(RAW.probe_header(self.input_ovf, b"<?xml"),
+                         (10, None, str(os.path.getsize(self.input_ovf))))
+        # Files with a recognizable signature are not assumed to be RAW
+        for path in [self.blank_vmdk, self.input_iso]:
+            self.assertIsNone(RAW.probe_header(path, RAW.read_header(path)))
+        self.assertIsNone(RAW.probe_header(temp_disk, b"QFI\xfb\0\0\0\x01"))
+
+    def test_open_reader(self):
+        """Native reading of the contents of a RAW image."""
+        temp_disk = os.path.join(self.temp_dir, "foo.img")
+        with open(temp_disk, 'wb') as fileobj:
+            fileobj.write(b"hello")
+            fileobj.truncate(4 << 20)
+        with RAW(temp_disk).open_reader() as reader:
+            self.assertEqual(reader.capacity, 4 << 20)
+            self.assertEqual(reader.read(0, 8), b"hello\0\0\0")
+            # Unallocated regions may or may not be detected as such,
+            # depending on the file system
+            self.assertIn(reader.read(1 << 20, 4096), [None, b"\0" * 4096])
+            self.assertIn(reader.read((4 << 20) - 2, 4),
+                          [None, b"\0" * 4])
+
+    def test_open_reader_backwards(self):
+        """Data preceding a known hole is still read correctly."""
+        temp_disk = os.path.join(self.temp_dir, "foo.img")
+        with open(temp_disk, 'wb') as fileobj:
+            fileobj.write(b"A" * 65536)
+            fileobj.seek(2 << 20)
+            fileobj.write(b"B" * 65536)
+        with RAW(temp_disk).open_reader() as reader:
+            self.assertIn(reader.read(128 << 10, 65536),
+                          [None, b"\0" * 65536])
+            self.assertEqual(reader.read(0, 65536), b"A" * 65536)
+            self.assertEqual(reader.read(2 << 20, 4), b"BBBB")
+            self.assertIn(reader.read(1 << 20, 65536),
+                          [None, b"\0" * 65536])
+            self.assertEqual(reader.read(65532, 8), b"AAAA\0\0\0\0")
+
     def test_convert_from_vmdk(self):
         """Test conversion of a RAW image from a VMDK."""
         old = DiskRepresentation.from_file(self.blank_vmdk)
@@ -18,12 +18,16 @@
 
 import logging
 import os
+import struct
+import unittest
 
+from distutils.spawn import find_executable
 from distutils.version import StrictVersion
 import mock
 
 from COT.tests import COTTestCase
-from COT.disks import VMDK, DiskRepresentation
+from COT.disks import VMDK, RAW, DiskRepresentation
+from COT.disks.vmdk import SparseVMDKReader, StreamOptimizedWriter
 from COT.helpers import helpers, HelperError
 
 logger = logging.getLogger(__name__)
@@ -49,6 +53,23 @@ class TestVMDK(COTTestCase):
         self.assertEqual(vmdk2.capacity, "1073741824")
         self.assertEqual(vmdk2.predicted_drive_type, 'harddisk')
 
+    def test_probe_header_descriptor(self):
+        """Native detection of a standalone VMDK descriptor file."""
+        header = b"""# Disk DescriptorFile
+version=1
+CID=fffffffe
+parentCID=ffffffff
+createType="twoGbMaxExtentFlat"
+
+# Extent description
+RW 4192256 FLAT "foo-f001.vmdk" 0
+RW 2048 FLAT "foo-f002.vmdk" 0
+"""
+        self.assertEqual(VMDK.probe_header("foo.vmdk", header),
+                         (100, "twoGbMaxExtentFlat", "2147483648"))
+        self.assertIsNone(VMDK.probe_header("foo.vmdk", b"KDMV"))
+        self.assertIsNone(VMDK.probe_header("foo.vmdk", b"\0" * 512))
+
     def test_create_default(self):
         """Default creation logic."""
         disk_path = os.path.join(self.temp_dir, "foo.vmdk")
@@ -58,8 +79,7 @@ class TestVMDK(COTTestCase):
         self.assertEqual(vmdk.disk_format, "vmdk")
         self.assertEqual(vmdk.disk_subformat, "streamOptimized")
         self.assertEqual(vmdk.disk_subformat, "streamOptimized")
-        if helpers['qemu-img'].version < StrictVersion("2.5.1"):
-            self.assertLogged(**QEMU_VERSION_WARNING)
+        self.assertEqual(vmdk.capacity, str(16 << 20))
 
     def test_create_stream_optimized(self):
         """Explicit subformat specification."""
@@ -71,8 +91,7 @@ class TestVMDK(COTTestCase):
         self.assertEqual(vmdk.disk_format, "vmdk")
         self.assertEqual(vmdk.disk_subformat, "streamOptimized")
         self.assertEqual(vmdk.disk_subformat, "streamOptimized")
-        if helpers['qemu-img'].version < StrictVersion("2.5.1"):
-            self.assertLogged(**QEMU_VERSION_WARNING)
+        self.assertEqual(vmdk.capacity, str(16 << 20))
 
     def test_create_monolithic_sparse(self):
         """Explicit subformat specification."""
@@ -85,6 +104,20 @@ class TestVMDK(COTTestCase):
         self.assertEqual(vmdk.disk_subformat, "monolithicSparse")
         self.assertEqual(vmdk.disk_subformat, "monolithicSparse")
 
+    @mock.patch('COT.disks.vmdk.StreamOptimizedWriter.ENABLED', new=False)
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.version',
+                new_callable=mock.PropertyMock,
+                return_value=StrictVersion("2.1.0"))
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.call')
+    def test_create_stream_optimized_qemu(self, mock_qemu_call, _):
+        """Fallback to qemu-img for streamOptimized creation."""
+        disk_path = os.path.join(self.temp_dir, "foo.vmdk")
+        VMDK.create_file(path=disk_path, capacity="16M")
+        mock_qemu_call.assert_called_once_with(
+            ['create', '-f', 'vmdk', '-o', 'subformat=streamOptimized',
+             disk_path, "16M"])
+        self.assertLogged(**QEMU_VERSION_WARNING)
+
     def test_create_files_unsupported(self):
         """No support for creating a VMDK with a filesystem."""
         self.assertRaises(NotImplementedError,
@@ -111,6 +144,15 @@ class TestVMDKConversion(COTTestCase):
                                       temp_disk, "16M"])
             self.input_disks[disk_format] = DiskRepresentation.from_file(
                 temp_disk)
+        # These test cases are about the selection of helper programs
+        self.writer_patcher = mock.patch.object(StreamOptimizedWriter,
+                                                'ENABLED', False)
+        self.writer_patcher.start()
+
+    def tearDown(self):
+        """Post-test cleanup."""
+        self.writer_patcher.stop()
+        super(TestVMDKConversion, self).tearDown()
 
     def other_format_to_vmdk_test(self, disk_format,
                                   output_subformat="streamOptimized"):
@@ -260,3 +302,95 @@ class TestVMDKConversion(COTTestCase):
         self.assertRaises(HelperError,
                           self.other_format_to_vmdk_test,
                           'qcow2', output_subformat="foobar")
+
+
+class TestStreamOptimizedWriter(COTTestCase):
+    """Test cases for native streamOptimized VMDK reading and writing."""
+
+    def setUp(self):
+        """Pre-test setup."""
+        super(TestStreamOptimizedWriter, self).setUp()
+        self.raw_path = os.path.join(self.temp_dir, "disks", "foo.img")
+        os.makedirs(os.path.dirname(self.raw_path))
+        # Two grain tables' worth of grains, mostly empty, and a capacity
+        # that isn't even a whole number of sectors
+        with open(self.raw_path, 'wb') as fileobj:
+            fileobj.write(os.urandom(100000))
+            fileobj.seek(40 << 20)
+            fileobj.write(b"hello world\n" * 1000)
+            fileobj.truncate((48 << 20) + 100)
+        with open(self.raw_path, 'rb') as fileobj:
+            self.raw_data = fileobj.read()
+
+    def read_all(self, path):
+        """Read the entire contents of the given sparse VMDK."""
+        with SparseVMDKReader(path) as reader:
+            data = reader.read(0, reader.capacity)
+            return data or b"\0" * reader.capacity
+
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.call')
+    @mock.patch('COT.helpers.vmdktool.VMDKTool.call')
+    def test_convert_raw(self, mock_vmdktool_call, mock_qemu_call):
+        """Conversion of a RAW image doesn't need any helpers."""
+        vmdk = VMDK.from_other_image(RAW(self.raw_path), self.temp_dir)
+        mock_qemu_call.assert_not_called()
+        mock_vmdktool_call.assert_not_called()
+
+        self.assertEqual(vmdk.path, os.path.join(self.temp_dir, "foo.vmdk"))
+        self.assertEqual(vmdk.disk_subformat, "streamOptimized")
+        self.assertEqual(vmdk.capacity, str((48 << 20) + 512))
+        # Only the grains containing data were written
+        self.assertLess(os.path.getsize(vmdk.path), 300 * 1024)
+        header = struct.unpack_from("<4sIIQQQQIQQQB4sH",
+                                    VMDK.read_header(vmdk.path))
+        self.assertEqual(header[:3], (b"KDMV", 3, 0x30001))
+
+        data = self.read_all(vmdk.path)
+        self.assertEqual(data[:len(self.raw_data)], self.raw_data)
+        self.assertEqual(data[len(self.raw_data):], b"\0" * 412)
+
+        # Conversion from a sparse VMDK is native as well
+        output_dir = os.path.join(self.temp_dir, "output")
+        os.makedirs(output_dir)
+        vmdk2 = VMDK.from_other_image(vmdk, output_dir)
+        mock_qemu_call.assert_not_called()
+        self.assertEqual(self.read_all(vmdk2.path), data)
+
+    @unittest.skipUnless(find_executable('qemu-img'), "needs qemu-img")
+    def test_convert_raw_qemu_check(self):
+        """qemu-img accepts natively written VMDKs and reads the same data."""
+        vmdk = VMDK.from_other_image(RAW(self.raw_path), self.temp_dir)
+        with open(vmdk.path, 'rb') as fileobj:
+            self.assertIn(b'ddb.adapterType = "ide"', fileobj.read(65536))
+
+        helpers['qemu-img'].call(['check', vmdk.path])
+        output_path = os.path.join(self.temp_dir, "output.img")
+        helpers['qemu-img'].call(['convert', '-O', 'raw',
+                                  vmdk.path, output_path])
+        with open(output_path, 'rb') as fileobj:
+            data = fileobj.read()
+        self.assertEqual(data, self.raw_data + b"\0" * 412)
+
+    def test_read_samples(self):
+        """Existing streamOptimized VMDKs can be read natively."""
+        for path in [self.blank_vmdk, self.input_vmdk]:
+            with VMDK(path).open_reader() as reader:
+                self.assertEqual(str(reader.capacity), VMDK(path).capacity)
+                self.assertIsNone(reader.read(0, reader.capacity))
+
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.installed',
+                new_callable=mock.PropertyMock, return_value=True)
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.version',
+                new_callable=mock.PropertyMock,
+                return_value=StrictVersion("2.5.1"))
+    @mock.patch('COT.helpers.qemu_img.QEMUImg.call')
+    def test_convert_unreadable(self, mock_qemu_call, *_):
+        """Images that can't be read natively are converted by helpers."""
+        with open(self.raw_path, 'wb') as fileobj:
+            fileobj.write(b"# Disk DescriptorFile\n")
+        with mock.patch('os.path.exists', return_value=True):
+            VMDK.from_other_image(VMDK(self.raw_path), self.temp_dir)
+        mock_qemu_call.assert_called_once_with([
+            'convert', '-O', 'vmdk', '-o', 'subformat=streamOptimized',
+            '-S', '64k', self.raw_path,
+            os.path.join(self.temp_dir, "foo.vmdk")])
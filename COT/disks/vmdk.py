@@ -10,28 +10,453 @@
 # of COT, including this file, may be copied, modified, propagated, or
 # distributed except according to the terms contained in the LICENSE.txt file.
 
-"""Handling of VMDK files."""
+"""Handling of VMDK files.
 
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  SparseVMDKReader
+  StreamOptimizedWriter
+  VMDK
+"""
+
+import collections
 import logging
 import os
+import random
 import re
+import struct
+import zlib
 
-from distutils.version import StrictVersion
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-from COT.disks.disk import DiskRepresentation
+from COT.disks.disk import DiskReader, DiskRepresentation
 from COT.helpers import helpers, helper_select
 
 logger = logging.getLogger(__name__)
 
+SECTOR_SIZE = 512
+"""Size of a sector, the unit of most offsets and sizes in a VMDK file."""
+
+HEADER_FORMAT = "<4sIIQQQQIQQQB4sH"
+"""Layout of the header (and footer) of a hosted sparse extent.
+
+Fields are magic, version, flags, capacity, grainSize, descriptorOffset,
+descriptorSize, numGTEsPerGT, rgdOffset, gdOffset, overHead,
+uncleanShutdown, the newline-detection characters, and compressAlgorithm.
+"""
+
+GD_AT_END = 0xffffffffffffffff
+"""Header gdOffset value meaning that the footer gives the real gdOffset."""
+
+FLAG_NEWLINE_TEST = 1 << 0
+FLAG_COMPRESSED = 1 << 16
+FLAG_MARKERS = 1 << 17
+
+
+class SparseVMDKReader(DiskReader):
+    """Native reader of the contents of a hosted sparse VMDK extent.
+
+    Supports both monolithicSparse and streamOptimized images;
+    delta (child) disks are not supported.
+    """
+
+    def __init__(self, path):
+        """Open the given VMDK for reading.
+
+        Args:
+          path (str): Path to the VMDK file.
+
+        Raises:
+          NotImplementedError: if the VMDK is not a supported type.
+        """
+        super(SparseVMDKReader, self).__init__(path, 0)
+        try:
+            header = self._read_header()
+            self._file.seek(header[5] * SECTOR_SIZE)
+            descriptor = self._file.read(header[6] * SECTOR_SIZE)
+            match = re.search(br'parentCID=(\w+)', descriptor)
+            if match and match.group(1) != b"ffffffff":
+                raise NotImplementedError("VMDK delta disks are not "
+                                          "supported")
+            if header[9] == GD_AT_END:
+                # streamOptimized - the footer precedes the end-of-stream
+                # marker and follows a footer marker, each one sector long
+                self._file.seek(-2 * SECTOR_SIZE, os.SEEK_END)
+                header = self._read_header()
+        except Exception:
+            self.close()
+            raise
+        (_, _, flags, capacity, grain_size, _, _,
+         self._gtes_per_gt, _, gd_offset) = header[:10]
+        self.capacity = capacity * SECTOR_SIZE
+        self._compressed = bool(flags & FLAG_COMPRESSED)
+        self.grain_bytes = grain_size * SECTOR_SIZE
+        gt_count = -(-capacity // (grain_size * self._gtes_per_gt))
+        self._file.seek(gd_offset * SECTOR_SIZE)
+        self._gd = struct.unpack("<{0}I".format(gt_count),
+                                 self._file.read(4 * gt_count))
+        self._gt_sector = None
+        self._gt = None
+
+    def _read_header(self):
+        """Read and validate a sparse extent header at the current position.
+
+        Returns:
+          tuple: Header fields as described by :data:`HEADER_FORMAT`.
+
+        Raises:
+          NotImplementedError: if this isn't a usable header.
+        """
+        data = self._file.read(SECTOR_SIZE)
+        if len(data) < struct.calcsize(HEADER_FORMAT):
+            raise NotImplementedError("Not a sparse VMDK extent")
+        header = struct.unpack_from(HEADER_FORMAT, data)
+        if header[0] != VMDK.SPARSE_MAGIC:
+            raise NotImplementedError("Not a sparse VMDK extent")
+        if header[1] not in (1, 2, 3):
+            raise NotImplementedError("Sparse VMDK version {0} is not "
+                                      "supported".format(header[1]))
+        if header[2] & FLAG_COMPRESSED and header[13] != 1:
+            raise NotImplementedError("VMDK compression algorithm {0} is "
+                                      "not supported".format(header[13]))
+        return header
+
+    def _read_grain(self, index):
+        """Read the given grain of the disk.
+
+        Args:
+          index (int): Index of the grain within the disk.
+
+        Returns:
+          bytes: Contents of the grain, or None if it reads as all zeros.
+        """
+        (gt_index, gte_index) = divmod(index, self._gtes_per_gt)
+        if gt_index >= len(self._gd) or not self._gd[gt_index]:
+            return None
+        if self._gd[gt_index] != self._gt_sector:
+            self._file.seek(self._gd[gt_index] * SECTOR_SIZE)
+            self._gt = struct.unpack("<{0}I".format(self._gtes_per_gt),
+                                     self._file.read(4 * self._gtes_per_gt))
+            self._gt_sector = self._gd[gt_index]
+        sector = self._gt[gte_index]
+        if sector in (0, 1):
+            # Unallocated, or explicitly zeroed
+            return None
+        self._file.seek(sector * SECTOR_SIZE)
+        if self._compressed:
+            # Grain marker - uint64 LBA, uint32 size - then deflated data
+            (_, size) = struct.unpack("<QI", self._file.read(12))
+            data = zlib.decompress(self._file.read(size))
+        else:
+            data = self._file.read(self.grain_bytes)
+        return data + b"\0" * (self.grain_bytes - len(data))
+
+    def read(self, offset, length):
+        """Read a range of the disk's contents.
+
+        For the parameters, see :meth:`DiskReader.read`.
+        """
+        return self._read_clusters(offset, length, self.grain_bytes,
+                                   self._read_grain)
+
+
+def _deflate(data, level):
+    """Compress a grain, unless it is entirely zeros.
+
+    Args:
+      data (bytes): Grain contents.
+      level (int): zlib compression level.
+
+    Returns:
+      bytes: Compressed data, or None if the grain is all zeros.
+    """
+    if data.count(b"\0") == len(data):
+        return None
+    return zlib.compress(data, level)
+
+
+class StreamOptimizedWriter(object):
+    """Native encoder of "version 3" streamOptimized VMDK images.
+
+    Grains are read sequentially from a :class:`~COT.disks.disk.DiskReader`
+    and all-zero grains are omitted. The remainder are deflated concurrently
+    in a pool of threads (:mod:`zlib` releases the GIL while compressing)
+    while the output is written in order, so no helper program or
+    intermediate image file is needed.
+    """
+
+    ENABLED = (os.environ.get('COT_NO_NATIVE_VMDK') is None)
+    """Set to False to always use helper programs to create VMDKs."""
+
+    THREADS = max(2, cpu_count())
+    """Number of grains to compress concurrently."""
+
+    COMPRESSION_LEVEL = 6
+
+    GRAIN_SIZE = 128
+    """Sectors per grain (64 KiB), as used by VMware and QEMU."""
+
+    GTES_PER_GT = 512
+    """Grain table entries per grain table."""
+
+    MARKER_EOS = 0
+    MARKER_GT = 1
+    MARKER_GD = 2
+    MARKER_FOOTER = 3
+
+    def __init__(self, path, capacity):
+        """Prepare to write a streamOptimized VMDK.
+
+        Args:
+          path (str): Path to the VMDK file to create.
+          capacity (int): Capacity of the disk, in bytes.
+        """
+        self.path = path
+        self.sectors = -(-int(capacity) // SECTOR_SIZE)
+        self.grain_bytes = self.GRAIN_SIZE * SECTOR_SIZE
+        self.grain_count = -(-self.sectors // self.GRAIN_SIZE)
+        self.gt_count = -(-self.grain_count // self.GTES_PER_GT)
+        self.descriptor = self._descriptor()
+        descriptor_sectors = len(self.descriptor) // SECTOR_SIZE
+        # Grains start at the first grain boundary after the descriptor
+        self.overhead = self.GRAIN_SIZE * (
+            -(-(1 + descriptor_sectors) // self.GRAIN_SIZE))
+        self.grains_written = 0
+        self._file = None
+        self._gt = []
+        self._gd = []
+
+    def _descriptor(self):
+        """Construct the embedded text descriptor for this disk.
+
+        Returns:
+          bytes: Descriptor, padded to a whole number of sectors.
+        """
+        # Same adapter type and geometry as qemu-img uses by default
+        cylinders = self.sectors // (16 * 63)
+        descriptor = "\n".join([
+            '# Disk DescriptorFile',
+            'version=1',
+            'CID={0:08x}'.format(random.getrandbits(32)),
+            'parentCID=ffffffff',
+            'createType="streamOptimized"',
+            '',
+            '# Extent description',
+            'RDONLY {0} SPARSE "{1}"'.format(self.sectors,
+                                             os.path.basename(self.path)),
+            '',
+            '# The Disk Data Base',
+            '#DDB',
+            '',
+            'ddb.virtualHWVersion = "4"',
+            'ddb.geometry.cylinders = "{0}"'.format(cylinders),
+            'ddb.geometry.heads = "16"',
+            'ddb.geometry.sectors = "63"',
+            'ddb.adapterType = "ide"',
+            '',
+        ]).encode('utf-8')
+        return self._pad(descriptor)
+
+    @staticmethod
+    def _pad(data):
+        """Pad the given data with zeros to a whole number of sectors.
+
+        Args:
+          data (bytes): Data to pad.
+
+        Returns:
+          bytes: Padded data.
+        """
+        return data + b"\0" * (-len(data) % SECTOR_SIZE)
+
+    def _header(self, gd_offset):
+        """Construct the header (or footer) for this disk.
+
+        Args:
+          gd_offset (int): Sector offset of the grain directory.
+
+        Returns:
+          bytes: Header sector.
+        """
+        return self._pad(struct.pack(
+            HEADER_FORMAT, VMDK.SPARSE_MAGIC, 3,
+            FLAG_NEWLINE_TEST | FLAG_COMPRESSED | FLAG_MARKERS,
+            self.sectors, self.GRAIN_SIZE, 1,
+            len(self.descriptor) // SECTOR_SIZE, self.GTES_PER_GT, 0,
+            gd_offset, self.overhead, 0, b"\n \r\n", 1))
+
+    def _sector(self):
+        """Get the current position in the output file.
+
+        Returns:
+          int: Sector offset.
+        """
+        return self._file.tell() // SECTOR_SIZE
+
+    def _write_marker(self, marker_type, sectors):
+        """Write a metadata marker sector.
+
+        Args:
+          marker_type (int): Type of marker, such as :attr:`MARKER_GT`.
+          sectors (int): Size of the following metadata, in sectors.
+        """
+        self._file.write(self._pad(struct.pack("<QII", sectors, 0,
+                                               marker_type)))
+
+    def _write_metadata(self, marker_type, entries):
+        """Write a grain table or grain directory, preceded by its marker.
+
+        Args:
+          marker_type (int): :attr:`MARKER_GT` or :attr:`MARKER_GD`.
+          entries (list): Sector offsets making up the table.
+
+        Returns:
+          int: Sector offset of the table itself.
+        """
+        data = self._pad(struct.pack("<{0}I".format(len(entries)), *entries))
+        self._write_marker(marker_type, len(data) // SECTOR_SIZE)
+        offset = self._sector()
+        self._file.write(data)
+        return offset
+
+    def _write_grain(self, index, compressed):
+        """Write a grain, and its grain table if that is now complete.
+
+        Args:
+          index (int): Index of the grain within the disk.
+          compressed (bytes): Deflated grain, or None to omit the grain.
+        """
+        if compressed is None:
+            self._gt.append(0)
+        else:
+            self._gt.append(self._sector())
+            self._file.write(self._pad(
+                struct.pack("<QI", index * self.GRAIN_SIZE, len(compressed)) +
+                compressed))
+            self.grains_written += 1
+        if len(self._gt) == self.GTES_PER_GT or index == self.grain_count - 1:
+            # Every grain table is written, as VMware does, even if empty
+            self._gt += [0] * (self.GTES_PER_GT - len(self._gt))
+            self._gd.append(self._write_metadata(self.MARKER_GT, self._gt))
+            self._gt = []
+
+    def write(self, reader=None):
+        """Write the VMDK file.
+
+        Args:
+          reader (DiskReader): Source of the disk contents. If unset,
+            a blank disk is written.
+        """
+        logger.verbose("Writing streamOptimized VMDK %s natively", self.path)
+        pool = ThreadPool(self.THREADS)
+        pending = collections.deque()
+        try:
+            with open(self.path, 'wb') as fileobj:
+                self._file = fileobj
+                self._file.write(self._header(GD_AT_END))
+                self._file.write(self.descriptor)
+                self._file.write(b"\0" * (self.overhead * SECTOR_SIZE -
+                                          self._file.tell()))
+                for index in range(self.grain_count):
+                    data = None
+                    if reader is not None:
+                        data = reader.read(index * self.grain_bytes,
+                                           self.grain_bytes)
+                    if data is not None:
+                        data = pool.apply_async(_deflate, (
+                            data, self.COMPRESSION_LEVEL))
+                    pending.append((index, data))
+                    # Bound the number of grains held in memory
+                    while len(pending) > 4 * self.THREADS:
+                        self._write_pending(pending.popleft())
+                while pending:
+                    self._write_pending(pending.popleft())
+
+                gd_offset = self._write_metadata(self.MARKER_GD, self._gd)
+                self._write_marker(self.MARKER_FOOTER, 1)
+                self._file.write(self._header(gd_offset))
+                self._write_marker(self.MARKER_EOS, 0)
+                # Like VMware, also record the location in the header,
+                # for the benefit of readers that ignore the footer
+                self._file.seek(0)
+                self._file.write(self._header(gd_offset))
+        finally:
+            pool.terminate()
+            pool.join()
+            self._file = None
+        logger.verbose("Wrote %d of %d grains (others were empty) to %s",
+                       self.grains_written, self.grain_count, self.path)
+
+    def _write_pending(self, item):
+        """Write a grain once its compression is complete.
+
+        Args:
+          item (tuple): Grain index and :class:`multiprocessing.AsyncResult`,
+            or None for a grain that is known to be unallocated.
+        """
+        (index, result) = item
+        self._write_grain(index, None if result is None else result.get())
+
 
 class VMDK(DiskRepresentation):
     """VMDK disk image file representation."""
 
     disk_format = "vmdk"
 
+    SPARSE_MAGIC = b"KDMV"
+    """Magic number of a hosted sparse extent (including streamOptimized)."""
+
+    DESCRIPTOR_MAGIC = b"# Disk DescriptorFile"
+    """First line of a standalone text descriptor file."""
+
+    SECTOR_SIZE = 512
+
+    QEMU_IMG_SPARSE_SIZE = "64k"
+    """Size of a grain, as used by ``qemu-img``."""
+
+    @classmethod
+    def probe_header(cls, path, header):
+        """Check whether the given file header is a VMDK header.
+
+        Recognizes both hosted sparse extents (monolithicSparse,
+        streamOptimized, etc.), whose capacity is given in the binary header,
+        and standalone text descriptors (monolithicFlat, etc.), whose capacity
+        is the sum of the sizes of their extents.
+
+        For the parameters, see :meth:`DiskRepresentation.probe_header`.
+        """
+        if header.startswith(cls.SPARSE_MAGIC) and len(header) >= 44:
+            # uint32 magic, version, flags; uint64 capacity, grainSize,
+            # descriptorOffset, descriptorSize - all little-endian, in sectors
+            (_, _, capacity, _, desc_offset, desc_size) = struct.unpack_from(
+                "<IIQQQQ", header, 4)
+            capacity *= cls.SECTOR_SIZE
+            descriptor = header[desc_offset * cls.SECTOR_SIZE:
+                                (desc_offset + desc_size) * cls.SECTOR_SIZE]
+            # The descriptor is ASCII but may be padded with binary data
+            descriptor = descriptor.decode('ascii', 'ignore')
+        elif header.startswith(cls.DESCRIPTOR_MAGIC):
+            descriptor = header.decode('ascii', 'ignore')
+            # Extent lines look like: RW 2097152 FLAT "foo-flat.vmdk" 0
+            extents = re.findall(r"^\s*(?:RW|RDONLY|NOACCESS)\s+(\d+)\s",
+                                 descriptor, re.MULTILINE)
+            capacity = cls.SECTOR_SIZE * sum(int(size) for size in extents)
+        else:
+            return None
+        match = re.search('createType="(.*?)"', descriptor)
+        disk_subformat = match.group(1) if match else None
+        logger.debug("VMDK header of %s: subformat %s, capacity %d bytes",
+                     path, disk_subformat, capacity)
+        return (100, disk_subformat, str(capacity))
+
     @property
     def disk_subformat(self):
         """Disk subformat, such as 'streamOptimized'."""
+        self._probe()
         if self._disk_subformat is None:
             # Look at the VMDK file header to determine the sub-format
             with open(self.path, 'rb') as fileobj:
@@ -50,6 +475,18 @@ class VMDK(DiskRepresentation):
             self._disk_subformat = vmdk_format
         return self._disk_subformat
 
+    def open_reader(self):
+        """Open this VMDK to read its contents natively.
+
+        Returns:
+          SparseVMDKReader: Reader of the guest-visible contents of this disk.
+
+        Raises:
+          NotImplementedError: if this is not a hosted sparse VMDK, such as
+            monolithicSparse or streamOptimized, or is a delta disk.
+        """
+        return SparseVMDKReader(self.path)
+
     @classmethod
     def from_other_image(cls, input_image, output_dir,
                          output_subformat="streamOptimized"):
@@ -67,8 +504,12 @@ class VMDK(DiskRepresentation):
         .. note::
 
           Creation of streamOptimized subformat VMDKs (ESXi's preferred
-          subformat for OVAs, hence COT's default subformat) is more complex
-          than it seems due to the underlying helpers required.
+          subformat for OVAs, hence COT's default subformat) is normally
+          done natively by :class:`StreamOptimizedWriter`, reading the
+          :attr:`input_image` directly, if it is a RAW, QCOW2, or sparse VMDK
+          image that :meth:`~DiskRepresentation.open_reader` supports.
+          Otherwise, it is more complex than it seems due to the underlying
+          helpers required.
 
           - Prior to QEMU 2.1.0, ``qemu-img`` effectively can't write
             streamOptimized subformat at all (it tends to error out).
@@ -92,6 +533,20 @@ class VMDK(DiskRepresentation):
         file_name = os.path.basename(input_image.path)
         (file_prefix, _) = os.path.splitext(file_name)
         output_path = os.path.join(output_dir, file_prefix + ".vmdk")
+        if (output_subformat == "streamOptimized" and
+                StreamOptimizedWriter.ENABLED):
+            try:
+                reader = input_image.open_reader()
+            except NotImplementedError as exc:
+                logger.verbose("Unable to read %s natively (%s); "
+                               "falling back to helper programs",
+                               input_image.path, exc)
+            else:
+                with reader:
+                    StreamOptimizedWriter(output_path,
+                                          reader.capacity).write(reader)
+                return cls(output_path)
+
         if output_subformat == "streamOptimized":
             helper = helper_select([
                 ('qemu-img', '2.5.1'),  # best option, all needed functionality
@@ -120,7 +575,8 @@ class VMDK(DiskRepresentation):
                 return cls(output_path)
 
             # else, fall through to default (qemu-img), with one extra:
-            if helpers['qemu-img'].version < StrictVersion("2.5.1"):
+            if not helpers['qemu-img'].capabilities.get(
+                    'vmdk_stream_optimized_v3'):
                 logger.warning(
                     "QEMU version %s produces 'version 1' VMDK images, which"
                     " newer versions of VMware ESXi will reject with the"
@@ -131,13 +587,9 @@ class VMDK(DiskRepresentation):
                     "Not a supported disk format"
                     " (sparse VMDK version too old)")
 
-        helpers['qemu-img'].call([
-            'convert',
-            '-O', 'vmdk',
-            '-o', 'subformat={0}'.format(output_subformat),
-            input_image.path,
-            output_path])
-        return cls(output_path)
+        return cls._qemu_img_convert(
+            input_image, output_path,
+            ['subformat={0}'.format(output_subformat)])
 
     @classmethod
     def _create_file(cls, path, disk_subformat="streamOptimized", **kwargs):
@@ -145,11 +597,24 @@ class VMDK(DiskRepresentation):
 
         Args:
           path (str): Location to create VMDK file.
-          disk_subformat (str): Defaults to "streamOptimized".
+          disk_subformat (str): Defaults to "streamOptimized", which is
+            written natively by :class:`StreamOptimizedWriter` if possible.
           **kwargs: See :meth:`DiskRepresentation._create_file`
         """
         if (disk_subformat == "streamOptimized" and
-                helpers['qemu-img'].version < StrictVersion("2.5.1")):
+                StreamOptimizedWriter.ENABLED and not kwargs.get('files')):
+            match = re.match(r"^(\d+)([kKMGT]?)$",
+                             str(kwargs.get('capacity')))
+            if match:
+                # Same size suffixes (powers of 1024) as qemu-img
+                capacity = int(match.group(1)) * 1024 ** (
+                    " KMGT".index(match.group(2).upper() or " "))
+                StreamOptimizedWriter(path, capacity).write()
+                return
+
+        if (disk_subformat == "streamOptimized" and
+                not helpers['qemu-img'].capabilities.get(
+                    'vmdk_stream_optimized_v3')):
             # Slightly different warning from the one in from_other_image,
             # as vmdktool doesn't help us with this case.
             logger.warning(
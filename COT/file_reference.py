@@ -24,19 +24,76 @@
   FileReference
   FileOnDisk
   FileInTAR
+  TarIndex
+  TarWriter
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  copy_range
+  materialize
+  shares_storage
 """
 
+import copy
+import errno
+import hashlib
+import io
 import logging
 import os
 import shutil
+import stat
+import sys
 import tarfile
+import tempfile
 
+from collections import namedtuple, OrderedDict
 from contextlib import contextmanager, closing
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+try:
+    import grp
+    import pwd
+except ImportError:
+    grp = pwd = None
 
-from COT.data_validation import file_checksum
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from COT.checksum_cache import ChecksumCache
+from COT.data_validation import file_checksums, ValueUnsupportedError
 
 logger = logging.getLogger(__name__)
 
+COPY_BUFSIZE = 1024 * 1024
+"""Buffer size used when reading or copying file contents."""
+
+CHECKSUM_THREADS = max(4, cpu_count())
+"""Maximum number of files to checksum concurrently."""
+
+VERIFY_POLICIES = ('eager', 'lazy', 'off')
+"""Supported checksum verification policies for :class:`FileReference`."""
+
+
+def _file_identity(path):
+    """Get a tuple uniquely identifying the current state of a file.
+
+    Args:
+      path (str): File path
+    Returns:
+      tuple: (device, inode, size, mtime)
+    Raises:
+      OSError: if the file does not exist
+    """
+    statres = os.stat(path)
+    return (statres.st_dev, statres.st_ino, statres.st_size,
+            getattr(statres, 'st_mtime_ns', statres.st_mtime))
+
 
 class FileReference(object):
     """Semi-abstract base class for file references."""
@@ -65,7 +122,7 @@ class FileReference(object):
                           .format(container_path))
         if os.path.isdir(container_path):
             return FileOnDisk(container_path, filename, **kwargs)
-        elif tarfile.is_tarfile(container_path):
+        elif TarIndex.is_tarfile(container_path):
             return FileInTAR(container_path, filename, **kwargs)
         else:
             raise NotImplementedError("Don't know how to open container {0}!"
@@ -76,7 +133,8 @@ class FileReference(object):
                  filename,
                  checksum_algorithm=None,
                  expected_checksum=None,
-                 expected_size=None):
+                 expected_size=None,
+                 verify='eager'):
         """Common initialization and validation logic.
 
         Args:
@@ -85,10 +143,21 @@ class FileReference(object):
           checksum_algorithm (str): 'sha1', 'sha256', etc.
           expected_checksum (str): Expected checksum of the file, if any.
           expected_size (int): Expected size of the file, in bytes, if any.
+          verify (str): When to compare the file against
+            ``expected_checksum``, one of :data:`VERIFY_POLICIES`:
+
+            * ``'eager'``: immediately.
+            * ``'lazy'``: when the file contents are first read, copied,
+              or checksummed.
+            * ``'off'``: never automatically; it is up to the caller to do
+              so if desired, using :meth:`check_checksum`.
 
         Raises:
           IOError: if the file does not actually exist or is not readable.
+          ValueUnsupportedError: if ``verify`` is not a supported policy.
         """
+        if verify not in VERIFY_POLICIES:
+            raise ValueUnsupportedError("verify", verify, VERIFY_POLICIES)
         if not os.path.isabs(container_path):
             logger.warning("Only absolute paths are accepted, but "
                            'got apparent relative path "%s".'
@@ -98,9 +167,12 @@ class FileReference(object):
         self.container_path = container_path
         self.filename = os.path.normpath(filename)
         self.checksum_algorithm = checksum_algorithm
-        self._checksum = None
+        self.expected_checksum = expected_checksum
+        self._checksums = {}
         self._size = None
-        self.force_refresh = False
+        self._verify_pending = (verify == 'lazy' and
+                                expected_checksum is not None)
+        self._checksum_identity = None
 
         logger.spam("Initing for file %s, expected_size %s,"
                     " expected_checksum %s",
@@ -109,16 +181,10 @@ class FileReference(object):
         if not self.exists:
             raise IOError("File '{0}' does not exist in {1}"
                           .format(self.filename, self.container_path))
+        self._initial_identity = self._identity()
 
-        if expected_checksum is not None and (self.checksum !=
-                                              expected_checksum):
-            logger.error("The %s checksum for file '%s' is expected to be:"
-                         "\n%s\nbut is actually:\n%s\n"
-                         "This file may have been tampered with!",
-                         self.checksum_algorithm,
-                         self.filename,
-                         expected_checksum,
-                         self.checksum)
+        if verify == 'eager':
+            self.check_checksum()
 
         if expected_size is not None and self.size != int(expected_size):
             logger.warning("The size of file '%s' is expected to be %s bytes,"
@@ -133,11 +199,227 @@ class FileReference(object):
         """Checksum of the referenced file."""
         if self.checksum_algorithm is None:
             return None
-        if self._checksum is None or self.force_refresh:
-            with self.open('rb') as file_obj:
-                self._checksum = file_checksum(file_obj,
-                                               self.checksum_algorithm)
-        return self._checksum
+        if self.checksum_algorithm not in self._checksums:
+            self._compute_checksums([self.checksum_algorithm])
+        return self._checksums[self.checksum_algorithm]
+
+    @property
+    def manifest_checksum(self):
+        """Checksum of the referenced file, for writing to a manifest.
+
+        If the file is unchanged since this reference was created with an
+        :attr:`expected_checksum` (typically from an input manifest), and the
+        actual checksum is not yet known, the expected checksum is carried
+        over as-is rather than reading the file to compute it.
+        Any pending lazy verification of the file is unaffected.
+        """
+        if self._expected_checksum_current():
+            return self.expected_checksum
+        return self.checksum
+
+    def _expected_checksum_current(self):
+        """Check whether :attr:`expected_checksum` may stand in for the actual.
+
+        Returns:
+          bool: True if the actual checksum is not yet known, and the file
+          is unchanged since this reference was created.
+        """
+        # A manifest might use a different algorithm than we expect, in which
+        # case its checksum is likely the wrong length and can't be reused.
+        return (self.expected_checksum is not None and
+                self.checksum_algorithm is not None and
+                self.checksum_algorithm not in self._checksums and
+                len(self.expected_checksum) ==
+                hashlib.new(self.checksum_algorithm).digest_size * 2 and
+                self._initial_identity is not None and
+                self._identity() == self._initial_identity)
+
+    def _compute_checksums(self, algorithms):
+        """Read the file and compute and cache the requested checksums.
+
+        Checksums already present in the persistent
+        :class:`~COT.checksum_cache.ChecksumCache` are used as-is,
+        without reading the file.
+
+        If lazy verification is pending, it is performed as well.
+
+        Args:
+          algorithms (list): Checksum algorithms such as 'sha1', 'sha256'.
+        """
+        # Reading the file here doesn't need to trigger a separate
+        # verification pass - we verify below once the checksum is known.
+        pending, self._verify_pending = self._verify_pending, False
+        try:
+            self._read_checksums(algorithms)
+        except Exception:
+            self._verify_pending = pending
+            raise
+        if pending:
+            self.check_checksum()
+
+    def _read_checksums(self, algorithms):
+        """Compute and cache checksums, consulting the persistent cache.
+
+        Args:
+          algorithms (list): Checksum algorithms such as 'sha1', 'sha256'.
+        """
+        identity = self._identity()
+        needed = self._lookup_cached_checksums(identity, algorithms)
+        if not needed:
+            return
+        with self.open('rb') as file_obj:
+            self._store_checksums(identity,
+                                  file_checksums(file_obj, needed))
+
+    def _lookup_cached_checksums(self, identity, algorithms):
+        """Retrieve any known checksums from the persistent cache.
+
+        Args:
+          identity (tuple): Current :meth:`_identity` of the file.
+          algorithms (list): Checksum algorithms such as 'sha1', 'sha256'.
+        Returns:
+          list: Algorithms whose checksums still need to be computed.
+        """
+        cache = ChecksumCache.shared()
+        key = self._cache_key() if cache else None
+        needed = []
+        for algorithm in algorithms:
+            cached = cache.lookup(key, algorithm) if key else None
+            if cached:
+                self._checksums[algorithm] = cached
+            else:
+                needed.append(algorithm)
+        self._checksum_identity = identity
+        return needed
+
+    def _store_checksums(self, identity, checksums):
+        """Record newly computed checksums, here and in the persistent cache.
+
+        Args:
+          identity (tuple): :meth:`_identity` of the file prior to reading it.
+          checksums (dict): Algorithm --> checksum
+        """
+        self._checksums.update(checksums)
+        self._checksum_identity = identity
+        cache = ChecksumCache.shared()
+        key = self._cache_key() if cache else None
+        if key:
+            for algorithm, checksum in checksums.items():
+                cache.store(key, algorithm, checksum)
+
+    def _checksums_to_compute_while_copying(self, identity):
+        """Decide which checksums to compute as the file is being copied.
+
+        The checksum is computed if it isn't already known, unless we can
+        use the expected checksum instead and no verification is pending.
+
+        Args:
+          identity (tuple): Current :meth:`_identity` of the file.
+        Returns:
+          list: Checksum algorithms to compute, possibly empty.
+        """
+        algorithm = self.checksum_algorithm
+        if algorithm is None or algorithm in self._checksums:
+            return []
+        if not self._verify_pending and self._expected_checksum_current():
+            return []
+        return self._lookup_cached_checksums(identity, [algorithm])
+
+    def _copied(self, identity, checksums):
+        """Record checksums computed while copying the file, and verify it.
+
+        Args:
+          identity (tuple): :meth:`_identity` of the file prior to copying.
+          checksums (dict): Algorithm --> checksum
+        """
+        if checksums:
+            self._store_checksums(identity, checksums)
+        self._verify_if_pending()
+
+    def _identity(self):
+        """Tuple identifying the current state of this file, if possible.
+
+        Returns:
+          tuple: Identity that changes whenever the file is modified,
+          or None if this cannot be determined.
+        """
+        return None
+
+    def _cache_key(self):
+        """Key identifying the current contents of this file, if possible.
+
+        Returns:
+          str: Key for use with :class:`~COT.checksum_cache.ChecksumCache`,
+          or None if this file's checksums should not be cached.
+        """
+        return None
+
+    def _verify_if_pending(self):
+        """Perform lazy checksum verification if it has not yet been done."""
+        if self._verify_pending:
+            self._verify_pending = False
+            logger.verbose("Verifying %s checksum of file '%s'",
+                           self.checksum_algorithm, self.filename)
+            self.check_checksum()
+
+    def check_checksum(self):
+        """Compare the file's checksum against the expected checksum, if any.
+
+        Returns:
+          bool: False if the checksum is known not to match, else True.
+        """
+        if self.expected_checksum is None or self.checksum is None:
+            return True
+        if self.checksum != self.expected_checksum:
+            logger.error("The %s checksum for file '%s' is expected to be:"
+                         "\n%s\nbut is actually:\n%s\n"
+                         "This file may have been tampered with!",
+                         self.checksum_algorithm,
+                         self.filename,
+                         self.expected_checksum,
+                         self.checksum)
+            return False
+        return True
+
+    @staticmethod
+    def compute_checksums(file_refs, algorithms=None, reuse_expected=False):
+        """Compute the checksums of many files concurrently.
+
+        Files are read and hashed in a pool of threads (:mod:`hashlib`
+        releases the GIL while hashing), and each file is read only once
+        even if multiple checksum algorithms are requested.
+        Checksums that are already known are not recomputed.
+
+        Args:
+          file_refs (list): FileReference objects to checksum.
+          algorithms (list): Checksum algorithms to compute for each file.
+            If unset, each file's own :attr:`checksum_algorithm` is used.
+          reuse_expected (bool): If True, skip files whose
+            :attr:`manifest_checksum` can be determined without reading them.
+        """
+        jobs = []
+        for file_ref in file_refs:
+            if reuse_expected and file_ref._expected_checksum_current():
+                continue
+            needed = set(algorithms or [file_ref.checksum_algorithm])
+            needed.discard(None)
+            needed.difference_update(file_ref._checksums.keys())
+            if needed:
+                jobs.append((file_ref, sorted(needed)))
+
+        if not jobs:
+            return
+        if len(jobs) == 1:
+            jobs[0][0]._compute_checksums(jobs[0][1])
+            return
+
+        logger.debug("Computing checksums of %d files", len(jobs))
+        pool = ThreadPool(min(len(jobs), CHECKSUM_THREADS))
+        try:
+            pool.map(lambda job: job[0]._compute_checksums(job[1]), jobs)
+        finally:
+            pool.close()
+            pool.join()
 
     @property
     def exists(self):
@@ -168,39 +450,96 @@ class FileReference(object):
         """
         raise NotImplementedError
 
+    def shares_storage_with(self, dest_dir):
+        """Check whether a copy in the given directory would be nearly free.
+
+        Args:
+          dest_dir (str): Directory the file might be copied into.
+
+        Returns:
+          bool: True if :meth:`copy_to` ``dest_dir`` would share the data
+          blocks of this file rather than consuming additional disk space.
+        """
+        return False
+
+    def _invalidate(self):
+        """Discard all cached information about the file."""
+        self._size = None
+        self._checksums = {}
+        self._checksum_identity = None
+
     def refresh(self):
-        """Make sure all information in this reference is still valid."""
+        """Make sure all information in this reference is still valid.
+
+        Returns:
+          bool: True if the file is unchanged, else False.
+        """
+        return self.refresh_all([self])[0]
+
+    @staticmethod
+    def refresh_all(file_refs):
+        """Refresh many references at once, rehashing them concurrently.
+
+        Files whose checksums are known and which are unchanged on disk
+        since those checksums were computed are not rehashed, nor are
+        files whose checksums were not yet known.
+
+        Args:
+          file_refs (list): FileReference objects to refresh.
+
+        Returns:
+          list: For each reference, True if the file is unchanged,
+          else False.
+        """
         # Cache the previously known values
-        exp_size = self.size
-        exp_checksum = self.checksum
-        logger.spam("Refreshing FileReference for '%s', "
-                    "expected size %s, cksum %s",
-                    self.filename, exp_size, exp_checksum)
-        result = True
+        previous = []
+        to_rehash = []
+        for file_ref in file_refs:
+            exp_size = file_ref._size
+            exp_checksum = file_ref._checksums.get(file_ref.checksum_algorithm)
+            logger.spam("Refreshing FileReference for '%s', "
+                        "expected size %s, cksum %s",
+                        file_ref.filename, exp_size, exp_checksum)
+            previous.append((exp_size, exp_checksum))
+            if not file_ref.exists:
+                continue
+            if (file_ref._checksum_identity is not None and
+                    file_ref._checksum_identity == file_ref._identity()):
+                logger.spam("File '%s' is unchanged", file_ref.filename)
+                continue
+            file_ref._invalidate()
+            if exp_checksum is not None:
+                to_rehash.append(file_ref)
 
-        self.force_refresh = True
+        FileReference.compute_checksums(to_rehash)
 
-        if not self.exists:
-            logger.error("File '%s' no longer exists!", self.filename)
-            # keep force_refresh as True since we're in a bad state
-            return False
+        results = []
+        for file_ref, (exp_size, exp_checksum) in zip(file_refs, previous):
+            result = True
+            if not file_ref.exists:
+                logger.error("File '%s' no longer exists!", file_ref.filename)
+                results.append(False)
+                continue
 
-        # Refresh the attributes and see if they've changed
-        if self.size != exp_size and exp_size is not None:
-            logger.warning("Size of file '%s' has changed"
-                           " from %s bytes to %s bytes.",
-                           self.filename, exp_size, self.size)
-            result = False
+            # Refresh the attributes and see if they've changed
+            if file_ref.size != exp_size and exp_size is not None:
+                logger.warning("Size of file '%s' has changed"
+                               " from %s bytes to %s bytes.",
+                               file_ref.filename, exp_size, file_ref.size)
+                result = False
 
-        if self.checksum != exp_checksum and exp_checksum is not None:
-            logger.error("The %s checksum of file '%s' has changed"
-                         " from\n%s\nto\n%s\n"
-                         "This file may have been tampered with!",
-                         self.checksum_algorithm, self.filename,
-                         exp_checksum, self.checksum)
-            result = False
+            if (exp_checksum is not None and
+                    file_ref.checksum != exp_checksum):
+                logger.error("The %s checksum of file '%s' has changed"
+                             " from\n%s\nto\n%s\n"
+                             "This file may have been tampered with!",
+                             file_ref.checksum_algorithm, file_ref.filename,
+                             exp_checksum, file_ref.checksum)
+                result = False
+
+            results.append(result)
 
-        return result
+        return results
 
 
 class FileOnDisk(FileReference):
@@ -219,10 +558,29 @@ class FileOnDisk(FileReference):
     @property
     def size(self):
         """The size of this file, in bytes."""
-        if self._size is None or self.force_refresh:
+        if self._size is None:
             self._size = os.path.getsize(self.file_path)
         return self._size
 
+    def _identity(self):
+        """Tuple identifying the current state of this file.
+
+        Returns:
+          tuple: (device, inode, size, mtime), or None if nonexistent.
+        """
+        try:
+            return _file_identity(self.file_path)
+        except OSError:
+            return None
+
+    def _cache_key(self):
+        """Key identifying the current contents of this file.
+
+        Returns:
+          str: Cache key based on path, inode, size, and modification time.
+        """
+        return ChecksumCache.file_key(self.file_path)
+
     @contextmanager
     def open(self, mode):
         """Open the file and return a reference to the file object.
@@ -232,6 +590,8 @@ class FileOnDisk(FileReference):
         Yields:
           file: File object
         """
+        if 'r' in mode:
+            self._verify_if_pending()
         with open(self.file_path, mode) as obj:
             yield obj
 
@@ -243,18 +603,55 @@ class FileOnDisk(FileReference):
         """
         if self.file_path == os.path.join(dest_dir, self.filename):
             return
+        identity = self._identity()
+        algorithms = self._checksums_to_compute_while_copying(identity)
         logger.debug("Copying %s to %s", self.file_path, dest_dir)
-        shutil.copy(self.file_path, dest_dir)
+        if not algorithms:
+            self._verify_if_pending()
+            materialize(self.file_path, dest_dir)
+            return
+        dest_path = dest_dir
+        if os.path.isdir(dest_path):
+            dest_path = os.path.join(dest_path,
+                                     os.path.basename(self.file_path))
+        with open(self.file_path, 'rb') as src_obj:
+            with io.open(dest_path, 'wb', buffering=0) as dst_obj:
+                checksums = copy_range(src_obj, dst_obj, 0, self.size,
+                                       algorithms)
+        shutil.copymode(self.file_path, dest_path)
+        self._copied(identity, checksums)
+
+    def shares_storage_with(self, dest_dir):
+        """Check whether a copy in the given directory would be nearly free.
+
+        Args:
+          dest_dir (str): Directory the file might be copied into.
+
+        Returns:
+          bool: True if :func:`materialize` can reflink or hardlink this file
+          into ``dest_dir``.
+        """
+        return shares_storage(self.file_path, dest_dir)
 
     def add_to_archive(self, tarf):
         """Copy this file into the given tarfile object.
 
         Args:
-          tarf (tarfile.TarFile): Add this file to that archive.
+          tarf (TarWriter): Add this file to that archive. A
+            :class:`tarfile.TarFile` may also be used.
         """
         logger.debug("Adding %s to TAR file as %s",
                      self.file_path, self.filename)
-        tarf.add(self.file_path, self.filename)
+        if not isinstance(tarf, TarWriter):
+            self._verify_if_pending()
+            tarf.add(self.file_path, self.filename)
+            return
+        identity = self._identity()
+        algorithms = self._checksums_to_compute_while_copying(identity)
+        if not algorithms:
+            self._verify_if_pending()
+        self._copied(identity,
+                     tarf.add(self.file_path, self.filename, algorithms))
 
 
 class FileInTAR(FileReference):
@@ -278,36 +675,62 @@ class FileInTAR(FileReference):
                            "\nAttempting to convert it to an absolute path.",
                            tarfile_path)
             tarfile_path = os.path.abspath(tarfile_path)
-        if not tarfile.is_tarfile(tarfile_path):
+        if not TarIndex.is_tarfile(tarfile_path):
             raise IOError("{0} is not a valid TAR file.".format(tarfile_path))
-        self.tarf = None
         super(FileInTAR, self).__init__(tarfile_path, filename, **kwargs)
 
+    @property
+    def index(self):
+        """The shared :class:`TarIndex` of the containing TAR archive."""
+        return TarIndex.for_path(self.container_path)
+
     @property
     def exists(self):
         """True if the file exists in the TAR archive, else False."""
-        with tarfile.open(self.container_path, 'r') as tarf:
-            try:
-                tarf.getmember(self.filename)
-                return True
-            except KeyError:
-                # Perhaps an issue with 'foo.txt' versus './foo.txt'?
-                for mem in tarf.getmembers():
-                    if os.path.normpath(mem.name) == self.filename:
-                        logger.debug("Found %s at %s in TAR file",
-                                     self.filename, mem.name)
-                        self.filename = mem.name
-                        return True
-                return False
+        entry = self.index.lookup(self.filename)
+        if entry is None:
+            return False
+        if entry.tarinfo.name != self.filename:
+            # Perhaps an issue with 'foo.txt' versus './foo.txt'?
+            logger.debug("Found %s at %s in TAR file",
+                         self.filename, entry.tarinfo.name)
+            self.filename = entry.tarinfo.name
+        return True
 
     @property
     def size(self):
         """The size of this file in bytes."""
-        if self._size is None or self.force_refresh:
-            with tarfile.open(self.container_path, 'r') as tarf:
-                self._size = tarf.getmember(self.filename).size
+        if self._size is None:
+            self._size = self.index.entry(self.filename).size
         return self._size
 
+    def _identity(self):
+        """Tuple identifying the current state of this file.
+
+        Returns:
+          tuple: Identity of the TAR archive plus the location of this file
+          within it, or None if nonexistent.
+        """
+        try:
+            index = self.index
+        except (EnvironmentError, EOFError, tarfile.TarError):
+            return None
+        entry = index.lookup(self.filename)
+        if entry is None:
+            return None
+        return index.identity + (entry.offset, entry.size)
+
+    def _cache_key(self):
+        """Key identifying the current contents of this file.
+
+        Returns:
+          str: Cache key based on the identity of the TAR archive and the
+          offset and size of this file within the archive.
+        """
+        entry = self.index.entry(self.filename)
+        return ChecksumCache.file_key(self.container_path,
+                                      entry.offset, entry.size)
+
     @contextmanager
     def open(self, mode):
         """Open the TAR and return a reference to the relevant file object.
@@ -322,31 +745,814 @@ class FileInTAR(FileReference):
         # We can only extract a file object from a TAR file in read mode.
         if mode != 'r' and mode != 'rb':
             raise ValueError("FileInTar.open() only supports 'r'/'rb' mode")
-        # actually tarf.extractfile is always a binary object...
-        with tarfile.open(self.container_path, 'r') as tarf:
-            self.tarf = tarf
-            with closing(tarf.extractfile(self.filename)) as obj:
-                yield obj
-        self.tarf = None
+        self._verify_if_pending()
+        # actually the member file object is always a binary object...
+        with self.index.open(self.filename) as obj:
+            yield obj
 
     def copy_to(self, dest_dir):
         """Extract this file to the given destination directory.
 
         Args:
           dest_dir (str): Destination directory or filename.
+        Raises:
+          KeyError: if the file is no longer in the TAR archive.
         """
-        with tarfile.open(self.container_path, 'r') as tarf:
-            logger.debug("Extracting %s from %s to %s",
-                         self.filename, self.container_path, dest_dir)
-            tarf.extract(self.filename, dest_dir)
+        logger.debug("Extracting %s from %s to %s",
+                     self.filename, self.container_path, dest_dir)
+        index = self.index
+        entry = index.entry(self.filename)
+        dest_path = os.path.join(dest_dir, self.filename)
+        if not os.path.isdir(os.path.dirname(dest_path)):
+            os.makedirs(os.path.dirname(dest_path))
+        if index.is_contiguous(entry):
+            identity = self._identity()
+            algorithms = self._checksums_to_compute_while_copying(identity)
+            if not algorithms:
+                self._verify_if_pending()
+            with open(self.container_path, 'rb') as obj:
+                with io.open(dest_path, 'wb', buffering=0) as dest_obj:
+                    checksums = copy_range(obj, dest_obj, entry.offset,
+                                           entry.size, algorithms)
+            self._copied(identity, checksums)
+        else:
+            with self.open('rb') as obj:
+                with open(dest_path, 'wb') as dest_obj:
+                    shutil.copyfileobj(obj, dest_obj, COPY_BUFSIZE)
+        os.chmod(dest_path, entry.tarinfo.mode)
+        os.utime(dest_path, (entry.tarinfo.mtime, entry.tarinfo.mtime))
 
     def add_to_archive(self, tarf):
         """Copy this file into the given tarfile object.
 
         Args:
-          tarf (tarfile.TarFile): Add this file to that archive.
+          tarf (TarWriter): Add this file to that archive. A
+            :class:`tarfile.TarFile` may also be used.
+        Raises:
+          KeyError: if the file is no longer in the TAR archive.
         """
-        with self.open('r') as obj:
+        index = self.index
+        entry = index.entry(self.filename)
+        tarinfo = copy.copy(entry.tarinfo)
+        if isinstance(tarf, TarWriter) and index.is_contiguous(entry):
+            identity = self._identity()
+            algorithms = self._checksums_to_compute_while_copying(identity)
+            if not algorithms:
+                self._verify_if_pending()
+            logger.debug("Copying %s directly from offset %d of %s to TAR"
+                         " file", self.filename, entry.offset,
+                         self.container_path)
+            with open(self.container_path, 'rb') as obj:
+                checksums = tarf.add_range(tarinfo, obj, entry.offset,
+                                           algorithms)
+            self._copied(identity, checksums)
+            return
+        with self.open('rb') as obj:
             logger.debug("Copying %s directly from %s to TAR file",
                          self.filename, self.container_path)
-            tarf.addfile(self.tarf.getmember(self.filename), obj)
+            tarf.addfile(tarinfo, obj)
+
+
+TarIndexEntry = namedtuple('TarIndexEntry', ['offset', 'size', 'tarinfo'])
+"""Location of a single member's data within a TAR archive."""
+
+
+class _TarMemberIO(io.RawIOBase):
+    """Raw read-only stream over the data of a single member of a TAR file.
+
+    Reads seek directly to the member's data within the archive,
+    so no TAR headers need to be parsed to access the contents.
+    """
+
+    def __init__(self, tarfile_path, offset, size):
+        """Open the TAR file for reading the given byte range.
+
+        Args:
+          tarfile_path (str): Path to TAR archive
+          offset (int): Offset of the member data within the archive
+          size (int): Size of the member data, in bytes
+        """
+        super(_TarMemberIO, self).__init__()
+        self._file = io.open(tarfile_path, 'rb', buffering=0)
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        """Always True."""
+        return True
+
+    def seekable(self):
+        """Always True."""
+        return True
+
+    def tell(self):
+        """Current position relative to the start of the member data."""
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        """Move to the given position relative to the member data.
+
+        Args:
+          pos (int): Offset
+          whence (int): :data:`io.SEEK_SET`, :data:`io.SEEK_CUR`, or
+            :data:`io.SEEK_END`.
+
+        Returns:
+          int: New absolute position
+
+        Raises:
+          ValueError: if the resulting position would be negative.
+        """
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._size
+        if pos < 0:
+            raise ValueError("negative seek position {0}".format(pos))
+        self._pos = pos
+        return pos
+
+    def readinto(self, buf):
+        """Read member data into the given buffer.
+
+        Args:
+          buf (bytearray): Buffer to fill
+
+        Returns:
+          int: Number of bytes read, 0 at end of member data.
+        """
+        remaining = self._size - self._pos
+        if remaining <= 0:
+            return 0
+        view = memoryview(buf)[:remaining]
+        self._file.seek(self._offset + self._pos)
+        count = self._file.readinto(view)
+        self._pos += count
+        return count
+
+    def close(self):
+        """Close the underlying TAR file."""
+        if not self.closed:
+            self._file.close()
+        super(_TarMemberIO, self).close()
+
+
+class TarIndex(object):
+    """Index of the members of a TAR archive such as an OVA.
+
+    The archive is opened and its headers scanned only once, into a table
+    mapping each member name to a :class:`TarIndexEntry`.
+    Indexes are shared by all users of the same archive via :meth:`for_path`,
+    and are transparently rebuilt if the archive is modified on disk.
+    """
+
+    MAX_CACHED = 16
+    """Maximum number of archives whose indexes are kept in memory."""
+
+    _indexes = OrderedDict()
+    """Archive path --> :class:`TarIndex`, least recently used first."""
+
+    @classmethod
+    def for_path(cls, tarfile_path):
+        """Get the shared index for the given TAR file, creating it if needed.
+
+        Args:
+          tarfile_path (str): Path to TAR archive
+
+        Returns:
+          TarIndex: Up-to-date index of this archive.
+
+        Raises:
+          OSError: if the file does not exist
+          tarfile.TarError: if the file is not a valid TAR archive
+        """
+        path = os.path.realpath(tarfile_path)
+        identity = _file_identity(path)
+        index = cls._indexes.pop(path, None)
+        if index is None or index.identity != identity:
+            index = cls(path, identity)
+        cls._indexes[path] = index
+        while len(cls._indexes) > cls.MAX_CACHED:
+            cls._indexes.popitem(last=False)
+        return index
+
+    @classmethod
+    def is_tarfile(cls, path):
+        """Check whether the given file is a TAR archive we can index.
+
+        Args:
+          path (str): File path
+        Returns:
+          bool: True if a TAR archive, else False.
+        """
+        try:
+            cls.for_path(path)
+            return True
+        except (EnvironmentError, EOFError, tarfile.TarError):
+            return False
+
+    def __init__(self, path, identity):
+        """Scan the given TAR file. Use :meth:`for_path` instead of this.
+
+        Args:
+          path (str): Path to TAR archive
+          identity (tuple): See :func:`_file_identity`.
+        """
+        self.path = path
+        self.identity = identity
+        self.members = {}
+        """Member name --> :class:`TarIndexEntry`."""
+        self.names = []
+        """List of member names, in archive order."""
+        self._normalized = {}
+        try:
+            tarf = tarfile.open(path, 'r:')
+            self.seekable = True
+        except tarfile.ReadError:
+            # Compressed archive - member offsets don't correspond to the
+            # file on disk, so we'll have to read through tarfile instead.
+            tarf = tarfile.open(path, 'r')
+            self.seekable = False
+        with closing(tarf):
+            for tarinfo in tarf:
+                entry = TarIndexEntry(tarinfo.offset_data, tarinfo.size,
+                                      tarinfo)
+                self.names.append(tarinfo.name)
+                self.members[tarinfo.name] = entry
+                self._normalized.setdefault(os.path.normpath(tarinfo.name),
+                                            entry)
+        logger.debug("Indexed %d members of TAR file %s",
+                     len(self.names), path)
+
+    def lookup(self, filename):
+        """Find the entry for the given file name.
+
+        Handles the distinction between names like 'foo.txt' and './foo.txt'.
+
+        Args:
+          filename (str): Member name
+        Returns:
+          TarIndexEntry: Entry for this member, or None if not found.
+        """
+        entry = self.members.get(filename)
+        if entry is None:
+            entry = self._normalized.get(os.path.normpath(filename))
+        return entry
+
+    def entry(self, filename):
+        """Get the entry for the given file name, which must exist.
+
+        Args:
+          filename (str): Member name
+        Returns:
+          TarIndexEntry: Entry for this member.
+        Raises:
+          KeyError: if no such member exists
+        """
+        entry = self.lookup(filename)
+        if entry is None:
+            raise KeyError("No member '{0}' in TAR file {1}"
+                           .format(filename, self.path))
+        return entry
+
+    def is_contiguous(self, entry):
+        """Check whether a member's data can be read directly from the file.
+
+        Args:
+          entry (TarIndexEntry): Member to check.
+        Returns:
+          bool: True if the member's data is stored as-is, in one piece,
+          at ``entry.offset`` in the archive file.
+        """
+        return (self.seekable and entry.tarinfo.isreg() and
+                not entry.tarinfo.issparse())
+
+    @contextmanager
+    def open(self, filename):
+        """Open the given member for reading.
+
+        Args:
+          filename (str): Member name
+        Yields:
+          file: Readable binary file object
+        Raises:
+          KeyError: if no such member exists
+        """
+        entry = self.entry(filename)
+        if self.is_contiguous(entry):
+            with io.BufferedReader(_TarMemberIO(self.path, entry.offset,
+                                                entry.size),
+                                   buffer_size=COPY_BUFSIZE) as obj:
+                yield obj
+        else:
+            with tarfile.open(self.path, 'r') as tarf:
+                with closing(tarf.extractfile(entry.tarinfo.name)) as obj:
+                    yield obj
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    """Copy data between files in the kernel with ``copy_file_range(2)``."""
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    """Copy data between files in the kernel with ``sendfile(2)``."""
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+_ZERO_COPY_METHODS = [method for method, name in
+                      [(_copy_file_range, 'copy_file_range'),
+                       (_sendfile, 'sendfile')]
+                      if hasattr(os, name)]
+"""Kernel-level copy functions available on this platform, best first."""
+
+_ZERO_COPY_UNSUPPORTED = set(getattr(errno, name) for name in
+                             ['ENOSYS', 'EXDEV', 'EINVAL', 'EOPNOTSUPP',
+                              'ENOTSUP', 'ENOTSOCK', 'EBADF', 'ENOTTY']
+                             if hasattr(errno, name))
+"""Error codes indicating that a kernel copy method can't be used here."""
+
+
+def _write_all(fileobj, buf):
+    """Write all of the given data to an unbuffered file object.
+
+    Args:
+      fileobj (io.RawIOBase): File to write to.
+      buf (bytes): Data to write.
+    """
+    view = memoryview(buf)
+    while len(view):
+        view = view[fileobj.write(view):]
+
+
+def _kernel_copy(src_fd, dst_fd, offset, length):
+    """Copy as much data as possible between files within the kernel.
+
+    Args:
+      src_fd (int): Source file descriptor.
+      dst_fd (int): Destination file descriptor.
+      offset (int): Offset of the data to copy within the source file.
+      length (int): Number of bytes to copy.
+
+    Returns:
+      tuple: ``(offset, length, method)``, the offset and length of any
+      data remaining to be copied, and the name of the method used,
+      or None if no kernel copy method could be used.
+    """
+    for method in _ZERO_COPY_METHODS:
+        try:
+            while length > 0:
+                copied = method(src_fd, dst_fd, offset,
+                                min(length, 1 << 30))
+                if not copied:
+                    break
+                offset += copied
+                length -= copied
+        except OSError as exc:
+            if exc.errno not in _ZERO_COPY_UNSUPPORTED:
+                raise
+            logger.spam("Unable to use %s: %s", method.__name__, exc)
+        if length == 0:
+            return offset, length, method.__name__.lstrip('_')
+    return offset, length, None
+
+
+def copy_range(src_obj, dst_obj, offset, length, checksum_algorithms=None):
+    """Copy part of one file to the current position in another file.
+
+    Where possible, the data is moved by the kernel with
+    :func:`os.copy_file_range` or :func:`os.sendfile`, without ever being
+    copied into user space; otherwise, or if checksums are requested,
+    a buffered copy is performed instead.
+
+    Args:
+      src_obj (file): Source file object, opened for binary reading.
+      dst_obj (file): Unbuffered destination file object, opened for
+        binary writing.
+      offset (int): Offset of the data to copy within ``src_obj``.
+      length (int): Number of bytes to copy.
+      checksum_algorithms (list): Checksums, such as 'sha1', to compute
+        over the copied data.
+
+    Returns:
+      dict: Algorithm --> checksum of the copied data, for each requested
+      algorithm.
+
+    Raises:
+      IOError: if ``src_obj`` is shorter than expected.
+    """
+    hashers = [(algorithm, hashlib.new(algorithm))
+               for algorithm in (checksum_algorithms or [])]
+    if not hashers:
+        offset, length, _ = _kernel_copy(src_obj.fileno(), dst_obj.fileno(),
+                                         offset, length)
+        if length == 0:
+            return {}
+
+    src_obj.seek(offset)
+    while length > 0:
+        buf = src_obj.read(min(length, COPY_BUFSIZE))
+        if not buf:
+            raise IOError("Unexpected end of file in {0}"
+                          .format(getattr(src_obj, 'name', src_obj)))
+        for _, hasher in hashers:
+            hasher.update(buf)
+        _write_all(dst_obj, buf)
+        length -= len(buf)
+    return dict((algorithm, hasher.hexdigest())
+                for algorithm, hasher in hashers)
+
+
+FICLONE = None
+"""Linux ``ioctl(2)`` request to reflink one file to another, if available."""
+if fcntl is not None and sys.platform.startswith('linux'):
+    FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
+_REFLINK_SUPPORT = {}
+"""Cache of device number --> whether its filesystem supports reflinks."""
+
+
+def _reflink(src_fd, dst_fd):
+    """Make the destination file share the data blocks of the source file.
+
+    Args:
+      src_fd (int): Source file descriptor.
+      dst_fd (int): Destination file descriptor.
+
+    Returns:
+      bool: True on success, False if reflinks are not supported here.
+    """
+    if FICLONE is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except EnvironmentError as exc:
+        if exc.errno not in _ZERO_COPY_UNSUPPORTED:
+            raise
+        logger.spam("Unable to reflink: %s", exc)
+        return False
+    return True
+
+
+def _reflink_supported(directory):
+    """Check whether the filesystem containing a directory supports reflinks.
+
+    The result is cached per device, as probing requires creating files.
+
+    Args:
+      directory (str): Directory to check.
+
+    Returns:
+      bool: True if files in ``directory`` can be reflinked to each other.
+    """
+    device = os.stat(directory).st_dev
+    if device not in _REFLINK_SUPPORT:
+        supported = False
+        try:
+            with tempfile.TemporaryFile(dir=directory) as src_obj:
+                src_obj.write(b"\0")
+                src_obj.flush()
+                with tempfile.TemporaryFile(dir=directory) as dst_obj:
+                    supported = _reflink(src_obj.fileno(), dst_obj.fileno())
+        except EnvironmentError as exc:
+            logger.debug("Unable to check reflink support in %s: %s",
+                         directory, exc)
+        _REFLINK_SUPPORT[device] = supported
+    return _REFLINK_SUPPORT[device]
+
+
+def _is_immutable(statres):
+    """Check whether file contents can be shared by hardlinking.
+
+    We consider a file immutable if nobody has permission to write to it,
+    so a hardlinked copy can't be modified without affecting the original.
+    Permission bits don't restrict root, so nothing is immutable to root.
+
+    Args:
+      statres (os.stat_result): Status of the file to check.
+
+    Returns:
+      bool: True if the file is read-only for everyone, including us.
+    """
+    if getattr(os, 'geteuid', lambda: None)() == 0:
+        return False
+    return not statres.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def shares_storage(src_path, dest_dir):
+    """Check whether :func:`materialize` can copy a file at no space cost.
+
+    Args:
+      src_path (str): File to be copied.
+      dest_dir (str): Directory the file would be copied into.
+
+    Returns:
+      bool: True if the copy can be a reflink or hardlink of ``src_path``.
+    """
+    try:
+        src_stat = os.stat(src_path)
+        if src_stat.st_dev != os.stat(dest_dir).st_dev:
+            return False
+        return _is_immutable(src_stat) or _reflink_supported(dest_dir)
+    except OSError:
+        return False
+
+
+MATERIALIZE_STRATEGIES = ('reflink', 'hardlink', 'copy_file_range',
+                          'sendfile', 'copy')
+"""Ways :func:`materialize` may copy a file, in order of preference."""
+
+
+def _copy_contents(src_path, dest_path, same_fs):
+    """Copy a file's contents and mode by the cheapest available means.
+
+    Helper function for :func:`materialize`.
+
+    Args:
+      src_path (str): File to copy.
+      dest_path (str): File to overwrite.
+      same_fs (bool): Whether both files are on the same filesystem.
+
+    Returns:
+      str: The strategy used - any of :data:`MATERIALIZE_STRATEGIES`
+      other than 'hardlink'.
+    """
+    with open(src_path, 'rb') as src_obj:
+        with io.open(dest_path, 'wb', buffering=0) as dst_obj:
+            if same_fs and _reflink(src_obj.fileno(), dst_obj.fileno()):
+                strategy = 'reflink'
+            else:
+                _, _, strategy = _kernel_copy(src_obj.fileno(),
+                                              dst_obj.fileno(),
+                                              0, os.fstat(src_obj.fileno())
+                                              .st_size)
+            if strategy is None:
+                src_obj.seek(0)
+                shutil.copyfileobj(src_obj, dst_obj, COPY_BUFSIZE)
+                strategy = 'copy'
+    shutil.copymode(src_path, dest_path)
+    return strategy
+
+
+def materialize(src_path, dest_path):
+    """Copy a file, sharing its storage with the original where possible.
+
+    Like :func:`shutil.copy`, the destination may be a directory, and
+    permission bits are copied along with the file contents. Strategies
+    are attempted in the order given by :data:`MATERIALIZE_STRATEGIES`:
+
+    1. Reflink (``FICLONE``), on filesystems such as btrfs and XFS, where
+       the copy shares data blocks with the original until either is
+       modified.
+    2. Hardlink, if the destination is on the same filesystem (which does
+       not support reflinks) and does not yet exist, and the source file
+       is immutable (read-only for everyone, and we are not root).
+    3. Kernel copy with ``copy_file_range`` or ``sendfile``.
+    4. Plain buffered copy.
+
+    The copy is written to a temporary file that then replaces the
+    destination, so an existing destination (which may itself be a link to
+    some other file) is never modified in place.
+
+    Args:
+      src_path (str): File to copy.
+      dest_path (str): Destination directory or filename.
+
+    Returns:
+      str: The strategy used, one of :data:`MATERIALIZE_STRATEGIES`.
+
+    Raises:
+      shutil.Error: if ``src_path`` and ``dest_path`` are the same file
+        (:class:`shutil.SameFileError` where available).
+    """
+    if os.path.isdir(dest_path):
+        dest_path = os.path.join(dest_path, os.path.basename(src_path))
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    src_stat = os.stat(src_path)
+    same_fs = (src_stat.st_dev == os.stat(dest_dir).st_dev)
+    hardlink_ok = (same_fs and _is_immutable(src_stat) and
+                   not _reflink_supported(dest_dir))
+    if os.path.realpath(src_path) == os.path.realpath(dest_path):
+        raise getattr(shutil, 'SameFileError', shutil.Error)(
+            "{0} and {1} are the same file".format(src_path, dest_path))
+    if (hardlink_ok and os.path.exists(dest_path) and
+            os.path.samefile(src_path, dest_path)):
+        logger.debug("%s is already a hardlink to %s", dest_path, src_path)
+        return 'hardlink'
+
+    (temp_fd, temp_path) = tempfile.mkstemp(
+        prefix="." + os.path.basename(dest_path) + ".", dir=dest_dir)
+    os.close(temp_fd)
+    strategy = None
+    try:
+        if hardlink_ok and not os.path.lexists(dest_path):
+            try:
+                os.remove(temp_path)
+                os.link(src_path, temp_path)
+                strategy = 'hardlink'
+            except OSError as exc:
+                logger.spam("Unable to hardlink %s: %s", src_path, exc)
+        if strategy is None:
+            strategy = _copy_contents(src_path, temp_path, same_fs)
+        # os.replace is atomic on all platforms, but Python 3.3+ only
+        getattr(os, 'replace', os.rename)(temp_path, dest_path)
+    except Exception:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.debug("Copied %s to %s by %s", src_path, dest_path, strategy)
+    return strategy
+
+
+class TarWriter(object):
+    """Writer for uncompressed TAR archives such as OVAs.
+
+    Provides a subset of the :class:`tarfile.TarFile` writing API.
+    Unlike :mod:`tarfile`, file contents are copied into the archive with
+    :func:`copy_range`, so the data need not pass through Python at all.
+    Links are always dereferenced, and the output is otherwise identical
+    to that produced by :mod:`tarfile`.
+    """
+
+    def __init__(self, path):
+        """Create a new TAR archive at the given path.
+
+        Args:
+          path (str): Path to the TAR archive to create or overwrite.
+        """
+        self.path = path
+        self.format = tarfile.DEFAULT_FORMAT
+        self.fileobj = io.open(path, 'wb', buffering=0)
+        self.offset = 0
+        self._reserved = {}
+
+    def __enter__(self):
+        """Use this writer as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace):
+        """Finish the archive when exiting a context manager block.
+
+        Like :class:`tarfile.TarFile`, if an exception occurred then the
+        end-of-archive marker is not written, so that the incomplete
+        archive isn't mistaken for a valid one.
+
+        For the parameters, see :mod:`contextlib`.
+        """
+        if exc_type is None:
+            self.close()
+        else:
+            self.fileobj.close()
+
+    def _write(self, buf):
+        """Write data at the current end of the archive.
+
+        Args:
+          buf (bytes): Data to write.
+        """
+        _write_all(self.fileobj, buf)
+        self.offset += len(buf)
+
+    def _pad(self):
+        """Pad the archive with zeros to a multiple of the TAR block size."""
+        remainder = self.offset % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    @staticmethod
+    def gettarinfo(name, arcname=None):
+        """Create a :class:`tarfile.TarInfo` describing a regular file.
+
+        Args:
+          name (str): Path to the file, following any links.
+          arcname (str): Name of the file in the archive, if not ``name``.
+        Returns:
+          tarfile.TarInfo: Header for this file.
+        Raises:
+          IOError: if ``name`` is not a regular file.
+        """
+        statres = os.stat(name)
+        if not stat.S_ISREG(statres.st_mode):
+            raise IOError("{0} is not a regular file".format(name))
+        if arcname is None:
+            arcname = name
+        arcname = os.path.splitdrive(arcname)[1]
+        arcname = arcname.replace(os.sep, "/").lstrip("/")
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.mode = statres.st_mode
+        tarinfo.uid = statres.st_uid
+        tarinfo.gid = statres.st_gid
+        tarinfo.size = statres.st_size
+        tarinfo.mtime = statres.st_mtime
+        tarinfo.type = tarfile.REGTYPE
+        if pwd:
+            try:
+                tarinfo.uname = pwd.getpwuid(tarinfo.uid)[0]
+            except KeyError:
+                pass
+        if grp:
+            try:
+                tarinfo.gname = grp.getgrgid(tarinfo.gid)[0]
+            except KeyError:
+                pass
+        return tarinfo
+
+    def add(self, name, arcname=None, checksum_algorithms=None):
+        """Add the given file to the archive.
+
+        Args:
+          name (str): Path to the file, following any links.
+          arcname (str): Name of the file in the archive, if not ``name``.
+          checksum_algorithms (list): See :func:`copy_range`.
+        Returns:
+          dict: See :func:`copy_range`.
+        """
+        with open(name, 'rb') as obj:
+            return self.add_range(self.gettarinfo(name, arcname), obj, 0,
+                                  checksum_algorithms)
+
+    def add_range(self, tarinfo, src_obj, offset, checksum_algorithms=None):
+        """Add a file whose contents lie within some other file.
+
+        Args:
+          tarinfo (tarfile.TarInfo): Header for the file.
+          src_obj (file): File containing the data of this file.
+          offset (int): Offset of the data within ``src_obj``.
+          checksum_algorithms (list): See :func:`copy_range`.
+        Returns:
+          dict: See :func:`copy_range`.
+        """
+        self._write(tarinfo.tobuf(self.format))
+        checksums = copy_range(src_obj, self.fileobj, offset, tarinfo.size,
+                               checksum_algorithms)
+        self.offset += tarinfo.size
+        self._pad()
+        return checksums
+
+    def reserve(self, tarinfo):
+        """Add a file whose contents will be provided later by :meth:`fill`.
+
+        Args:
+          tarinfo (tarfile.TarInfo): Header for the file, including its
+            eventual size.
+        Returns:
+          int: Offset of the file's data within the archive.
+        """
+        self._write(tarinfo.tobuf(self.format))
+        offset = self.offset
+        self._reserved[offset] = tarinfo.size
+        self._write(tarfile.NUL * tarinfo.size)
+        self._pad()
+        return offset
+
+    def fill(self, offset, data):
+        """Provide the contents of a file previously added by :meth:`reserve`.
+
+        Args:
+          offset (int): Offset returned by :meth:`reserve`.
+          data (bytes): File contents, of exactly the reserved size.
+        Raises:
+          ValueError: if ``data`` is not of the reserved size.
+        """
+        if self._reserved.get(offset) != len(data):
+            raise ValueError("No space for {0} bytes reserved at offset {1}"
+                             .format(len(data), offset))
+        del self._reserved[offset]
+        self.fileobj.seek(offset)
+        _write_all(self.fileobj, data)
+        self.fileobj.seek(self.offset)
+
+    def addfile(self, tarinfo, fileobj):
+        """Add a file whose contents are read from the given file object.
+
+        Args:
+          tarinfo (tarfile.TarInfo): Header for the file.
+          fileobj (file): Readable file object providing the contents.
+
+        Raises:
+          IOError: if ``fileobj`` is shorter than expected.
+        """
+        self._write(tarinfo.tobuf(self.format))
+        remaining = tarinfo.size
+        while remaining > 0:
+            buf = fileobj.read(min(remaining, COPY_BUFSIZE))
+            if not buf:
+                raise IOError("Unexpected end of data for {0}"
+                              .format(tarinfo.name))
+            self._write(buf)
+            remaining -= len(buf)
+        self._pad()
+
+    def close(self):
+        """Write the end-of-archive marker and close the file."""
+        if self.fileobj.closed:
+            return
+        try:
+            # Two zero blocks, then pad to a full record, just like tarfile
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+            remainder = self.offset % tarfile.RECORDSIZE
+            if remainder:
+                self._write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+        finally:
+            self.fileobj.close()
@@ -40,6 +40,7 @@ Helper modules
   COT.helpers.helper
   COT.helpers.apt_get
   COT.helpers.brew
+  COT.helpers.cache
   COT.helpers.fatdisk
   COT.helpers.gcc
   COT.helpers.isoinfo
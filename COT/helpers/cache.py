@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+#
+# cache.py - Shared caches of helper program output and discovery
+#
+# October 2026, the COT project developers.
+# Copyright (c) 2026 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Caches of helper program output and of helper discovery.
+
+Helpers such as ``qemu-img info``, ``isoinfo -d``, and ``fatdisk ls`` may be
+asked about the same file many times over the course of a single COT command.
+Each :class:`~COT.helpers.helper.Helper` declares which of its invocations
+are safe to cache and which file(s) their output depends on (see
+:meth:`~COT.helpers.helper.Helper.cache_files`); the output is then stored
+in the shared :class:`HelperCache`, keyed on the identity (device, inode,
+size, and modification time) of those files, so that a file that has since
+been rewritten, even in place, is never described by stale output.
+
+Output that depends only on the helper executable itself, such as its
+version string, is additionally kept in a small JSON file under
+``$XDG_CACHE_HOME/cot`` (by default ``~/.cache/cot``) so that it survives
+from one COT invocation to the next. This persistent tier can be disabled
+by setting :attr:`HelperCache.PERSISTENT` to False or by setting the
+``COT_NO_HELPER_CACHE`` environment variable.
+
+Similarly, the :class:`HelperRegistry` remembers where each helper was found
+and which version it is, so that short-lived COT invocations needn't search
+``$PATH`` or run ``--version`` again until the executable itself changes.
+
+**Classes**
+
+.. autosummary::
+  :nosignatures:
+
+  HelperCache
+  HelperRegistry
+
+**Functions**
+
+.. autosummary::
+  :nosignatures:
+
+  cache_home
+  file_identity
+  search_path_identity
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def cache_home():
+    """Get the directory where COT stores its persistent caches.
+
+    Returns:
+      str: ``$XDG_CACHE_HOME/cot``, by default ``~/.cache/cot``.
+    """
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                        os.path.join(os.path.expanduser('~'), '.cache'),
+                        'cot')
+
+
+def file_identity(path):
+    """Describe the current state of a file, without reading its contents.
+
+    Args:
+      path (str): Path to the file.
+
+    Returns:
+      str: Identity string derived from the resolved path, device, inode,
+      size, and modification time of the file, or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    mtime = getattr(stat, 'st_mtime_ns', None) or repr(stat.st_mtime)
+    return ":".join(str(x) for x in [os.path.realpath(path), stat.st_dev,
+                                     stat.st_ino, stat.st_size, mtime])
+
+
+def search_path_identity():
+    """Describe the current state of the directories in ``$PATH``.
+
+    Installing or removing an executable in any of these directories changes
+    the identity of that directory, and therefore this value.
+
+    Returns:
+      str: Identity string derived from :func:`file_identity` of each
+      directory in ``$PATH``.
+    """
+    return "|".join(str(file_identity(directory)) for directory in
+                    os.environ.get('PATH', '').split(os.pathsep))
+
+
+def _load_json(path, description):
+    """Read a dictionary from the given JSON file, if it exists and is valid.
+
+    Args:
+      path (str): Path to the JSON file.
+      description (str): Description of the file for logging.
+
+    Returns:
+      collections.OrderedDict: File contents, or an empty dictionary.
+    """
+    if path and os.path.exists(path):
+        try:
+            with open(path) as fileobj:
+                return json.load(fileobj,
+                                 object_pairs_hook=collections.OrderedDict)
+        except (IOError, OSError, ValueError) as exc:
+            logger.debug("Unable to read %s %s: %s", description, path, exc)
+    return collections.OrderedDict()
+
+
+def _save_json(path, description, data):
+    """Atomically replace the given JSON file with the given dictionary.
+
+    Args:
+      path (str): Path to the JSON file.
+      description (str): Description of the file for logging.
+      data (dict): Data to write.
+    """
+    temp_path = "{0}.{1}".format(path, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(temp_path, 'w') as fileobj:
+            json.dump(data, fileobj)
+        # os.replace is atomic on all platforms, but Python 3.3+ only
+        getattr(os, 'replace', os.rename)(temp_path, path)
+    except (IOError, OSError) as exc:
+        logger.debug("Unable to write %s %s: %s", description, path, exc)
+
+
+class HelperCache(object):
+    """Bounded LRU cache of helper output, optionally backed by a file.
+
+    Use :meth:`shared` to get the process-wide instance.
+    Errors in reading or writing the persistent file are logged and
+    otherwise ignored - a broken file simply behaves as an empty one.
+    """
+
+    MAX_ENTRIES = 256
+    """Maximum number of outputs to retain in memory."""
+
+    MAX_PERSISTENT_ENTRIES = 64
+    """Maximum number of outputs to retain on disk."""
+
+    PERSISTENT = (os.environ.get('COT_NO_HELPER_CACHE') is None)
+    """Set to False to disable use of the persistent file."""
+
+    _shared = None
+
+    @staticmethod
+    def default_path():
+        """Get the default location of the persistent cache file.
+
+        Returns:
+          str: ``$XDG_CACHE_HOME/cot/helper_output.json``
+        """
+        return os.path.join(cache_home(), 'helper_output.json')
+
+    @classmethod
+    def shared(cls):
+        """Get the shared process-wide cache instance.
+
+        Returns:
+          HelperCache: Cache instance, persistent only if
+          :attr:`PERSISTENT` is set.
+        """
+        path = cls.default_path() if cls.PERSISTENT else None
+        if cls._shared is None or cls._shared.path != path:
+            cls._shared = cls(path)
+        return cls._shared
+
+    @staticmethod
+    def key(name, args, files):
+        """Construct a cache key for the given helper invocation.
+
+        Args:
+          name (str): Name of the helper program.
+          args (tuple): Arguments to the helper program.
+          files (list): Paths to the files that the output depends on.
+
+        Returns:
+          str: Cache key, or None if any of the ``files`` can't be found.
+        """
+        identities = [file_identity(path) for path in files]
+        if None in identities:
+            return None
+        return "\0".join([name] + [str(arg) for arg in args] + identities)
+
+    def __init__(self, path=None):
+        """Create an empty cache.
+
+        Args:
+          path (str): Path to the persistent JSON file, if any.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._persistent_entries = None
+
+    def _load(self):
+        """Get the entries stored in the persistent file, reading it if needed.
+
+        Returns:
+          collections.OrderedDict: Persistent entries, least recently
+          stored first.
+        """
+        if self._persistent_entries is None:
+            self._persistent_entries = _load_json(self.path, "helper cache")
+        return self._persistent_entries
+
+    def _save(self):
+        """Write the persistent entries back to the persistent file."""
+        _save_json(self.path, "helper cache", self._persistent_entries)
+
+    def lookup(self, key):
+        """Look up previously stored output.
+
+        Args:
+          key (str): Key as returned by :meth:`key`.
+
+        Returns:
+          str: Cached output, or None if not found.
+        """
+        if key is None:
+            return None
+        with self._lock:
+            output = self._entries.pop(key, None)
+            if output is None and self.path:
+                output = self._load().get(key)
+            if output is None:
+                return None
+            self._entries[key] = output
+        return output
+
+    def store(self, key, output, persistent=False):
+        """Store newly generated output.
+
+        Args:
+          key (str): Key as returned by :meth:`key`.
+          output (str): Output to store.
+          persistent (bool): Whether to store the output to the persistent
+            file as well as in memory.
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = output
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+            if not (persistent and self.path):
+                return
+            entries = self._load()
+            if entries.get(key) == output:
+                return
+            entries.pop(key, None)
+            entries[key] = output
+            while len(entries) > self.MAX_PERSISTENT_ENTRIES:
+                entries.popitem(last=False)
+            self._save()
+
+    def clear(self):
+        """Discard all entries in the cache, including the persistent file."""
+        with self._lock:
+            self._entries.clear()
+            if self.path and self._load():
+                self._persistent_entries.clear()
+                self._save()
+
+
+class HelperRegistry(object):
+    """Persistent record of the path, version, and capabilities of helpers.
+
+    Each entry is only trusted while ``$PATH`` and the identity of the
+    recorded executable (see :func:`file_identity`) remain unchanged.
+    Helpers that were not found are recorded too, with no path; these
+    entries are trusted only while none of the directories in ``$PATH``
+    change (see :func:`search_path_identity`).
+    Use :meth:`shared` to get the process-wide instance, if enabled.
+    """
+
+    ENABLED = (os.environ.get('COT_NO_HELPER_CACHE') is None)
+    """Set to False to disable use of the persistent registry."""
+
+    _shared = None
+
+    @staticmethod
+    def default_path():
+        """Get the default location of the registry file.
+
+        Returns:
+          str: ``$XDG_CACHE_HOME/cot/helpers.json``
+        """
+        return os.path.join(cache_home(), 'helpers.json')
+
+    @classmethod
+    def shared(cls):
+        """Get the shared process-wide registry instance, if enabled.
+
+        Returns:
+          HelperRegistry: Registry instance, or None if disabled.
+        """
+        if not cls.ENABLED:
+            return None
+        path = cls.default_path()
+        if cls._shared is None or cls._shared.path != path:
+            cls._shared = cls(path)
+        return cls._shared
+
+    def __init__(self, path):
+        """Load the registry stored at the given path, if any.
+
+        Args:
+          path (str): Path to the registry JSON file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = _load_json(path, "helper registry")
+
+    def lookup(self, name):
+        """Look up the recorded details of the given helper.
+
+        Args:
+          name (str): Helper name, such as 'qemu-img'.
+
+        Returns:
+          dict: Entry with keys 'path' (which is None if the helper was not
+          found), 'version' (which may be None), and 'capabilities', or None
+          if no entry is recorded or it is out of date.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if not entry:
+            return None
+        if entry.get('path'):
+            identity = file_identity(entry['path'])
+        else:
+            identity = search_path_identity()
+        if (entry.get('search_path') != os.environ.get('PATH') or
+                entry.get('identity') != identity):
+            logger.debug("Registry entry for %s is out of date", name)
+            return None
+        logger.spam("Found registry entry for %s: %s", name, entry)
+        return entry
+
+    def record(self, name, path, version=None, capabilities=None):
+        """Record the details of the given helper.
+
+        Args:
+          name (str): Helper name, such as 'qemu-img'.
+          path (str): Path to the helper executable, or None if the helper
+            was not found anywhere in ``$PATH``.
+          version (str): Version of the helper, if known.
+          capabilities (dict): Capability flags of this version of the helper.
+        """
+        if path:
+            identity = file_identity(path)
+            if identity is None:
+                return
+        else:
+            identity = search_path_identity()
+        entry = {
+            'path': path,
+            'search_path': os.environ.get('PATH'),
+            'identity': identity,
+            'version': version,
+            'capabilities': capabilities or {},
+        }
+        with self._lock:
+            if self._entries.get(name) == entry:
+                return
+            self._entries[name] = entry
+            _save_json(self.path, "helper registry", self._entries)
+
+    def clear(self):
+        """Discard all entries in the registry."""
+        with self._lock:
+            self._entries.clear()
+            _save_json(self.path, "helper registry", self._entries)
@@ -53,6 +53,18 @@ class FatDisk(Helper):
                      (helpers['clang'] or helpers['gcc'] or
                       helpers['g++'] or helpers['gcc'].installable)))
 
+    def cache_files(self, args):
+        """Get the files whose state determines the output of the given call.
+
+        The output of ``fatdisk FILE ls`` commands is cached to save time.
+
+        For the parameters, see
+        :meth:`COT.helpers.helper.Helper.cache_files`.
+        """
+        if len(args) == 2 and args[1] == "ls":
+            return [args[0]]
+        return super(FatDisk, self).cache_files(args)
+
     def _install(self):
         """Install ``fatdisk``."""
         try:
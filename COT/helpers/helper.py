@@ -61,6 +61,9 @@ import distutils.spawn
 from distutils.version import StrictVersion
 import requests
 
+from COT.file_reference import materialize
+from COT.helpers.cache import HelperCache, HelperRegistry
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -149,6 +152,7 @@ class Helper(object):
     .. autosummary::
       name
       info_uri
+      capabilities
       installable
       installed
       path
@@ -159,9 +163,11 @@ class Helper(object):
     .. autosummary::
       :nosignatures:
 
+      cache_files
       call
       install
       _install
+      refresh
       unsure_how_to_install
     """
 
@@ -188,11 +194,6 @@ class Helper(object):
             version_args = ['--version']
         self._version_args = version_args
         self._version_regexp = version_regexp
-        self.cached_output = {}
-        """Cache of call args --> output from this call.
-
-        This is opt-in per-subclass - nothing is cached by default.
-        """
 
     def __bool__(self):
         """A helper is True if installed and False if not installed."""
@@ -217,12 +218,34 @@ class Helper(object):
         """URI for more information about this helper."""
         return self._info_uri
 
+    _capability_versions = {}
+    """Mapping of capability flag to minimum helper version providing it."""
+
+    def _registry_entry(self):
+        """Get the entry for this helper in the :class:`HelperRegistry`.
+
+        Returns:
+          dict: Registry entry if enabled and still valid, else None.
+        """
+        registry = HelperRegistry.shared()
+        if registry is None:
+            return None
+        return registry.lookup(self.name)
+
     @property
     def path(self):
         """Discovered path to the helper."""
         if not self._path:
-            logger.spam("Checking for helper executable %s", self.name)
-            self._path = distutils.spawn.find_executable(self.name)
+            entry = self._registry_entry()
+            if entry:
+                self._path = entry['path']
+            else:
+                logger.spam("Checking for helper executable %s", self.name)
+                self._path = distutils.spawn.find_executable(self.name)
+                if HelperRegistry.shared():
+                    # Record failure to find it too, so that we needn't
+                    # search again until something in $PATH changes
+                    HelperRegistry.shared().record(self.name, self._path)
             if self._path:
                 logger.debug("%s is at %s", self.name, self.path)
                 self._installed = True
@@ -249,6 +272,10 @@ class Helper(object):
     def version(self):
         """Release version of the associated helper program."""
         if self.installed and not self._version:
+            entry = self._registry_entry()
+            if entry and entry['version']:
+                self._version = StrictVersion(entry['version'])
+                return self._version
             output = self.call(self._version_args, require_success=False)
             match = re.search(self._version_regexp, output)
             if not match:
@@ -258,8 +285,63 @@ class Helper(object):
                                               ' '.join(self._version_args),
                                               output))
             self._version = StrictVersion(match.group(1))
+            if HelperRegistry.shared():
+                HelperRegistry.shared().record(self.name, self.path,
+                                               str(self._version),
+                                               self.capabilities)
         return self._version
 
+    @property
+    def capabilities(self):
+        """Capability flags of the installed version of this helper.
+
+        Returns:
+          dict: Mapping of capability name to boolean, such as
+          ``{'vmdk_stream_optimized_v3': True}`` for QEMU 2.5.1 and later.
+          Empty if the helper isn't installed.
+        """
+        if not self.installed:
+            return {}
+        return dict((name, self.version >= StrictVersion(min_version))
+                    for name, min_version in
+                    self._capability_versions.items())
+
+    def refresh(self):
+        """Forget the previously discovered path and version of this helper.
+
+        They will be rediscovered (and the :class:`HelperRegistry` updated)
+        on next access.
+        """
+        self._path = None
+        self._installed = None
+        self._version = None
+
+    def cache_files(self, args):
+        """Get the files whose state determines the output of the given call.
+
+        This is used to decide whether, and under what key, the output of
+        :meth:`call` can be stored in the shared
+        :class:`~COT.helpers.cache.HelperCache`. The default implementation
+        caches only the version query (which depends only on the helper
+        executable itself); subclasses should extend this for any other
+        commands whose output depends solely on the contents of the given
+        files, typically along the lines of::
+
+            if args[0] == 'info':
+                return [args[-1]]
+            return super(MyHelper, self).cache_files(args)
+
+        Args:
+          args (tuple): Arguments to the helper program.
+
+        Returns:
+          list: Paths of files the output depends on (possibly empty),
+          or None if the output of this call should not be cached.
+        """
+        if list(args) == list(self._version_args):
+            return [self.path]
+        return None
+
     def call(self, args,
              capture_output=True,
              use_cached=True,
@@ -273,22 +355,12 @@ class Helper(object):
             to the user. (I.e., :func:`check_output` will be invoked
             instead of :func:`check_call`)
           use_cached (boolean): If ``True``, and ``capture_output`` is also
-             ``True``, then if there is an entry in :attr:`cached_output`
-             for the given ``args``, just return that entry instead of
-             calling the helper again.
+             ``True``, then if the shared
+             :class:`~COT.helpers.cache.HelperCache` has an entry for the
+             given ``args`` (see :meth:`cache_files`), just return that
+             entry instead of calling the helper again.
              Ignored if ``capture_output`` is ``False``.
 
-        .. note::
-          By default no captured output is cached (as it may not necessarily
-          be appropriate to cache the output of many commands.) Subclasses
-          that wish to cache output of certain calls should wrap this method
-          with the appropriate logic, typically along the lines of::
-
-              output = super(MyHelper, self).call(args, *kwargs)
-              if output and args[0] == 'info':
-                  self.cached_output[args] = output
-              return output
-
         Returns:
           str: Captured stdout/stderr if :attr:`capture_output` is True,
           else ``None``.
@@ -310,25 +382,28 @@ class Helper(object):
                     "Please install it and/or check your $PATH."
                     .format(self.name))
             self.install()
-        # Force args to be a tuple if it was a list,
-        # as tuple is hashable for the cache and list is not.
         args = tuple(args)
         call_args = [self.name] + list(args)
-        if capture_output:
-            if use_cached and args in self.cached_output:
-                logger.debug("Returning cached output of '%s'",
-                             " ".join(call_args))
-                logger.spam("Cached output:\n%s",
-                            self.cached_output[args])
-                return self.cached_output[args]
-            # Default implementation does not cache any output.
-            # Subclasses should wrap this method if they want to
-            # cache output from specific commands.
-            return check_output(call_args, **kwargs)
-        else:
+        if not capture_output:
             check_call(call_args, **kwargs)
             return None
 
+        cache = HelperCache.shared()
+        files = self.cache_files(args)
+        key = None if files is None else cache.key(self.name, args, files)
+        if use_cached and key is not None:
+            output = cache.lookup(key)
+            if output is not None:
+                logger.debug("Returning cached output of '%s'",
+                             " ".join(call_args))
+                logger.spam("Cached output:\n%s", output)
+                return output
+        output = check_output(call_args, **kwargs)
+        if output:
+            # Output that depends only on the helper itself may be persisted
+            cache.store(key, output, persistent=(files == [self.path]))
+        return output
+
     def install(self):
         """Install the helper program.
 
@@ -490,7 +565,7 @@ class Helper(object):
         """
         logger.debug("Copying %s to %s", src, dest)
         try:
-            shutil.copy(src, dest)
+            materialize(src, dest)
         except (OSError, IOError) as exc:
             logger.debug('Installation error, trying sudo.')
             try:
@@ -41,18 +41,19 @@ class ISOInfo(Helper):
             info_uri="http://cdrecord.org",
             version_regexp=r"isoinfo ([0-9.]+)")
 
-    def call(self, args, **kwargs):
-        """Call isoinfo with the given arguments.
+    def cache_files(self, args):
+        """Get the files whose state determines the output of the given call.
 
-        Caches the output of:
+        The output of these commands is cached to save time:
 
         - ``isoinfo -i FILE -d`` (volume descriptior info)
         - ``isoinfo -i FILE -f`` (``find . -print`` equivalent)
         - ``isoinfo -i FILE -l`` (``ls -lR`` equivalent)
 
-        For the parameters, see :meth:`COT.helpers.helper.Helper.call` etc.
+        For the parameters, see
+        :meth:`COT.helpers.helper.Helper.cache_files`.
         """
-        output = super(ISOInfo, self).call(args, **kwargs)
-        if output and ('-d' in args or '-f' in args or '-l' in args):
-            self.cached_output[tuple(args)] = output
-        return output
+        if ('-i' in args[:-1] and
+                ('-d' in args or '-f' in args or '-l' in args)):
+            return [args[args.index('-i') + 1]]
+        return super(ISOInfo, self).cache_files(args)
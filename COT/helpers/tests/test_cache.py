@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# test_cache.py - Unit test cases for COT helper output cache and registry
+#
+# October 2026, the COT project developers.
+# Copyright (c) 2026 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.helpers.cache module."""
+
+import os
+import shutil
+import time
+from distutils.version import StrictVersion
+
+import mock
+
+from COT.tests import COTTestCase
+from COT.helpers.cache import HelperCache, HelperRegistry
+from COT.helpers.qemu_img import QEMUImg
+
+# pylint: disable=missing-type-doc,missing-param-doc,protected-access
+
+
+class TestHelperCache(COTTestCase):
+    """Test cases for HelperCache class."""
+
+    def setUp(self):
+        """Test case setup function called automatically before each test."""
+        super(TestHelperCache, self).setUp()
+        self.cache_home = os.path.join(self.temp_dir, "cache")
+        self.env_patcher = mock.patch.dict(os.environ,
+                                           {'XDG_CACHE_HOME': self.cache_home})
+        self.env_patcher.start()
+
+    def tearDown(self):
+        """Test case cleanup function called automatically after each test."""
+        self.env_patcher.stop()
+        super(TestHelperCache, self).tearDown()
+
+    def test_shared(self):
+        """Test the shared instance and its default location."""
+        cache = HelperCache.shared()
+        self.assertIsNone(cache.path)
+        self.assertIs(cache, HelperCache.shared())
+
+        HelperCache.PERSISTENT = True
+        cache = HelperCache.shared()
+        self.assertEqual(cache.path, os.path.join(self.cache_home, "cot",
+                                                  "helper_output.json"))
+        self.assertIs(cache, HelperCache.shared())
+
+    def test_key(self):
+        """Keys change whenever a file they depend on changes."""
+        path = os.path.join(self.temp_dir, "foo.img")
+        shutil.copy(self.input_iso, path)
+        key = HelperCache.key("foo", ("info", path), [path])
+        self.assertEqual(key, HelperCache.key("foo", ("info", path), [path]))
+        self.assertNotEqual(key, HelperCache.key("foo", ("-d", path), [path]))
+        self.assertNotEqual(key, HelperCache.key("bar", ("info", path),
+                                                 [path]))
+
+        # Rewriting a file in place, even with the same size, invalidates it
+        stat = os.stat(path)
+        with open(path, 'r+b') as fileobj:
+            fileobj.write(b"hello")
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        self.assertNotEqual(key, HelperCache.key("foo", ("info", path),
+                                                 [path]))
+
+        self.assertIsNone(HelperCache.key("foo", (), [path + ".missing"]))
+        self.assertIsNone(HelperCache.key("foo", (), [None]))
+
+    def test_lru(self):
+        """Least recently used entries are evicted."""
+        cache = HelperCache()
+        self.assertIsNone(cache.lookup("foo"))
+        self.assertIsNone(cache.lookup(None))
+        with mock.patch.object(HelperCache, 'MAX_ENTRIES', 2):
+            cache.store("foo", "1")
+            cache.store("bar", "2")
+            self.assertEqual(cache.lookup("foo"), "1")
+            cache.store("baz", "3")
+        self.assertEqual(cache.lookup("foo"), "1")
+        self.assertIsNone(cache.lookup("bar"))
+        self.assertEqual(cache.lookup("baz"), "3")
+        cache.store(None, "4")
+
+        cache.clear()
+        self.assertIsNone(cache.lookup("foo"))
+
+    def test_persistent(self):
+        """Only persistent entries are kept across instances."""
+        path = os.path.join(self.cache_home, "cot", "helper_output.json")
+        cache = HelperCache(path)
+        cache.store("foo", "1", persistent=True)
+        cache.store("bar", "2")
+        self.assertTrue(os.path.exists(path))
+
+        cache = HelperCache(path)
+        self.assertEqual(cache.lookup("foo"), "1")
+        self.assertIsNone(cache.lookup("bar"))
+
+        cache.clear()
+        self.assertIsNone(HelperCache(path).lookup("foo"))
+
+    def test_persistent_unusable(self):
+        """An unusable persistent file is silently treated as empty."""
+        path = os.path.join(self.temp_dir, "helper_output.json")
+        with open(path, 'w') as fileobj:
+            fileobj.write("{not json")
+        cache = HelperCache(path)
+        self.assertIsNone(cache.lookup("foo"))
+        # Can't create a file underneath a regular file
+        cache = HelperCache(os.path.join(path, "helper_output.json"))
+        cache.store("foo", "1", persistent=True)
+        self.assertEqual(cache.lookup("foo"), "1")
+        self.assertIsNone(HelperCache(cache.path).lookup("foo"))
+
+    @mock.patch('COT.helpers.helper.check_output')
+    def test_helper_call(self, mock_check_output):
+        """Helper output is cached until the file changes."""
+        path = os.path.join(self.temp_dir, "foo.img")
+        shutil.copy(self.input_iso, path)
+        helper = QEMUImg()
+        helper._installed = True
+        helper._path = "/usr/bin/qemu-img"
+        mock_check_output.return_value = "virtual size: 1.0M (1048576 bytes)"
+
+        self.assertEqual(helper.call(['info', path]),
+                         mock_check_output.return_value)
+        self.assertEqual(helper.call(['info', path]),
+                         mock_check_output.return_value)
+        mock_check_output.assert_called_once()
+
+        # Separate instances share the cache
+        helper2 = QEMUImg()
+        helper2._installed = True
+        self.assertEqual(helper2.call(['info', path]),
+                         mock_check_output.return_value)
+        mock_check_output.assert_called_once()
+
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        mock_check_output.return_value = "virtual size: 2.0M (2097152 bytes)"
+        self.assertEqual(helper.call(['info', path]),
+                         mock_check_output.return_value)
+        self.assertEqual(mock_check_output.call_count, 2)
+
+        # Other commands are not cached
+        helper.call(['check', path])
+        helper.call(['check', path])
+        self.assertEqual(mock_check_output.call_count, 4)
+
+
+class TestHelperRegistry(COTTestCase):
+    """Test cases for HelperRegistry class."""
+
+    def setUp(self):
+        """Test case setup function called automatically before each test."""
+        super(TestHelperRegistry, self).setUp()
+        self.cache_home = os.path.join(self.temp_dir, "cache")
+        self.bin_dir = os.path.join(self.temp_dir, "bin")
+        os.makedirs(self.bin_dir)
+        self.executable = os.path.join(self.bin_dir, "qemu-img")
+        with open(self.executable, 'w') as fileobj:
+            fileobj.write("#!/bin/sh\n")
+        self.env_patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': self.cache_home,
+            'PATH': self.bin_dir,
+        })
+        self.env_patcher.start()
+        self.enabled_patcher = mock.patch.object(HelperRegistry, 'ENABLED',
+                                                 True)
+        self.enabled_patcher.start()
+
+    def tearDown(self):
+        """Test case cleanup function called automatically after each test."""
+        self.enabled_patcher.stop()
+        self.env_patcher.stop()
+        super(TestHelperRegistry, self).tearDown()
+
+    def test_shared(self):
+        """Test the shared instance and its default location."""
+        registry = HelperRegistry.shared()
+        self.assertEqual(registry.path, os.path.join(self.cache_home, "cot",
+                                                     "helpers.json"))
+        self.assertIs(registry, HelperRegistry.shared())
+
+        HelperRegistry.ENABLED = False
+        self.assertIsNone(HelperRegistry.shared())
+
+    def test_lookup_record(self):
+        """Entries persist until the executable or $PATH changes."""
+        registry = HelperRegistry.shared()
+        self.assertIsNone(registry.lookup("qemu-img"))
+        registry.record("qemu-img", self.executable, "2.5.1", {'foo': True})
+        registry.record("vmdktool", "/foo/bar/vmdktool")
+
+        entry = HelperRegistry(registry.path).lookup("qemu-img")
+        self.assertEqual(entry['path'], self.executable)
+        self.assertEqual(entry['version'], "2.5.1")
+        self.assertEqual(entry['capabilities'], {'foo': True})
+        # Can't record a nonexistent executable
+        self.assertIsNone(registry.lookup("vmdktool"))
+
+        with mock.patch.dict(os.environ, {'PATH': "/usr/bin"}):
+            self.assertIsNone(registry.lookup("qemu-img"))
+
+        old = time.time() - 60
+        os.utime(self.executable, (old, old))
+        self.assertIsNone(registry.lookup("qemu-img"))
+
+        registry.record("qemu-img", self.executable)
+        registry.clear()
+        self.assertIsNone(HelperRegistry(registry.path).lookup("qemu-img"))
+
+    @mock.patch('COT.helpers.helper.check_output',
+                return_value="qemu-img version 2.5.1, Copyright (c) 2004")
+    @mock.patch('distutils.spawn.find_executable')
+    def test_helper(self, mock_find_executable, mock_check_output):
+        """Helper path and version are looked up in the registry."""
+        mock_find_executable.return_value = self.executable
+        helper = QEMUImg()
+        self.assertEqual(helper.path, self.executable)
+        self.assertEqual(helper.version, StrictVersion("2.5.1"))
+        self.assertTrue(helper.capabilities['vmdk_stream_optimized_v3'])
+        mock_find_executable.assert_called_once_with("qemu-img")
+        mock_check_output.assert_called_once()
+
+        entry = HelperRegistry.shared().lookup("qemu-img")
+        self.assertEqual(entry['version'], "2.5.1")
+        self.assertEqual(entry['capabilities'], helper.capabilities)
+
+        # A new instance (as in a new COT invocation) needn't rediscover
+        mock_find_executable.reset_mock()
+        mock_check_output.reset_mock()
+        HelperCache.shared().clear()
+        helper = QEMUImg()
+        self.assertEqual(helper.path, self.executable)
+        self.assertEqual(helper.version, StrictVersion("2.5.1"))
+        mock_find_executable.assert_not_called()
+        mock_check_output.assert_not_called()
+
+        # ...unless refreshed after the registry is cleared
+        HelperRegistry.shared().clear()
+        helper.refresh()
+        self.assertEqual(helper.version, StrictVersion("2.5.1"))
+        mock_find_executable.assert_called_once_with("qemu-img")
+        mock_check_output.assert_called_once()
+
+    @mock.patch('distutils.spawn.find_executable', return_value=None)
+    def test_helper_missing(self, mock_find_executable):
+        """Helpers that aren't found are remembered until $PATH changes."""
+        self.assertIsNone(QEMUImg().path)
+        mock_find_executable.assert_called_once_with("qemu-img")
+        entry = HelperRegistry.shared().lookup("qemu-img")
+        self.assertIsNone(entry['path'])
+
+        # A new instance (as in a new COT invocation) needn't search again
+        mock_find_executable.reset_mock()
+        helper = QEMUImg()
+        self.assertIsNone(helper.path)
+        self.assertFalse(helper.installed)
+        mock_find_executable.assert_not_called()
+
+        # Installing something in one of the $PATH directories, or changing
+        # $PATH itself, invalidates the entry
+        with open(os.path.join(self.bin_dir, "vmdktool"), 'w') as fileobj:
+            fileobj.write("#!/bin/sh\n")
+        old = time.time() - 60
+        os.utime(self.bin_dir, (old, old))
+        self.assertIsNone(HelperRegistry.shared().lookup("qemu-img"))
+        self.assertIsNone(QEMUImg().path)
+        mock_find_executable.assert_called_once_with("qemu-img")
+        self.assertIsNotNone(HelperRegistry.shared().lookup("qemu-img"))
+        with mock.patch.dict(os.environ, {'PATH': "/usr/bin"}):
+            self.assertIsNone(HelperRegistry.shared().lookup("qemu-img"))
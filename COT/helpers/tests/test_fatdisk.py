@@ -64,7 +64,7 @@ class TestFatDisk(HelperTestCase):
     @mock.patch('os.path.exists', return_value=False)
     @mock.patch('os.makedirs', side_effect=OSError)
     @mock.patch('distutils.spawn.find_executable', return_value="/foo")
-    @mock.patch('shutil.copy', return_value=True)
+    @mock.patch('COT.helpers.helper.materialize', return_value='copy')
     @mock.patch('COT.helpers.helper.check_output', return_value="")
     @mock.patch('subprocess.check_call')
     def test_install_apt_get(self,
@@ -138,7 +138,7 @@ class TestFatDisk(HelperTestCase):
     @mock.patch('os.path.exists', return_value=False)
     @mock.patch('os.makedirs', side_effect=OSError)
     @mock.patch('distutils.spawn.find_executable', return_value='/foo')
-    @mock.patch('shutil.copy', return_value=True)
+    @mock.patch('COT.helpers.helper.materialize', return_value='copy')
     @mock.patch('subprocess.check_call')
     def test_install_yum(self,
                          mock_check_call,
@@ -522,7 +522,7 @@ class TestHelperMkDir(COTTestCase):
 
 
 @mock.patch('COT.helpers.helper.check_call')
-@mock.patch('shutil.copy')
+@mock.patch('COT.helpers.helper.materialize')
 class TestHelperCopyFile(COTTestCase):
     """Test cases for Helper.copy_file()."""
 
@@ -21,6 +21,7 @@ from distutils.version import StrictVersion
 import mock
 
 from COT.helpers.tests.test_helper import HelperTestCase
+from COT.helpers.cache import HelperCache
 from COT.helpers.isoinfo import ISOInfo
 
 logger = logging.getLogger(__name__)
@@ -63,7 +64,8 @@ d---------   0    0    0  2048 Dec 12 2012 [   23 02] ..
         args = ('-i', self.input_iso, '-l')
         output = self.helper.call(args)
         # Output should be stored in the cache
-        self.assertEqual(output, self.helper.cached_output[args])
+        self.assertEqual(output, HelperCache.shared().lookup(
+            HelperCache.key('isoinfo', args, [self.input_iso])))
         mock_check_output.assert_called_once()
 
         mock_check_output.reset_mock()
@@ -84,4 +86,5 @@ d---------   0    0    0  2048 Dec 12 2012 [   23 02] ..
         # Call is a no-op but succeeds. Nothing to cache
         self.helper._installed = True
         self.helper.call(['-i', self.input_iso])
-        self.assertDictEqual(self.helper.cached_output, {})
+        self.assertIsNone(self.helper.cache_files(('-i', self.input_iso)))
+        self.assertEqual(HelperCache.shared()._entries, {})
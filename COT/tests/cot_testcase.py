@@ -30,8 +30,11 @@ from logging.handlers import BufferingHandler
 # Make sure there's always a "no-op" logging handler.
 from logging import NullHandler
 
+import mock
 from pkg_resources import resource_filename
 
+from COT.checksum_cache import ChecksumCache
+from COT.helpers.cache import HelperCache, HelperRegistry
 from COT.helpers import helpers, HelperError
 
 try:
@@ -344,6 +347,13 @@ class COTTestCase(unittest.TestCase):  # noqa: N801
 
         self.validate_output_with_ovftool = True
 
+        # Don't let the user's persistent caches affect our tests
+        for patcher in [mock.patch.object(ChecksumCache, 'ENABLED', False),
+                        mock.patch.object(HelperCache, 'PERSISTENT', False),
+                        mock.patch.object(HelperRegistry, 'ENABLED', False)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
     def tearDown(self):
         """Test case cleanup function called automatically after each test."""
         # Fail if any WARNING/ERROR/CRITICAL logs were generated
@@ -366,9 +376,8 @@ class COTTestCase(unittest.TestCase):  # noqa: N801
             self.fail("Temp directory(s) {0} left over after test!"
                       .format(delta))
 
-        # Clear output caches for helper commands:
-        for helper in helpers.values():
-            helper.cached_output.clear()
+        # Clear output cache for helper commands:
+        HelperCache.shared().clear()
 
         # Let's try to keep things lean...
         delta_t = time.time() - self.start_time
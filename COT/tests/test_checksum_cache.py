@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+#
+# test_checksum_cache.py - Unit test cases for COT persistent checksum cache
+#
+# October 2026, the COT project developers.
+# Copyright (c) 2026 the COT project developers.
+# See the COPYRIGHT.txt file at the top-level directory of this distribution
+# and at https://github.com/glennmatthews/cot/blob/master/COPYRIGHT.txt.
+#
+# This file is part of the Common OVF Tool (COT) project.
+# It is subject to the license terms in the LICENSE.txt file found in the
+# top-level directory of this distribution and at
+# https://github.com/glennmatthews/cot/blob/master/LICENSE.txt. No part
+# of COT, including this file, may be copied, modified, propagated, or
+# distributed except according to the terms contained in the LICENSE.txt file.
+
+"""Unit test cases for COT.checksum_cache module."""
+
+import os
+import shutil
+import time
+
+import mock
+from pkg_resources import resource_filename
+
+from COT.tests import COTTestCase
+from COT.checksum_cache import ChecksumCache
+from COT.data_validation import file_checksum
+from COT.file_reference import FileReference
+
+
+class TestChecksumCache(COTTestCase):
+    """Test cases for ChecksumCache class."""
+
+    def setUp(self):
+        """Test case setup function called automatically before each test."""
+        super(TestChecksumCache, self).setUp()
+        self.cache_home = os.path.join(self.temp_dir, "cache")
+        self.env_patcher = mock.patch.dict(os.environ,
+                                           {'XDG_CACHE_HOME': self.cache_home})
+        self.env_patcher.start()
+        self.enabled_patcher = mock.patch.object(ChecksumCache, 'ENABLED',
+                                                 True)
+        self.enabled_patcher.start()
+        ChecksumCache._shared = None
+
+    def tearDown(self):
+        """Test case cleanup function called automatically after each test."""
+        ChecksumCache._shared = None
+        self.enabled_patcher.stop()
+        self.env_patcher.stop()
+        super(TestChecksumCache, self).tearDown()
+
+    def make_old_copy(self, path):
+        """Copy the given file to the temp dir and backdate its mtime.
+
+        Args:
+          path (str): File to copy
+        Returns:
+          str: Path to the copy.
+        """
+        dest = os.path.join(self.temp_dir, os.path.basename(path))
+        shutil.copy(path, dest)
+        old = time.time() - 60
+        os.utime(dest, (old, old))
+        return dest
+
+    def test_shared(self):
+        """Test the shared instance and its default location."""
+        cache = ChecksumCache.shared()
+        self.assertEqual(cache.path, os.path.join(self.cache_home, "cot",
+                                                  "checksums.sqlite"))
+        self.assertTrue(os.path.exists(cache.path))
+        self.assertIs(cache, ChecksumCache.shared())
+
+        ChecksumCache.ENABLED = False
+        self.assertIsNone(ChecksumCache.shared())
+
+    def test_store_lookup(self):
+        """Test storing, retrieving, and clearing of checksums."""
+        cache = ChecksumCache.shared()
+        self.assertIsNone(cache.lookup("foo", "sha1"))
+        cache.store("foo", "sha1", "1234")
+        cache.store("foo", "sha256", "abcd")
+        self.assertEqual(cache.lookup("foo", "sha1"), "1234")
+        self.assertEqual(cache.lookup("foo", "sha256"), "abcd")
+        self.assertIsNone(cache.lookup("bar", "sha1"))
+        self.assertIsNone(cache.lookup(None, "sha1"))
+
+        # Persistent across instances
+        self.assertEqual(ChecksumCache(cache.path).lookup("foo", "sha1"),
+                         "1234")
+
+        cache.clear()
+        self.assertIsNone(cache.lookup("foo", "sha1"))
+
+    def test_evict(self):
+        """Test eviction of least recently used entries."""
+        cache = ChecksumCache.shared()
+        now = time.time()
+        with mock.patch.object(ChecksumCache, 'MAX_ENTRIES', 2):
+            with mock.patch('time.time', return_value=now - 4):
+                cache.store("foo", "sha1", "1")
+            with mock.patch('time.time', return_value=now - 3):
+                cache.store("bar", "sha1", "2")
+            with mock.patch('time.time', return_value=now - 2):
+                cache.store("baz", "sha1", "3")
+            with mock.patch('time.time', return_value=now - 1):
+                self.assertEqual(cache.lookup("foo", "sha1"), "1")
+            cache.evict()
+        self.assertEqual(cache.lookup("foo", "sha1"), "1")
+        self.assertIsNone(cache.lookup("bar", "sha1"))
+        self.assertEqual(cache.lookup("baz", "sha1"), "3")
+
+        # Stale entries are discarded too
+        with mock.patch('time.time',
+                        return_value=now + ChecksumCache.MAX_AGE + 1):
+            cache.evict()
+        self.assertIsNone(cache.lookup("foo", "sha1"))
+
+    def test_unusable(self):
+        """An unusable cache location is silently treated as empty."""
+        # Can't create a directory underneath a regular file
+        cache = ChecksumCache(os.path.join(self.input_ovf, "checksums"))
+        cache.store("foo", "sha1", "1234")
+        self.assertIsNone(cache.lookup("foo", "sha1"))
+
+    def test_file_key(self):
+        """Test cache key construction for files."""
+        # Recently modified files are not cacheable
+        path = os.path.join(self.temp_dir, "file.txt")
+        with open(path, 'w') as fileobj:
+            fileobj.write("hello")
+        self.assertIsNone(ChecksumCache.file_key(path))
+        self.assertIsNone(ChecksumCache.file_key(path + ".nonexistent"))
+
+        path = self.make_old_copy(self.input_ovf)
+        key = ChecksumCache.file_key(path)
+        self.assertNotEqual(key, None)
+        self.assertEqual(key, ChecksumCache.file_key(path))
+        self.assertNotEqual(key, ChecksumCache.file_key(path, 512))
+
+        os.utime(path, (time.time() - 30, time.time() - 30))
+        self.assertNotEqual(key, ChecksumCache.file_key(path))
+
+    def test_file_on_disk(self):
+        """FileOnDisk checksums are cached across instances."""
+        path = self.make_old_copy(self.input_ovf)
+        ref = FileReference.create(self.temp_dir, os.path.basename(path),
+                                   checksum_algorithm='sha1')
+        self.assertEqual(ref.checksum, file_checksum(path, 'sha1'))
+
+        with mock.patch('COT.file_reference.file_checksums') as mock_cksum:
+            ref = FileReference.create(self.temp_dir, os.path.basename(path),
+                                       checksum_algorithm='sha1')
+            self.assertEqual(ref.checksum, file_checksum(path, 'sha1'))
+            mock_cksum.assert_not_called()
+
+            # Cache not used if disabled
+            ChecksumCache.ENABLED = False
+            mock_cksum.return_value = {'sha1': 'xyz'}
+            ref = FileReference.create(self.temp_dir, os.path.basename(path),
+                                       checksum_algorithm='sha1')
+            self.assertEqual(ref.checksum, 'xyz')
+
+    def test_file_in_tar(self):
+        """FileInTAR checksums are cached per member."""
+        tar = self.make_old_copy(resource_filename(__name__, "test.tar"))
+        ref = FileReference.create(tar, "sample_cfg.txt",
+                                   checksum_algorithm='sha1')
+        self.assertEqual(ref.checksum, file_checksum(self.sample_cfg, 'sha1'))
+
+        with mock.patch('COT.file_reference.file_checksums') as mock_cksum:
+            ref = FileReference.create(tar, "sample_cfg.txt",
+                                       checksum_algorithm='sha1')
+            self.assertEqual(ref.checksum,
+                             file_checksum(self.sample_cfg, 'sha1'))
+            mock_cksum.assert_not_called()
+
+            mock_cksum.return_value = {'sha256': 'xyz'}
+            ref = FileReference.create(tar, "sample_cfg.txt",
+                                       checksum_algorithm='sha256')
+            self.assertEqual(ref.checksum, 'xyz')
+            mock_cksum.assert_called_once_with(mock.ANY, ['sha256'])
@@ -19,7 +19,7 @@
 import re
 
 from COT.data_validation import (
-    match_or_die, file_checksum,
+    match_or_die, file_checksum, file_checksums,
     canonicalize_helper, canonicalize_nic_subtype, NIC_TYPES,
     mac_address, device_address, no_whitespace, truth_value,
     validate_int, non_negative_int, positive_int,
@@ -61,6 +61,19 @@ class TestFileChecksum(COTTestCase):
                           self.input_ovf,
                           'crc')
 
+    def test_file_checksums(self):
+        """Test computing multiple checksums in a single pass."""
+        checksums = file_checksums(self.input_ovf, ['sha1', 'md5'])
+        self.assertEqual(checksums, {
+            'md5': "4e7a3ba0b70f6784a3a91b18336296c7",
+            'sha1': "c3bd2579c2edc76ea35b5bde7d4f4e41eab08963",
+        })
+        self.assertEqual(file_checksums(self.input_ovf, []), {})
+        self.assertRaises(NotImplementedError,
+                          file_checksums,
+                          self.input_ovf,
+                          ['sha1', 'crc'])
+
 
 class TestValidationFunctions(COTTestCase):
     """Test cases for input validation APIs."""
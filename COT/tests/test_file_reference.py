@@ -16,13 +16,22 @@
 
 """Unit test cases for COT.file_reference classes."""
 
+import errno
+import io
+import logging
 import os
+import shutil
 import tarfile
 
+import mock
 from pkg_resources import resource_filename
 
 from COT.tests import COTTestCase
-from COT.file_reference import FileReference, FileOnDisk, FileInTAR
+from COT.data_validation import file_checksum, ValueUnsupportedError
+from COT.file_reference import (
+    FileReference, FileOnDisk, FileInTAR, TarIndex, TarWriter,
+    materialize, shares_storage,
+)
 
 
 class TestFileReference(COTTestCase):
@@ -59,6 +68,108 @@ class TestFileReference(COTTestCase):
         self.assertRaises(NotImplementedError, FileReference.create,
                           self.input_vmdk, "config.txt")
 
+    def test_compute_checksums(self):
+        """Test concurrent computation of checksums of multiple files."""
+        refs = [FileReference.create(os.path.dirname(self.input_ovf),
+                                     os.path.basename(self.input_ovf),
+                                     checksum_algorithm='sha1'),
+                FileReference.create(resource_filename(__name__, "test.tar"),
+                                     "sample_cfg.txt",
+                                     checksum_algorithm='sha1')]
+        FileReference.compute_checksums(refs, ['sha1', 'sha256'])
+        self.assertEqual(refs[0].checksum,
+                         file_checksum(self.input_ovf, 'sha1'))
+        self.assertEqual(refs[1].checksum,
+                         file_checksum(self.sample_cfg, 'sha1'))
+        # Both checksums were computed in one pass, no need to re-read
+        with mock.patch.object(FileOnDisk, 'open') as mock_open:
+            FileReference.compute_checksums(refs, ['sha256'])
+            mock_open.assert_not_called()
+
+    def test_deferred_verification(self):
+        """Test verify='off' and check_checksum()."""
+        ref = FileReference.create(os.path.dirname(self.input_ovf),
+                                   os.path.basename(self.input_ovf),
+                                   checksum_algorithm='sha1',
+                                   expected_checksum='0123456789',
+                                   verify='off')
+        self.assertNoLogsOver(logging.WARNING)
+        self.assertFalse(ref.check_checksum())
+        self.assertLogged(levelname='ERROR',
+                          msg="The %s checksum for file '%s' is expected")
+
+    def test_lazy_verification(self):
+        """Test that verify='lazy' only checks the checksum upon use."""
+        ref = FileReference.create(resource_filename(__name__, "test.tar"),
+                                   "sample_cfg.txt",
+                                   checksum_algorithm='sha1',
+                                   expected_checksum='0123456789',
+                                   verify='lazy')
+        self.assertNoLogsOver(logging.WARNING)
+        ref.copy_to(self.temp_dir)
+        self.assertLogged(levelname='ERROR',
+                          msg="The %s checksum for file '%s' is expected")
+        # Only verified once
+        with ref.open('rb'):
+            pass
+        self.assertNoLogsOver(logging.WARNING)
+
+        self.assertRaises(ValueUnsupportedError, FileReference.create,
+                          os.path.dirname(self.input_ovf),
+                          os.path.basename(self.input_ovf),
+                          verify='sometimes')
+
+    def test_manifest_checksum(self):
+        """Test reuse of an expected checksum for an unchanged file."""
+        tarfile_path = resource_filename(__name__, "test.tar")
+        sha1 = file_checksum(self.sample_cfg, 'sha1')
+        ref = FileReference.create(tarfile_path, "sample_cfg.txt",
+                                   checksum_algorithm='sha1',
+                                   expected_checksum=sha1,
+                                   verify='lazy')
+        with mock.patch('COT.file_reference.file_checksums') as mock_cksum:
+            FileReference.compute_checksums([ref], reuse_expected=True)
+            self.assertEqual(ref.manifest_checksum, sha1)
+            mock_cksum.assert_not_called()
+
+        # An expected checksum of the wrong length is not reused
+        ref = FileReference.create(tarfile_path, "sample_cfg.txt",
+                                   checksum_algorithm='sha1',
+                                   expected_checksum='0123456789',
+                                   verify='off')
+        self.assertEqual(ref.manifest_checksum, sha1)
+
+        # Neither is the checksum of a modified file
+        shutil.copy(self.sample_cfg, self.temp_dir)
+        ref = FileReference.create(self.temp_dir, "sample_cfg.txt",
+                                   checksum_algorithm='sha1',
+                                   expected_checksum=sha1,
+                                   verify='off')
+        with open(os.path.join(self.temp_dir, 'sample_cfg.txt'), 'a') as obj:
+            obj.write("hello\n")
+        self.assertNotEqual(ref.manifest_checksum, sha1)
+
+    def test_refresh_all(self):
+        """Test refreshing multiple references at once."""
+        shutil.copy(self.input_ovf, self.temp_dir)
+        shutil.copy(self.sample_cfg, self.temp_dir)
+        refs = [FileOnDisk(self.temp_dir, 'input.ovf',
+                           checksum_algorithm='sha1'),
+                FileOnDisk(self.temp_dir, 'sample_cfg.txt',
+                           checksum_algorithm='sha1')]
+        FileReference.compute_checksums(refs)
+        # Unchanged files aren't rehashed
+        with mock.patch('COT.file_reference.file_checksums') as mock_cksum:
+            self.assertEqual(FileReference.refresh_all(refs), [True, True])
+            mock_cksum.assert_not_called()
+        with open(os.path.join(self.temp_dir, 'sample_cfg.txt'), 'a') as obj:
+            obj.write("hello\n")
+        self.assertEqual(FileReference.refresh_all(refs), [True, False])
+        self.assertLogged(levelname='WARNING',
+                          msg="Size of file '%s' has changed")
+        self.assertLogged(levelname='ERROR',
+                          msg="The %s checksum of file '%s' has changed")
+
 
 class TestFileOnDisk(COTTestCase):
     """Test cases for FileOnDisk class."""
@@ -181,6 +292,36 @@ class TestFileInTAR(COTTestCase):
                         file1=resource_filename(__name__, 'sample_cfg.txt'),
                         file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
 
+    def test_copy_to_mode(self):
+        """copy_to() preserves the permissions recorded in the archive."""
+        for mode in ['w', 'w:gz']:
+            tarfile_path = os.path.join(self.temp_dir, "mode.tar")
+            with tarfile.open(tarfile_path, mode) as tarf:
+                tarinfo = tarf.gettarinfo(self.input_ovf, "input.ovf")
+                tarinfo.mode = 0o664
+                with open(self.input_ovf, 'rb') as obj:
+                    tarf.addfile(tarinfo, obj)
+            output_dir = os.path.join(self.temp_dir, mode.replace(':', ''))
+            os.makedirs(output_dir)
+            FileInTAR(tarfile_path, "input.ovf").copy_to(output_dir)
+            output_path = os.path.join(output_dir, "input.ovf")
+            self.assertEqual(os.stat(output_path).st_mode & 0o777, 0o664)
+            self.assertEqual(int(os.path.getmtime(output_path)),
+                             tarinfo.mtime)
+
+    def test_member_removed(self):
+        """Operations on a file no longer in the archive raise KeyError."""
+        tarfile_path = os.path.join(self.temp_dir, "test.tar")
+        shutil.copy(self.tarfile, tarfile_path)
+        ref = FileInTAR(tarfile_path, "sample_cfg.txt")
+        with tarfile.open(tarfile_path, 'w') as tarf:
+            tarf.add(self.input_ovf, "input.ovf")
+        self.assertRaises(KeyError, getattr, ref, "size")
+        self.assertRaises(KeyError, ref.copy_to, self.temp_dir)
+        with tarfile.open(os.path.join(self.temp_dir, "out.tar"),
+                          'w') as tarf:
+            self.assertRaises(KeyError, ref.add_to_archive, tarf)
+
     def test_add_to_archive(self):
         """Test the add_to_archive() API."""
         output_tarfile = os.path.join(self.temp_dir, 'test_output.tar')
@@ -191,3 +332,255 @@ class TestFileInTAR(COTTestCase):
         self.check_diff("",
                         file1=resource_filename(__name__, 'sample_cfg.txt'),
                         file2=os.path.join(self.temp_dir, 'sample_cfg.txt'))
+
+
+class TestTarIndex(COTTestCase):
+    """Test cases for TarIndex class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestTarIndex, self).setUp()
+        self.tarfile = os.path.join(self.temp_dir, "test.tar")
+        shutil.copy(resource_filename(__name__, "test.tar"), self.tarfile)
+
+    def test_shared(self):
+        """All references to the same archive share a single index."""
+        ref1 = FileInTAR(self.tarfile, "sample_cfg.txt")
+        ref2 = FileInTAR(self.tarfile, "input.mf")
+        self.assertIs(ref1.index, ref2.index)
+        self.assertIs(ref1.index, TarIndex.for_path(self.tarfile))
+
+    def test_entries(self):
+        """Member offsets and sizes match what tarfile reports."""
+        index = TarIndex.for_path(self.tarfile)
+        self.assertEqual(index.names, ['input.mf', 'sample_cfg.txt'])
+        with tarfile.open(self.tarfile, 'r') as tarf:
+            for tarinfo in tarf.getmembers():
+                entry = index.lookup(tarinfo.name)
+                self.assertEqual(entry.offset, tarinfo.offset_data)
+                self.assertEqual(entry.size, tarinfo.size)
+        self.assertEqual(index.lookup("./sample_cfg.txt"),
+                         index.lookup("sample_cfg.txt"))
+        self.assertEqual(index.lookup("foo.bar"), None)
+        self.assertFalse(TarIndex.is_tarfile(self.input_ovf))
+
+    def test_open(self):
+        """Member contents are read directly from the archive."""
+        index = TarIndex.for_path(self.tarfile)
+        with index.open("sample_cfg.txt") as obj:
+            with open(resource_filename(__name__, "sample_cfg.txt"),
+                      'rb') as expected:
+                self.assertEqual(obj.read(), expected.read())
+            # Reads must stop at the end of the member data
+            self.assertEqual(obj.read(), b'')
+            obj.seek(2)
+            self.assertEqual(obj.readline(),
+                             b'interface GigabitEthernet0/0/0/0\n')
+        self.assertRaises(KeyError,
+                          lambda: index.open("foo.bar").__enter__())
+
+    @mock.patch('COT.file_reference.TarIndex.MAX_CACHED', 2)
+    def test_cache_bounded(self):
+        """Only the most recently used indexes are kept."""
+        paths = [self.tarfile]
+        for i in range(2):
+            paths.append(os.path.join(self.temp_dir, "{0}.tar".format(i)))
+            shutil.copy(self.tarfile, paths[-1])
+        index = TarIndex.for_path(paths[0])
+        TarIndex.for_path(paths[1])
+        self.assertIs(TarIndex.for_path(paths[0]), index)
+        TarIndex.for_path(paths[2])
+        self.assertEqual(len(TarIndex._indexes), 2)
+        self.assertIs(TarIndex.for_path(paths[0]), index)
+        self.assertNotIn(os.path.realpath(paths[1]), TarIndex._indexes)
+
+    def test_invalidated_on_change(self):
+        """The index is rebuilt if the archive changes on disk."""
+        index = TarIndex.for_path(self.tarfile)
+        with tarfile.open(self.tarfile, 'a') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+        new_index = TarIndex.for_path(self.tarfile)
+        self.assertIsNot(index, new_index)
+        self.assertNotEqual(new_index.lookup('input.ovf'), None)
+
+
+class TestTarWriter(COTTestCase):
+    """Test cases for TarWriter class."""
+
+    def setUp(self):
+        """Test case setup function called automatically prior to each test."""
+        super(TestTarWriter, self).setUp()
+        self.files = [self.input_ovf, self.input_iso, self.sample_cfg]
+        self.expected = os.path.join(self.temp_dir, "expected.tar")
+        with tarfile.open(self.expected, 'w', dereference=True) as tarf:
+            for path in self.files:
+                tarf.add(path, os.path.basename(path))
+        self.output = os.path.join(self.temp_dir, "output.tar")
+
+    def check_output(self):
+        """Make sure the output is identical to that of tarfile."""
+        with open(self.expected, 'rb') as expected:
+            with open(self.output, 'rb') as output:
+                self.assertEqual(output.read(), expected.read())
+
+    def test_add(self):
+        """Add files from disk."""
+        with TarWriter(self.output) as tarf:
+            for path in self.files:
+                tarf.add(path, os.path.basename(path))
+        self.check_output()
+
+    def test_add_from_tar(self):
+        """Copy files directly from one TAR to another."""
+        with TarWriter(self.output) as tarf:
+            for path in self.files:
+                FileInTAR(self.expected,
+                          os.path.basename(path)).add_to_archive(tarf)
+        self.check_output()
+
+    def test_addfile(self):
+        """Add files from file objects."""
+        with TarWriter(self.output) as tarf:
+            for path in self.files:
+                with open(path, 'rb') as obj:
+                    tarf.addfile(tarf.gettarinfo(path,
+                                                 os.path.basename(path)),
+                                 obj)
+        self.check_output()
+        with TarWriter(self.output) as tarf:
+            self.assertRaises(IOError, tarf.addfile,
+                              tarf.gettarinfo(self.input_ovf),
+                              io.BytesIO(b"hello"))
+        self.assertRaises(IOError, TarWriter.gettarinfo, self.temp_dir)
+
+    def test_checksums(self):
+        """Checksums can be computed while adding files."""
+        with TarWriter(self.output) as tarf:
+            for path in self.files:
+                self.assertEqual(
+                    tarf.add(path, os.path.basename(path), ['sha1', 'md5']),
+                    {'sha1': file_checksum(path, 'sha1'),
+                     'md5': file_checksum(path, 'md5')})
+        self.check_output()
+
+    def test_reserve_fill(self):
+        """Space for a file can be reserved and filled in later."""
+        with TarWriter(self.output) as tarf:
+            tarf.add(self.input_ovf, os.path.basename(self.input_ovf))
+            with open(self.input_iso, 'rb') as obj:
+                data = obj.read()
+            offset = tarf.reserve(tarf.gettarinfo(
+                self.input_iso, os.path.basename(self.input_iso)))
+            tarf.add(self.sample_cfg, os.path.basename(self.sample_cfg))
+            self.assertRaises(ValueError, tarf.fill, offset, data[1:])
+            tarf.fill(offset, data)
+        self.check_output()
+
+    def test_fallback(self):
+        """Fall back to a buffered copy if kernel copies are unsupported."""
+        def unsupported(*_):
+            raise OSError(errno.ENOSYS, "Function not implemented")
+
+        with mock.patch('COT.file_reference._ZERO_COPY_METHODS',
+                        [unsupported]):
+            with TarWriter(self.output) as tarf:
+                for path in self.files:
+                    tarf.add(path, os.path.basename(path))
+        self.check_output()
+
+        def failed(*_):
+            raise OSError(errno.EIO, "Input/output error")
+
+        with mock.patch('COT.file_reference._ZERO_COPY_METHODS', [failed]):
+            with TarWriter(self.output) as tarf:
+                self.assertRaises(OSError, tarf.add, self.input_ovf)
+
+    def test_error(self):
+        """No end-of-archive marker is written if an error occurs."""
+        with self.assertRaises(IOError):
+            with TarWriter(self.output) as tarf:
+                tarf.add(self.input_ovf, os.path.basename(self.input_ovf))
+                offset = tarf.offset
+                raise IOError("oops")
+        self.assertTrue(tarf.fileobj.closed)
+        self.assertEqual(os.path.getsize(self.output), offset)
+
+
+@mock.patch('COT.file_reference._reflink_supported', return_value=False)
+class TestMaterialize(COTTestCase):
+    """Test cases for materialize() function."""
+
+    def setUp(self):
+        """Test case setup function called automatically before each test."""
+        super(TestMaterialize, self).setUp()
+        self.src = os.path.join(self.temp_dir, "input.ovf")
+        shutil.copy(self.input_ovf, self.src)
+        self.dest = os.path.join(self.temp_dir, "output")
+        os.mkdir(self.dest)
+        self.dest_file = os.path.join(self.dest, "input.ovf")
+
+    def test_copy(self, _):
+        """A writable file is copied, not linked."""
+        strategy = materialize(self.src, self.dest)
+        self.assertIn(strategy, ['copy_file_range', 'sendfile', 'copy'])
+        self.assertFalse(os.path.samefile(self.src, self.dest_file))
+        self.check_diff("", file2=self.dest_file)
+        self.assertFalse(shares_storage(self.src, self.dest))
+
+    @mock.patch('os.geteuid', return_value=1000)
+    def test_hardlink(self, _, mock_supported):
+        """An immutable file is hardlinked if reflinks are unsupported."""
+        os.chmod(self.src, 0o444)
+        self.assertTrue(shares_storage(self.src, self.dest))
+        self.assertEqual(materialize(self.src, self.dest_file), 'hardlink')
+        self.assertTrue(os.path.samefile(self.src, self.dest_file))
+        self.assertTrue(FileOnDisk(self.temp_dir, "input.ovf")
+                        .shares_storage_with(self.dest))
+
+        # Doing so again leaves the link, and the original, untouched
+        self.assertEqual(materialize(self.src, self.dest), 'hardlink')
+        self.check_diff("", file2=self.src)
+
+        # Existing files are overwritten rather than replaced by a link
+        dest_file = os.path.join(self.temp_dir, "existing.ovf")
+        with open(dest_file, 'w') as fileobj:
+            fileobj.write("hello")
+        self.assertNotEqual(materialize(self.src, dest_file), 'hardlink')
+        self.check_diff("", file2=dest_file)
+
+        # Prefer a reflink where supported
+        os.remove(self.dest_file)
+        mock_supported.return_value = True
+        with mock.patch('COT.file_reference._reflink', return_value=True):
+            self.assertEqual(materialize(self.src, self.dest), 'reflink')
+        self.assertFalse(os.path.samefile(self.src, self.dest_file))
+
+    def test_same_file(self, _):
+        """Copying a file onto itself is an error, not a truncation."""
+        self.assertRaises(shutil.Error, materialize, self.src, self.src)
+        self.assertRaises(shutil.Error, materialize, self.src, self.temp_dir)
+        self.check_diff("", file2=self.src)
+
+    @mock.patch('os.geteuid', return_value=0)
+    def test_root(self, *_):
+        """File modes can't stop root writing, so root never hardlinks."""
+        os.chmod(self.src, 0o444)
+        self.assertFalse(shares_storage(self.src, self.dest))
+        self.assertNotEqual(materialize(self.src, self.dest), 'hardlink')
+        self.assertFalse(os.path.samefile(self.src, self.dest_file))
+
+        # An existing link to the source is replaced, not written through
+        os.remove(self.dest_file)
+        os.link(self.src, self.dest_file)
+        self.assertNotEqual(materialize(self.src, self.dest), 'hardlink')
+        self.assertFalse(os.path.samefile(self.src, self.dest_file))
+        self.check_diff("", file2=self.src)
+        self.check_diff("", file2=self.dest_file)
+
+    def test_fallback(self, _):
+        """Fall back to a buffered copy if kernel copies are unsupported."""
+        with mock.patch('COT.file_reference._ZERO_COPY_METHODS', []):
+            self.assertEqual(materialize(self.src, self.dest), 'copy')
+        self.check_diff("", file2=self.dest_file)
+        self.assertEqual(os.stat(self.src).st_mode,
+                         os.stat(self.dest_file).st_mode)
@@ -14,7 +14,19 @@
 
 """Unit test cases for the COT.xml_file.XML class."""
 
-from COT.xml_file import XML
+import hashlib
+import io
+import os
+import xml.etree.ElementTree as ET
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from COT.xml_file import XML, lxml_etree, _LAZY_TEXT_SUPPORTED
 from COT.tests import COTTestCase
 
 
@@ -107,3 +119,218 @@ class TestXMLInstance(COTTestCase):
         )
         self.assertLogged(levelname="WARNING",
                           msg="Found unexpected child element")
+
+    def test_find_all_children_attrib(self):
+        """Find children by attribute value."""
+        references = self.xml.find_child(self.xml.root,
+                                         self.OVF + "References")
+        matches = XML.find_all_children(references, self.OVF + "File",
+                                        {self.OVF + "href": "input.iso"})
+        self.assertEqual(1, len(matches))
+        self.assertEqual("file2", matches[0].get(self.OVF + "id"))
+        self.assertEqual([], XML.find_all_children(
+            references, self.OVF + "File",
+            {self.OVF + "href": "input.iso", self.OVF + "id": "file1"}))
+        self.assertEqual(1, XML.child_index(references, matches[0]))
+
+    @mock.patch.object(XML, 'INDEX_MIN_CHILDREN', 3)
+    def test_child_index(self):
+        """Lookups by attribute under a large parent use an index."""
+        child = self.OVF + "Child"
+        key = self.OVF + "key"
+        parent = XML.make_element(self.OVF + "Parent")
+        for i in range(5):
+            XML.make_child(parent, child, {key: str(i)})
+        self.assertNotIn(parent, XML._child_index)
+        with mock.patch.object(XML, '_xpath_query') as mock_xpath:
+            first = XML.find_child(parent, child, {key: "0"})
+            self.assertIn(parent, XML._child_index)
+            self.assertEqual(first, XML.find_child(parent, child, {key: "0"}))
+            self.assertEqual(3, XML.child_index(
+                parent, XML.find_child(parent, child, {key: "3"})))
+            self.assertIsNone(XML.find_child(parent, child, {key: "5"}))
+            mock_xpath.assert_not_called()
+
+        # Children added through XML methods are kept in the index
+        new = XML.set_or_make_child(parent, child, attrib={key: "5"})
+        self.assertIs(new, XML.find_child(parent, child, {key: "5"}))
+        XML.add_child(parent, XML.make_element(child, {key: "0"}))
+        self.assertEqual(
+            2, len(XML.find_all_children(parent, child, {key: "0"})))
+
+        # Removing children discards the index
+        XML.remove_child(parent, first)
+        self.assertNotIn(parent, XML._child_index)
+        self.assertEqual(
+            1, len(XML.find_all_children(parent, child, {key: "0"})))
+
+        # Other changes must be reported
+        new.set(key, "6")
+        XML.children_changed(parent)
+        self.assertIsNone(XML.find_child(parent, child, {key: "5"}))
+        self.assertIs(new, XML.find_child(parent, child, {key: "6"}))
+
+    def test_serialize_xml(self):
+        """Serialization matches xml_reindent and ElementTree exactly."""
+        xml = XML(self.input_ovf)
+        XML.set_or_make_child(xml.root, "{urn:test}foo", "a&b<c> \u00e9",
+                              attrib={"{urn:test}key": 'v"\n&'})
+        before = ET.tostring(xml.root)
+        output = os.path.join(self.temp_dir, "out.ovf")
+        checksums = xml.write_xml(output, ['sha1', 'sha256'])
+        # Tree is not modified
+        self.assertEqual(before, ET.tostring(xml.root))
+        with open(output, 'rb') as fileobj:
+            data = fileobj.read()
+        self.assertEqual(xml.xml_size(), len(data))
+        self.assertEqual(checksums['sha1'], hashlib.sha1(data).hexdigest())
+        self.assertEqual(checksums['sha256'],
+                         hashlib.sha256(data).hexdigest())
+
+        # Output is the same regardless of chunk size
+        chunks = []
+        with mock.patch.object(XML, 'SERIALIZE_CHUNK_SIZE', 100):
+            xml.serialize_xml(chunks.append)
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(data, b"".join(chunks))
+
+        # Same as the old approach of reindenting the tree and writing it
+        xml.xml_reindent(xml.root, 0)
+        expected = io.BytesIO()
+        ET.ElementTree(xml.root).write(expected, xml_declaration=True,
+                                       encoding='utf-8')
+        self.assertEqual(expected.getvalue(), data)
+
+
+@unittest.skipUnless(_LAZY_TEXT_SUPPORTED,
+                     "lazy text loading requires the C ElementTree")
+@mock.patch.object(XML, 'ETREE', ET)
+@mock.patch.object(XML, 'LAZY_TEXT_MIN_SIZE', 100)
+class TestXMLLazyText(COTTestCase):
+    """Test cases for lazy loading of long element text."""
+
+    LONG_TEXT = (b"Some license text &amp; &lt;more&gt; text\r\n" * 20 +
+                 b"<![CDATA[a <b> & c]]>")
+
+    def setUp(self):
+        """Test case setup function called automatically before each test."""
+        super(TestXMLLazyText, self).setUp()
+        self.path = os.path.join(self.temp_dir, "lazy.xml")
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                          b'<a:Root xmlns:a="urn:a">'
+                          b'<a:Short a:key="1">hello</a:Short>'
+                          b'<a:Long>' + self.LONG_TEXT + b'</a:Long>'
+                          b'<a:Parent>' + self.LONG_TEXT +
+                          b'<a:Child /></a:Parent></a:Root>')
+        self.expected = ET.parse(self.path).getroot()
+
+    def test_lazy_text(self):
+        """Long text is left on disk until accessed."""
+        xml = XML(self.path)
+        self.assertEqual(2, len(xml._lazy_elements))
+        (long_elem, parent) = xml._lazy_elements
+        self.assertIsNotNone(long_elem.raw_text())
+        self.assertEqual(ET.tostring(self.expected), ET.tostring(xml.root))
+        self.assertIsNone(long_elem.raw_text())
+        self.assertEqual(self.expected[1].text, long_elem.text)
+        self.assertEqual(1, len(parent))
+
+        xml = XML(self.path)
+        self.assertEqual("hello", xml.root.findtext("{urn:a}Short"))
+        self.assertEqual(self.expected.findtext("{urn:a}Long"),
+                         xml.root.findtext("{urn:a}Long"))
+        self.assertEqual(list(self.expected.itertext()),
+                         list(xml.root.itertext()))
+
+        # Not lazy if too short, or under lxml
+        with mock.patch.object(XML, 'LAZY_TEXT_MIN_SIZE', 100000):
+            self.assertEqual([], XML(self.path)._lazy_elements)
+        if lxml_etree is not None:
+            with mock.patch.object(XML, 'ETREE', lxml_etree):
+                self.assertEqual([], XML(self.path)._lazy_elements)
+
+    def test_write_xml(self):
+        """Unmodified long text is copied verbatim."""
+        xml = XML(self.path)
+        xml._lazy_elements[1].text = "changed"
+        output = os.path.join(self.temp_dir, "out.xml")
+        xml.write_xml(output)
+        self.assertIsNotNone(xml._lazy_elements[0].raw_text())
+        with open(output, 'rb') as fileobj:
+            output_data = fileobj.read()
+        self.assertIn(b">" + self.LONG_TEXT + b"</", output_data)
+        self.assertEqual(xml.xml_size(), len(output_data))
+        self.assertEqual(self.expected[1].text,
+                         ET.parse(output).getroot()[1].text)
+
+        # Overwriting the input loads the text first
+        xml.write_xml(self.path)
+        self.assertEqual([], xml._lazy_elements)
+        self.assertEqual(self.expected[1].text, xml.root[1].text)
+        self.assertEqual(ET.tostring(ET.parse(output).getroot()),
+                         ET.tostring(ET.parse(self.path).getroot()))
+
+    def test_modified_file(self):
+        """Text can't be loaded from a file modified after parsing."""
+        xml = XML(self.path)
+        with open(self.path, 'ab') as fileobj:
+            fileobj.write(b"\n")
+        with self.assertRaises(IOError):
+            _ = xml._lazy_elements[0].text
+
+    def test_location(self):
+        """Text can be loaded from XML embedded in a larger file."""
+        with open(self.path, 'rb') as fileobj:
+            data = fileobj.read()
+        path = os.path.join(self.temp_dir, "embedded")
+        with open(path, 'wb') as fileobj:
+            fileobj.write(b"x" * 1000 + data + b"y" * 1000)
+        xml = XML(io.BytesIO(data), (path, 1000, len(data)))
+        self.assertEqual(2, len(xml._lazy_elements))
+        self.assertEqual(ET.tostring(self.expected), ET.tostring(xml.root))
+
+        # Without a location, all text is loaded
+        self.assertEqual([], XML(io.BytesIO(data))._lazy_elements)
+
+    def test_parse_error(self):
+        """Parse errors are reported just as by ElementTree."""
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(b"<a><b>" + b"x" * 200 + b"</c></a>")
+        with self.assertRaises(ET.ParseError) as catcher:
+            XML(self.path)
+        with self.assertRaises(ET.ParseError) as expected:
+            ET.parse(self.path)
+        self.assertEqual(str(expected.exception), str(catcher.exception))
+        self.assertEqual(expected.exception.position,
+                         catcher.exception.position)
+
+
+@unittest.skipIf(lxml_etree is None, "lxml is not installed")
+class TestXMLBackends(COTTestCase):
+    """Test cases comparing the lxml and ElementTree backends."""
+
+    def read_write(self, etree):
+        """Read and rewrite the input OVF using the given backend.
+
+        Args:
+          etree (module): Backend module to use for :attr:`XML.ETREE`
+        Returns:
+          tuple: (XML instance, bytes written)
+        """
+        output = os.path.join(self.temp_dir, "out.ovf")
+        with mock.patch.object(XML, 'ETREE', etree):
+            xml = XML(self.input_ovf)
+            XML.set_or_make_child(xml.root, "{urn:test}foo", "bar",
+                                  attrib={"{urn:test}key": "value"})
+            xml.write_xml(output)
+        with open(output, 'rb') as fileobj:
+            return (xml, fileobj.read())
+
+    def test_identical_output(self):
+        """Both backends write byte-identical XML."""
+        (xml1, output1) = self.read_write(ET)
+        (xml2, output2) = self.read_write(lxml_etree)
+        self.assertFalse(hasattr(xml1.root, 'getparent'))
+        self.assertTrue(hasattr(xml2.root, 'getparent'))
+        self.assertEqual(output1, output2)
@@ -46,8 +46,11 @@ except ImportError:
     from backports.shutil_get_terminal_size import get_terminal_size
 
 from COT import __version_long__
+from COT.checksum_cache import ChecksumCache
 from COT.data_validation import InvalidInputError, ValueMismatchError
 from COT.commands import command_classes
+from COT.file_reference import VERIFY_POLICIES
+from COT.vm_description import VMDescription
 from .ui import UI
 
 logger = logging.getLogger(__name__)
@@ -431,6 +434,17 @@ class CLI(UI):
                             action='store_true',
                             help="""Perform requested actions without """
                             """prompting for confirmation""")
+        parser.add_argument('--no-checksum-cache',
+                            dest='_no_checksum_cache', action='store_true',
+                            help="""Do not use or update the persistent """
+                            """cache of file checksums""")
+        parser.add_argument('--verify-checksums', dest='_verify_checksums',
+                            choices=VERIFY_POLICIES,
+                            default=VMDescription.VERIFY_POLICY,
+                            help="""When to verify files against the """
+                            """manifest: when the VM is loaded (eager), """
+                            """only once file contents are needed (lazy), """
+                            """or never (off). Default: %(default)s""")
 
         debug_group = parser.add_mutually_exclusive_group()
         debug_group.add_argument(
@@ -526,6 +540,8 @@ class CLI(UI):
         arg_dict = vars(args)
         del arg_dict["_verbosity"]
         del arg_dict["_force"]
+        del arg_dict["_no_checksum_cache"]
+        del arg_dict["_verify_checksums"]
         del arg_dict["_subcommand"]
         for (arg, value) in arg_dict.items():
             # When argparse is using both "nargs='+'" and "action=append",
@@ -584,6 +600,8 @@ class CLI(UI):
         """
         # pylint: disable=protected-access
         self.force = args._force
+        self.checksum_cache = not args._no_checksum_cache
+        self.verify_checksums = args._verify_checksums
 
         # Verbosity level adjusted by -v and -q options
         self.adjust_verbosity(args._verbosity - args._quietude)
@@ -597,9 +615,10 @@ class CLI(UI):
         # Call the appropriate command and handle any resulting errors
         arg_dict = self.args_to_dict(args)
         try:
-            self.set_instance_attributes(arg_dict)
-            args.instance.run()
-            args.instance.finished()
+            with ChecksumCache.enabled_if(self.checksum_cache):
+                self.set_instance_attributes(arg_dict)
+                args.instance.run()
+                args.instance.finished()
         except (InvalidInputError, ValueMismatchError) as exc:
             subp.error(exc)
         except NotImplementedError as exc:
@@ -35,7 +35,9 @@ import mock
 from COT import __version_long__
 from COT.tests import COTTestCase
 from COT.ui.cli import CLI
+from COT.checksum_cache import ChecksumCache
 from COT.data_validation import InvalidInputError
+from COT.vm_description import VMDescription
 
 # pylint: disable=missing-param-doc,missing-type-doc
 
@@ -329,31 +331,35 @@ class TestCLIGeneral(TestCOTCLI):
         self.assertMultiLineEqual(out1, out2)
         if sys.hexversion < 0x03020000:
             args_str = """
-  -h, --help       show this help message and exit
-  -V, --version    show program's version number and exit
-  -f, --force      Perform requested actions without prompting for
-                   confirmation
-  -q, --quiet      Decrease verbosity of the program (repeatable)
-  -v, --verbose    Increase verbosity of the program (repeatable)
+  -h, --help            show this help message and exit
+  -V, --version         show program's version number and exit
+  -f, --force           Perform requested actions without prompting for
+                        confirmation
+  --no-checksum-cache   Do not use or update the persistent cache of file
+                        checksums
+  --verify-checksums {eager,lazy,off}
+                        When to verify files against the manifest: when the VM
+                        is loaded (eager), only once file contents are needed
+                        (lazy), or never (off). Default: eager
+  -q, --quiet           Decrease verbosity of the program (repeatable)
+  -v, --verbose         Increase verbosity of the program (repeatable)
 """
             # No command aliases before Python 3.2
             command_str = """
-    add-disk       Add a disk image to an OVF package and map it as a disk in
-                   the guest environment
-    add-file       Add a file to an OVF package
-    deploy         Create a new VM on the target hypervisor from the given OVF
-                   or OVA
-    edit-hardware  Edit virtual machine hardware properties of an OVF
-    edit-product   Edit product info in an OVF
-    edit-properties
-                   Edit or create environment properties of an OVF
-    help           Print help for a command
-    info           Generate a description of an OVF package
-    inject-config  Inject a configuration file into an OVF package
-    install-helpers
-                   Install/verify COT manual pages and any third-party helper
-                   programs that COT may require
-    remove-file    Remove a file from an OVF package
+    add-disk            Add a disk image to an OVF package and map it as a
+                        disk in the guest environment
+    add-file            Add a file to an OVF package
+    deploy              Create a new VM on the target hypervisor from the
+                        given OVF or OVA
+    edit-hardware       Edit virtual machine hardware properties of an OVF
+    edit-product        Edit product info in an OVF
+    edit-properties     Edit or create environment properties of an OVF
+    help                Print help for a command
+    info                Generate a description of an OVF package
+    inject-config       Inject a configuration file into an OVF package
+    install-helpers     Install/verify COT manual pages and any third-party
+                        helper programs that COT may require
+    remove-file         Remove a file from an OVF package
 """
         else:
             # Spacing in args_str is a bit different due to subcommand aliases
@@ -362,6 +368,12 @@ class TestCLIGeneral(TestCOTCLI):
   -V, --version         show program's version number and exit
   -f, --force           Perform requested actions without prompting for
                         confirmation
+  --no-checksum-cache   Do not use or update the persistent cache of file
+                        checksums
+  --verify-checksums {eager,lazy,off}
+                        When to verify files against the manifest: when the VM
+                        is loaded (eager), only once file contents are needed
+                        (lazy), or never (off). Default: eager
   -q, --quiet           Decrease verbosity of the program (repeatable)
   -v, --verbose         Increase verbosity of the program (repeatable)
 """
@@ -421,6 +433,28 @@ commands:
         # Optional args but no subcommand
         self.call_cot(['-f', '-v'], fixup_args=False, result=2)
 
+    @mock.patch.object(ChecksumCache, 'ENABLED', True)
+    def test_checksum_options(self):
+        """Verify checksum options apply only to the command being run."""
+        seen = []
+        real_factory = VMDescription.factory
+
+        def factory(*args, **kwargs):
+            """Record the checksum settings in effect when loading a VM."""
+            seen.append((kwargs.get('verify'), ChecksumCache.ENABLED))
+            return real_factory(*args, **kwargs)
+
+        with mock.patch.object(VMDescription, 'factory',
+                               side_effect=factory):
+            self.call_cot(['--verify-checksums', 'lazy',
+                           '--no-checksum-cache', 'info', self.input_ovf])
+            self.assertEqual(seen, [('lazy', False)])
+            self.assertTrue(ChecksumCache.ENABLED)
+            self.assertEqual(VMDescription.VERIFY_POLICY, 'eager')
+
+            self.call_cot(['info', self.input_ovf])
+            self.assertEqual(seen[1:], [('eager', True)])
+
     def test_verbosity(self):
         """Verify various verbosity options and their effect on logging."""
         self.logging_handler.flush()
@@ -72,6 +72,16 @@ class UI(object):
         self.default_confirm_response = True
         """Knob for API testing, sets the default response to confirm()."""
 
+        self.verify_checksums = None
+        """Checksum verification policy for VMs loaded by commands.
+
+        One of :data:`~COT.file_reference.VERIFY_POLICIES`, or None to use
+        :attr:`~COT.vm_description.VMDescription.VERIFY_POLICY`.
+        """
+
+        self.checksum_cache = True
+        """Whether commands may use the persistent checksum cache."""
+
         self._terminal_width = 80
         from COT.helpers import Helper
         Helper.USER_INTERFACE = self
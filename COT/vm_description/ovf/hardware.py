@@ -28,7 +28,7 @@
 import copy
 import logging
 
-from COT.data_validation import natural_sort
+from COT.data_validation import alphanum_split, natural_sort
 from COT.xml_file import XML
 
 from .item import OVFItem, OVFItemDataError
@@ -49,6 +49,11 @@ class OVFHardware(object):
     Fundamentally it's just a dict of
     :class:`~COT.vm_description.ovf.item.OVFItem` objects
     with a bunch of helper methods.
+
+    To make lookups fast, secondary indexes are maintained from each of the
+    ResourceType, Parent, Address, AddressOnParent, and HostResource
+    values to the Items having that value. Items notify their owning
+    OVFHardware via :meth:`update_index` whenever their properties change.
     """
 
     def __init__(self, ovf):
@@ -62,6 +67,16 @@ class OVFHardware(object):
         """
         self.ovf = ovf
         self.item_dict = {}
+        self._indexed_properties = (ovf.RESOURCE_TYPE, ovf.PARENT,
+                                    ovf.ADDRESS, ovf.ADDRESS_ON_PARENT,
+                                    ovf.HOST_RESOURCE)
+        self._index = {}
+        """(property name, value) --> set of instance IDs."""
+        self._index_keys = {}
+        """Instance ID --> (property name, value) keys indexing it."""
+        self._instance_of = {}
+        """OVFItem --> Instance ID under which it is indexed."""
+        self._sorted_instances = None
         valid_profiles = set(ovf.config_profiles)
         item_count = 0
         for item in ovf.virtual_hw_section:
@@ -96,52 +111,182 @@ class OVFHardware(object):
             "OVF contains %s hardware Item elements describing %s "
             "unique devices", item_count, len(self.item_dict))
         # Treat the current state as golden:
-        for ovfitem in self.item_dict.values():
+        for (instance, ovfitem) in list(self.item_dict.items()):
             ovfitem.modified = False
+            self._add_item(instance, ovfitem)
+
+    def _index_keys_for(self, ovfitem):
+        """Get the index keys applicable to the given Item.
+
+        An Item is only indexed under a property that has the same value
+        across all profiles, mirroring :meth:`OVFItem.get_value`.
+
+        Args:
+          ovfitem (OVFItem): Item to inspect
+
+        Returns:
+          list: (property name, value) tuples
+        """
+        keys = []
+        for name in self._indexed_properties:
+            value_dict = ovfitem.properties.get(name)
+            if value_dict and len(value_dict) == 1:
+                keys.append((name, list(value_dict.keys())[0]))
+        return keys
+
+    def _add_item(self, instance, ovfitem):
+        """Add the given Item to :attr:`item_dict` and the indexes.
+
+        Args:
+          instance (str): InstanceID of the Item
+          ovfitem (OVFItem): Item to add
+        """
+        self._remove_item(instance)
+        self.item_dict[instance] = ovfitem
+        self._instance_of[ovfitem] = instance
+        ovfitem.hardware = self
+        keys = self._index_keys_for(ovfitem)
+        for key in keys:
+            self._index.setdefault(key, set()).add(instance)
+        self._index_keys[instance] = keys
+        self._sorted_instances = None
+
+    def _remove_item(self, instance):
+        """Remove the given Item from :attr:`item_dict` and the indexes.
+
+        Args:
+          instance (str): InstanceID of the Item
+        """
+        ovfitem = self.item_dict.pop(instance, None)
+        if ovfitem is None:
+            return
+        self._instance_of.pop(ovfitem, None)
+        if ovfitem.hardware is self:
+            ovfitem.hardware = None
+        for key in self._index_keys.pop(instance, []):
+            self._index[key].discard(instance)
+            if not self._index[key]:
+                del self._index[key]
+        self._sorted_instances = None
+
+    def update_index(self, ovfitem):
+        """Update the indexes after the properties of an Item have changed.
+
+        Called automatically by :class:`OVFItem` when modified.
+
+        Args:
+          ovfitem (OVFItem): Item that has changed
+        """
+        instance = self._instance_of.get(ovfitem)
+        if instance is None:
+            return
+        keys = self._index_keys_for(ovfitem)
+        if keys == self._index_keys.get(instance):
+            return
+        self._add_item(instance, ovfitem)
+
+    def _instances_in_order(self):
+        """Get all InstanceIDs in natural sort order.
+
+        Returns:
+          list: InstanceID strings (cached until Items are added or removed)
+        """
+        if self._sorted_instances is None:
+            self._sorted_instances = natural_sort(self.item_dict)
+        return self._sorted_instances
 
     def update_xml(self):
-        """Regenerate all Items under the VirtualHardwareSection, if needed.
+        """Regenerate any changed Items under the VirtualHardwareSection.
 
+        Only Items that have been modified or newly created are regenerated,
+        with their XML elements replaced in place; all other elements in the
+        section are left untouched. XML elements of deleted Items are removed.
         Will do nothing if no Items have been changed.
         """
-        modified = False
-        if len(self.item_dict) != len(XML.find_all_children(
-                self.ovf.virtual_hw_section,
-                set([self.ovf.ITEM, self.ovf.STORAGE_ITEM,
-                     self.ovf.ETHERNET_PORT_ITEM]))):
-            modified = True
-        else:
-            for ovfitem in self.item_dict.values():
-                if ovfitem.modified:
-                    modified = True
-                    break
-        if not modified:
+        section = self.ovf.virtual_hw_section
+        item_tags = set([self.ovf.ITEM, self.ovf.STORAGE_ITEM,
+                         self.ovf.ETHERNET_PORT_ITEM])
+        present = set(child for child in section if child.tag in item_tags)
+        owner = {}
+        """XML element --> natural sort key of the InstanceID it belongs to."""
+        dirty = []
+        for instance in self._instances_in_order():
+            ovfitem = self.item_dict[instance]
+            key = alphanum_split(instance)
+            for element in ovfitem.elements:
+                owner[element] = key
+            if (ovfitem.modified or not ovfitem.elements or
+                    not present.issuperset(ovfitem.elements)):
+                dirty.append(instance)
+        stale = [child for child in present if child not in owner]
+        if not dirty and not stale:
             logger.verbose("No changes to hardware definition, "
                            "so no XML update is required")
             return
-        # Delete the existing Items:
-        delete_count = 0
-        for item in list(self.ovf.virtual_hw_section):
-            if (item.tag == self.ovf.ITEM or
-                    item.tag == self.ovf.STORAGE_ITEM or
-                    item.tag == self.ovf.ETHERNET_PORT_ITEM):
-                self.ovf.virtual_hw_section.remove(item)
-                delete_count += 1
-        logger.debug("Cleared %d existing items from VirtualHWSection",
-                     delete_count)
-        # Generate the new XML Items, in appropriately sorted order by Instance
-        ordering = [self.ovf.INFO, self.ovf.SYSTEM, self.ovf.ITEM]
-        for instance in natural_sort(self.item_dict):
-            logger.debug("Writing Item(s) with InstanceID %s", instance)
-            ovfitem = self.item_dict[instance]
-            new_items = ovfitem.generate_items()
-            logger.spam("Generated %d items", len(new_items))
-            for item in new_items:
-                XML.add_child(self.ovf.virtual_hw_section, item, ordering)
-        logger.verbose("Updated XML VirtualHardwareSection, now contains %d "
-                       "Items representing %d devices",
-                       len(self.ovf.virtual_hw_section.findall(self.ovf.ITEM)),
-                       len(self.item_dict))
+
+        for element in stale:
+            section.remove(element)
+        logger.debug("Removed %d Item elements of deleted Items from "
+                     "VirtualHWSection", len(stale))
+
+        for instance in dirty:
+            self._regenerate_item(instance, present, owner)
+        XML.children_changed(section)
+        logger.verbose("Updated XML VirtualHardwareSection, regenerating %d "
+                       "of %d devices", len(dirty), len(self.item_dict))
+
+    def _regenerate_item(self, instance, present, owner):
+        """Replace the XML element(s) of the given Item with new ones.
+
+        Args:
+          instance (str): InstanceID of the Item to regenerate
+          present (set): Item elements originally in the section
+          owner (dict): Natural sort key for each existing Item element;
+            updated to reflect the new elements.
+        """
+        logger.debug("Writing Item(s) with InstanceID %s", instance)
+        section = self.ovf.virtual_hw_section
+        ovfitem = self.item_dict[instance]
+        key = alphanum_split(instance)
+        new_items = ovfitem.generate_items()
+        logger.spam("Generated %d items", len(new_items))
+        old_items = [elem for elem in ovfitem.elements if elem in present]
+        if old_items:
+            # Replace the old elements at their existing position
+            index = XML.child_index(section, old_items[0])
+            for element in old_items:
+                section.remove(element)
+                del owner[element]
+            for (offset, element) in enumerate(new_items):
+                section.insert(index + offset, element)
+        else:
+            for element in new_items:
+                self._insert_item_element(element, key, owner)
+        for element in new_items:
+            owner[element] = key
+        ovfitem.elements = new_items
+        ovfitem.modified = False
+
+    def _insert_item_element(self, element, key, owner):
+        """Insert a new Item element in InstanceID order.
+
+        The element is placed before the first existing element of the same
+        type whose InstanceID sorts after it; if there is none, it is added
+        after all existing Items.
+
+        Args:
+          element (xml.etree.ElementTree.Element): Element to insert
+          key (list): Natural sort key of the element's InstanceID
+          owner (dict): Natural sort key for each existing Item element
+        """
+        section = self.ovf.virtual_hw_section
+        for (index, child) in enumerate(section):
+            if (child.tag == element.tag and child in owner and
+                    owner[child] > key):
+                section.insert(index, element)
+                return
+        XML.add_child(section, element,
+                      [self.ovf.INFO, self.ovf.SYSTEM, self.ovf.ITEM])
 
     def find_unused_instance_id(self, start=1):
         """Find the first available ``InstanceID`` number.
@@ -153,7 +298,7 @@ class OVFHardware(object):
           str: An instance ID that is not yet in use.
         """
         instance = int(start)
-        while str(instance) in self.item_dict.keys():
+        while str(instance) in self.item_dict:
             instance += 1
         logger.debug("Found unused InstanceID %d", instance)
         return str(instance)
@@ -180,7 +325,7 @@ class OVFHardware(object):
         # so provide a simple default value.
         ovfitem.set_property(self.ovf.ELEMENT_NAME, resource_type,
                              profile_list)
-        self.item_dict[instance] = ovfitem
+        self._add_item(instance, ovfitem)
         ovfitem.modified = True
         logger.info("Created new %s under profile(s) %s, InstanceID is %s",
                     resource_type, profile_list, instance)
@@ -194,7 +339,7 @@ class OVFHardware(object):
         """
         instance = item.get_value(self.ovf.INSTANCE_ID)
         if self.item_dict[instance] == item:
-            del self.item_dict[instance]
+            self._remove_item(instance)
         # TODO: error handling - currently a no-op if item not in item_dict
 
     def clone_item(self, parent_item, profile_list):
@@ -221,7 +366,7 @@ class OVFHardware(object):
 
         ovfitem.set_property(self.ovf.INSTANCE_ID, instance, profile_list)
         ovfitem.modified = True
-        self.item_dict[instance] = ovfitem
+        self._add_item(instance, ovfitem)
         logger.spam("Added clone of %s under %s, instance is %s",
                     parent_item, profile_list, instance)
         return (instance, ovfitem)
@@ -262,12 +407,23 @@ class OVFHardware(object):
         Returns:
           list: Matching OVFItem instances
         """
-        items = [self.item_dict[instance] for instance in
-                 natural_sort(self.item_dict)]
-        filtered_items = []
         if properties is None:
             properties = {}
-        for item in items:
+        # Narrow down the candidates as far as possible using the indexes
+        keys = [(name, value) for (name, value) in properties.items()
+                if name in self._indexed_properties and value is not None]
+        if resource_type:
+            keys.append((self.ovf.RESOURCE_TYPE,
+                         self.ovf.RES_MAP[resource_type]))
+        if keys:
+            candidates = set.intersection(*[self._index.get(key, set())
+                                            for key in keys])
+            instances = natural_sort(candidates)
+        else:
+            instances = self._instances_in_order()
+        filtered_items = []
+        for instance in instances:
+            item = self.item_dict[instance]
             if self.item_match(item, resource_type, properties, profile_list):
                 filtered_items.append(item)
         logger.spam("Found %s Items of type %s with properties %s and"
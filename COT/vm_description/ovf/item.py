@@ -33,13 +33,17 @@ hardware configuration profiles.
 
   OVFItem
   OVFItemDataError
+  ProfileRegistry
 """
 
+import copy
 import re
 import logging
 import xml.etree.ElementTree as ET
 
-from COT.data_validation import natural_sort, ValueUnsupportedError
+from COT.data_validation import (
+    alphanum_split, natural_sort, ValueUnsupportedError,
+)
 from COT.xml_file import XML
 
 from .name_helper import name_helper
@@ -77,6 +81,79 @@ class OVFItemDataError(Exception):
     """Data to be added to an :class:`OVFItem` conflicts with existing data."""
 
 
+class ProfileRegistry(object):
+    """Assignment of configuration profiles to the bits of an integer mask.
+
+    Sets of profiles are represented internally by :class:`OVFItem` as
+    integer bitmasks, so that profile set algebra is just bitwise
+    arithmetic. Bit 0 always represents ``None``, the wildcard for
+    "all profiles"; other profiles are assigned bits as they are seen.
+    Each :class:`~COT.vm_description.ovf.ovf.OVF` has its own registry.
+    """
+
+    ANY = 1
+    """Mask representing ``None`` (all profiles)."""
+
+    def __init__(self):
+        """Create a new registry, knowing only the ``None`` profile."""
+        self._bits = {None: self.ANY}
+        self._profiles = [None]
+
+    def bit(self, profile):
+        """Get the bit representing the given profile, assigning it if new.
+
+        Args:
+          profile (str): Profile name, or ``None``.
+        Returns:
+          int: Mask with the single bit for this profile set.
+        """
+        bit = self._bits.get(profile)
+        if bit is None:
+            bit = 1 << len(self._profiles)
+            self._bits[profile] = bit
+            self._profiles.append(profile)
+        return bit
+
+    def mask(self, profiles):
+        """Get the mask representing the given profiles.
+
+        Args:
+          profiles (iterable): Profile names, possibly including ``None``.
+        Returns:
+          int: Bitmask
+        """
+        result = 0
+        for profile in profiles:
+            result |= self.bit(profile)
+        return result
+
+    def profiles(self, mask):
+        """Get the set of profiles represented by the given mask.
+
+        Args:
+          mask (int): Bitmask
+        Returns:
+          set: Profile names, possibly including ``None``.
+
+        Examples:
+          ::
+
+            >>> registry = ProfileRegistry()
+            >>> registry.mask(["foo", "bar"])
+            6
+            >>> registry.profiles(5) == set([None, 'foo'])
+            True
+        """
+        result = set()
+        index = 0
+        while mask:
+            if mask & 1:
+                result.add(self._profiles[index])
+            mask >>= 1
+            index += 1
+        return result
+
+
 class OVFItem(object):
     """Helper class for :class:`OVF`.
 
@@ -86,7 +163,9 @@ class OVFItem(object):
     In essence, it is:
 
     * a dict of ``Item`` properties (indexed by element name)
-    * each of which is a dict of sets of profiles (indexed by element value)
+    * each of which is a dict of sets of profiles (indexed by element value),
+      with each set of profiles stored as a bitmask from the
+      :class:`ProfileRegistry` of the OVF.
     """
 
     # Magic strings
@@ -103,15 +182,51 @@ class OVFItem(object):
         self.ovf = ovf
         if ovf is not None:
             self.name_helper = ovf
+            self.profile_registry = ovf.profile_registry
         else:
             self.name_helper = name_helper(1.0)
+            self.profile_registry = ProfileRegistry()
+        self.name_helper.bind_names(self)
         self.properties = {}
-        """Dict of dicts. properties[name][value] = (profile1, profile2)."""
+        """Dict of dicts. properties[name][value] = profile mask."""
         self.modified = False
+        self.elements = []
+        """XML elements currently representing this item in the OVF."""
+        self.hardware = None
+        """:class:`OVFHardware` indexing this item, if any."""
         self.namespace = self.RASD   # default for most item types
         if item is not None:
             self.add_item(item)
 
+    def __deepcopy__(self, memo):
+        """Copy this item, sharing its OVF rather than copying it as well.
+
+        The copy is not indexed by any :class:`OVFHardware` until added,
+        and is not yet represented by any XML elements.
+
+        Args:
+          memo (dict): See :func:`copy.deepcopy`.
+
+        Returns:
+          OVFItem: Copy of this item.
+        """
+        result = OVFItem.__new__(OVFItem)
+        memo[id(self)] = result
+        self.name_helper.bind_names(result)
+        for (key, value) in self.__dict__.items():
+            if key in result.__dict__:
+                # Name constants from bind_names()
+                continue
+            elif key in ('ovf', 'name_helper', 'profile_registry'):
+                result.__dict__[key] = value
+            elif key == 'hardware':
+                result.__dict__[key] = None
+            elif key == 'elements':
+                result.__dict__[key] = []
+            else:
+                result.__dict__[key] = copy.deepcopy(value, memo)
+        return result
+
     def __str__(self):
         """Get human-readable string representation."""
         ret = "OVFItem:\n"
@@ -136,7 +251,7 @@ class OVFItem(object):
               through but will raise an AttributeError as usual.
         """
         # Don't pass 'special' attributes through to the helper
-        if re.match(r"^__", name):
+        if name.startswith("__"):
             raise AttributeError("'OVFItem' object has no attribute '{0}'"
                                  .format(name))
         # Pass through to designated helper
@@ -187,7 +302,34 @@ class OVFItem(object):
         Returns:
           set: Profile strings associated with this name/value.
         """
-        return self.properties[name][value]
+        return self.profile_registry.profiles(self.properties[name][value])
+
+    def _mask(self, profiles):
+        """Convert the given profiles to a mask, if not one already.
+
+        Args:
+          profiles (object): Iterable of profile names, or a mask.
+
+        Returns:
+          int: Profile mask
+        """
+        if isinstance(profiles, (set, frozenset, list, tuple)):
+            return self.profile_registry.mask(profiles)
+        return profiles
+
+    def _all_mask(self, name):
+        """Mask of all profiles for which this name has a value.
+
+        Args:
+          name (str): Property name.
+
+        Returns:
+          int: Profile mask, 0 if there are no values for this name.
+        """
+        mask = 0
+        for value_mask in self.properties.get(name, {}).values():
+            mask |= value_mask
+        return mask
 
     def all_profiles(self, name, default=None):
         """Superset of all profiles for which this name has a value.
@@ -199,10 +341,10 @@ class OVFItem(object):
         Returns:
           Set of profile strings, or the given `default` if no matches.
         """
-        value_dict = self.properties.get(name, None)
-        if not value_dict:
+        mask = self._all_mask(name)
+        if not mask:
             return default
-        return set.union(*value_dict.values())
+        return self.profile_registry.profiles(mask)
 
     def add_item(self, item):
         """Add the given ``Item`` element to this OVFItem.
@@ -273,6 +415,7 @@ class OVFItem(object):
                 self.set_property(attrib_string, value, profiles,
                                   overwrite=False)
 
+        self.elements.append(item)
         self.modified = True
         logger.spam("Added %s - new status:\n%s", item.tag, str(self))
         self.validate()
@@ -289,7 +432,8 @@ class OVFItem(object):
         Args:
           name (str): Property name
           value (str): Value to add wildcards to.
-          profiles (list): Profiles to which this (name, value) applies.
+          profiles (list): Profiles (or profile mask) to which this
+            (name, value) applies.
 
         Returns:
           str: The updated value string with wildcards added.
@@ -323,7 +467,8 @@ class OVFItem(object):
         Args:
           name (str): Property name
           value (str): Value to replace wildcards from.
-          profiles (list): Profiles to which this (name, value) applies.
+          profiles (list): Profiles (or profile mask) to which this
+            (name, value) applies.
 
         Returns:
           str: The updated value string, with wildcards replaced.
@@ -352,69 +497,69 @@ class OVFItem(object):
                 value = re.sub("_CONN_", str(conn_val), str(value))
         return value
 
-    def _set_new_property(self, name, value, profiles):
+    def _set_new_property(self, name, value, mask):
         """Helper for :meth:`set_property`. Create a new property entry.
 
         Args:
           name (str): Property name
           value (str): Value to store for this property.
-          profiles (list): Profiles to which this (name, value) applies.
+          mask (int): Profiles to which this (name, value) applies.
         """
         if not value:
             return
 
-        if None in profiles:
-            self.properties[name] = {value: set([None])}
+        if mask & ProfileRegistry.ANY:
+            self.properties[name] = {value: ProfileRegistry.ANY}
         else:
-            self.properties[name] = {value: profiles}
+            self.properties[name] = {value: mask}
         self.modified = True
 
-    def _set_existing_property(self, name, value, profiles, overwrite):
+    def _set_existing_property(self, name, value, mask, overwrite):
         """Helper for :meth:`set_property`. Update an existing property.
 
         Args:
           name (str): Property name
           value (str): Value to store for this property.
-          profiles (list): Profiles to which this (name, value) applies.
+          mask (int): Profiles to which this (name, value) applies.
           overwrite (bool): Whether to permit overwriting existing values.
 
         Raises:
           OVFItemDataError: If ``overwrite`` is False and the value is
-              already set for one or more of the requested ``profiles``.
+              already set for one or more of the requested profiles.
         """
-        for (known_value, profile_set) in list(self.properties[name].items()):
-            if not overwrite and profile_set.intersection(profiles):
+        for (known_value, known_mask) in list(self.properties[name].items()):
+            if not overwrite and known_mask & mask:
                 raise OVFItemDataError(
                     "Tried to set value:\n'{0}'\nfor property\n'{1}'\n"
                     "under profile(s) {2} but already had value:\n'{3}'\n"
                     "for this property under profile(s) {4}"
-                    .format(value, name, profiles,
+                    .format(value, name,
+                            self.profile_registry.profiles(mask),
                             known_value,
-                            profile_set.intersection(profiles)))
-            new_set = profile_set.copy()
+                            self.profile_registry.profiles(known_mask & mask)))
 
             if known_value != value:
                 # Our profiles should not use this old value
-                new_set -= profiles
-            elif None in profile_set:
+                new_mask = known_mask & ~mask
+            elif known_mask & ProfileRegistry.ANY:
                 # No need to add ourselves, we're already covered
                 # implicitly by the default
-                pass
+                new_mask = known_mask
             else:
-                new_set |= profiles
+                new_mask = known_mask | mask
 
-            if new_set != profile_set:
+            if new_mask != known_mask:
                 self.modified = True
-                if not new_set:
+                if not new_mask:
                     logger.spam("No longer any profiles with value %s"
                                 " - deleting this value",
                                 known_value)
                     del self.properties[name][known_value]
                 else:
-                    self.properties[name][known_value] = new_set
+                    self.properties[name][known_value] = new_mask
 
-        if value and value not in self.property_values(name):
-            self.properties[name][value] = profiles
+        if value and value not in self.properties[name]:
+            self.properties[name][value] = mask
             self.modified = True
         elif not self.properties[name]:
             logger.debug("No longer any values saved for property %s"
@@ -463,19 +608,22 @@ class OVFItem(object):
             #    profiles, then change the value for all of these profiles.
             # 2) If this property was not defined previously, then set the
             #    value for all profiles (the magic set([None]))
-            profiles = self.all_profiles(name, set([None]))
-        profiles = set(profiles)
+            mask = self._all_mask(name) or ProfileRegistry.ANY
+        else:
+            mask = self.profile_registry.mask(profiles)
 
-        value = self.value_add_wildcards(name, value, profiles)
+        value = self.value_add_wildcards(name, value, mask)
         logger.spam("Setting %s to %s under profiles %s",
                     name, value, profiles)
         if name not in self.properties:
-            self._set_new_property(name, value, profiles)
+            self._set_new_property(name, value, mask)
         else:
-            self._set_existing_property(name, value, profiles, overwrite)
+            self._set_existing_property(name, value, mask, overwrite)
 
         if self.modified:
             self.validate()
+        if self.hardware is not None:
+            self.hardware.update_index(self)
 
     def add_profile(self, new_profile, from_item=None):
         """Add a new profile to this item.
@@ -510,9 +658,9 @@ class OVFItem(object):
                 logger.spam("No values stored for name %s - not cloning it",
                             name)
                 continue
-            for (value, profiles) in from_item.properties[name].items():
-                if (None in profiles or
-                        len(from_item.property_values(name)) == 1):
+            for (value, mask) in from_item.properties[name].items():
+                if (mask & ProfileRegistry.ANY or
+                        len(from_item.properties[name]) == 1):
                     self.set_property(name, value, p_set)
                     found = True
                     break
@@ -540,30 +688,35 @@ class OVFItem(object):
             return
         logger.debug("Removing profile %s from item %s",
                      profile, self.properties[self.INSTANCE_ID])
-        p_set = set([profile])
+        registry = self.profile_registry
+        p_mask = registry.bit(profile)
         for name in self.property_names:
-            for (value, profiles) in list(self.properties[name].items()):
-                profiles -= p_set
+            value_dict = self.properties[name]
+            for value in list(value_dict.keys()):
+                mask = value_dict[value] & ~p_mask
                 # Convert "any profile" to a list of all profiles minus
                 # this one and any profiles already set elsewhere
-                if None in profiles and split_default:
+                if mask & ProfileRegistry.ANY and split_default:
                     logger.debug("Profile contains 'any profile'; "
                                  "fixing it up")
-                    profiles.update(self.ovf.config_profiles)
-                    profiles.discard(None)
-                    profiles.discard(profile)
+                    mask = registry.mask(self.ovf.config_profiles) & ~p_mask
                     # Discard all profiles set elsewhere
-                    for (val, prof) in list(self.properties[name].items()):
+                    for (val, prof) in value_dict.items():
                         if val == value:
                             continue
-                        profiles -= prof
-                    logger.spam("Profiles are now: %s", profiles)
-                if not profiles:
+                        mask &= ~prof
+                    logger.spam("Profiles are now: %s",
+                                registry.profiles(mask))
+                if not mask:
                     logger.debug("No more profiles for value %s, %s",
                                  name, value)
-                    del self.properties[name][value]
+                    del value_dict[value]
+                else:
+                    value_dict[value] = mask
         self.modified = True
         self.validate()
+        if self.hardware is not None:
+            self.hardware.update_index(self)
 
     def get(self, tag):
         """Get the dict associated with the given XML tag, if any.
@@ -587,19 +740,18 @@ class OVFItem(object):
 
         Args:
           tag (str): Tag to retrieve value for
-          profiles (set): set of profile names, or None
+          profiles (set): set of profile names (or profile mask), or None
 
         Returns:
           Value, default value, or ``None``, unsanitized.
         """
-        if profiles is not None:
-            profiles = set(profiles)
         val_dict = self.properties.get(tag, {})
         if profiles is None:
             if len(val_dict) == 1:
                 return list(val_dict.keys())[0]
             else:
                 return None
+        mask = self._mask(profiles)
         # A case we need to handle:
         # {'1': set([None])
         #  '4': set(['x'])
@@ -608,11 +760,11 @@ class OVFItem(object):
         # We have to recognize that y and z are implicit in None but z is not.
         default_val = None
         for (val, prof) in val_dict.items():
-            if prof.issuperset(profiles):
+            if prof & mask == mask:
                 return val
-            if None in prof:
+            if prof & ProfileRegistry.ANY:
                 default_val = val
-            elif not prof.isdisjoint(profiles):
+            elif prof & mask:
                 return None
         return default_val
 
@@ -624,7 +776,7 @@ class OVFItem(object):
 
         Args:
           tag (str): Tag to retrieve value for
-          profiles (set): set of profile names, or None
+          profiles (set): set of profile names (or profile mask), or None
 
         Returns:
           Value string or list, or ``None``
@@ -638,6 +790,9 @@ class OVFItem(object):
         # Sanity check
         if tag == self.ELEMENT_NAME or tag == self.ITEM_DESCRIPTION:
             if val and re.search(r"_RST_|_VQ_|_CONN_|_EN_", val):
+                if profiles is not None:
+                    profiles = self.profile_registry.profiles(
+                        self._mask(profiles))
                 raise OVFItemDataError("Unreplaced wildcard in value "
                                        "for {0} profiles {1}:\n{2}\n{3}"
                                        .format(tag, profiles, val, self))
@@ -675,22 +830,25 @@ class OVFItem(object):
                                    "values: {1}"
                                    .format(name,
                                            self.property_values(name)))
+        registry = self.profile_registry
         for (name, value_dict) in self.properties.items():
-            set_so_far = set()
-            for profile_set in value_dict.values():
-                if None in profile_set and len(profile_set) > 1:
+            mask_so_far = 0
+            for (value, mask) in list(value_dict.items()):
+                if mask & ProfileRegistry.ANY and mask != ProfileRegistry.ANY:
                     logger.debug("Profile set %s contains redundant info; "
-                                 "cleaning it up now...", profile_set)
+                                 "cleaning it up now...",
+                                 registry.profiles(mask))
                     # Clean up...
-                    profile_set.clear()
-                    profile_set.add(None)
+                    mask = ProfileRegistry.ANY
+                    value_dict[value] = mask
                 # Make sure the profile sets are mutually exclusive
-                inter = set_so_far.intersection(profile_set)
+                inter = mask_so_far & mask
                 if inter:
                     raise RuntimeError("OVFItem illegally contains duplicate "
                                        "profiles %s under %s: %s",
-                                       inter, name, value_dict)
-                set_so_far |= profile_set
+                                       registry.profiles(inter), name,
+                                       value_dict)
+                mask_so_far |= mask
 
     def has_profile(self, profile):
         """Check if this Item exists under the given profile.
@@ -701,57 +859,61 @@ class OVFItem(object):
         Returns:
           bool: True if the item exists in this profile, False if not.
         """
-        profiles = self.all_profiles(self.INSTANCE_ID)
-        if profiles is None:
+        mask = self._all_mask(self.INSTANCE_ID)
+        if not mask:
             return False
-        if profile in profiles:
+        if mask & self.profile_registry.bit(profile):
             return True
-        elif None in profiles and profile in self.ovf.config_profiles:
+        elif (mask & ProfileRegistry.ANY and
+              profile in self.ovf.config_profiles):
             return True
         return False
 
+    def _profile_groups(self):
+        """Partition the profiles used by this item by their property values.
+
+        Two profiles belong in the same group exactly when they appear in
+        the same (property, value) profile masks, so each profile's
+        signature across all of these masks identifies its group.
+
+        Returns:
+          list: ``(profile_string, mask)`` tuples, sorted by string,
+          where ``profile_string`` is ``""`` for the group including the
+          "all profiles" wildcard.
+        """
+        masks = [mask for value_dict in self.properties.values()
+                 for mask in value_dict.values()]
+        used = 0
+        for mask in masks:
+            used |= mask
+
+        groups = {}
+        bit = 1
+        while bit <= used:
+            if used & bit:
+                signature = tuple(index for (index, mask) in enumerate(masks)
+                                  if mask & bit)
+                groups[signature] = groups.get(signature, 0) | bit
+            bit <<= 1
+        logger.spam("Final set list is %s", list(groups.values()))
+
+        result = []
+        for group in groups.values():
+            if group & ProfileRegistry.ANY:
+                result.append(("", group))
+            else:
+                result.append((" ".join(natural_sort(
+                    self.profile_registry.profiles(group))), group))
+        return sorted(result, key=lambda entry: alphanum_split(entry[0]))
+
     def get_nonintersecting_set_list(self):
         """Identify the minimal non-intersecting set of profiles.
 
         Returns:
           list: List of profile-set strings.
         """
-        set_list = []
-        for name in self.property_names:
-            for (_, new_set) in list(self.properties[name].items()):
-                new_set_list = []
-                for existing_set in set_list:
-                    # If the sets are identical or do not intersect, do nothing
-                    if (new_set == existing_set or
-                            not new_set.intersection(existing_set)):
-                        new_set_list.append(frozenset(existing_set))
-                        continue
-                    # Otherwise, need to re-partition!
-                    set_a = existing_set.difference(new_set)
-                    new_set_list.append(frozenset(set_a))
-
-                    set_b = existing_set.intersection(new_set)
-                    new_set_list.append(frozenset(set_b))
-
-                    new_set = new_set.difference(existing_set)
-
-                new_set_list.append(frozenset(new_set))
-                # Remove duplicate and empty entries
-                set_list = [x for x in set(new_set_list) if x]
-
-        logger.spam("Final set list is %s", set_list)
-
-        # Construct a list of profile strings
-        set_string_list = []
-        for final_set in set_list:
-            if None in final_set:
-                set_string_list.append("")
-            else:
-                set_string_list.append(" ".join(natural_sort(final_set)))
-        set_string_list = natural_sort(set_string_list)
-
+        set_string_list = [string for (string, _) in self._profile_groups()]
         logger.spam("set string list: %s", set_string_list)
-
         return set_string_list
 
     def generate_items(self):
@@ -760,21 +922,22 @@ class OVFItem(object):
         Returns:
           list: Generated list of XML Item elements
         """
-        set_string_list = self.get_nonintersecting_set_list()
+        profile_groups = self._profile_groups()
+        logger.spam("set string list: %s",
+                    [string for (string, _) in profile_groups])
 
         # Now, construct the Items
         item_tag = self.item_tag_for_namespace(self.namespace)
         child_ordering = [self.namespace + i for i in self.ITEM_CHILDREN]
         item_list = []
-        for set_string in set_string_list:
+        for (set_string, final_set) in profile_groups:
             if not set_string:
                 # no config profile
-                item = ET.Element(item_tag)
-                final_set = set([None])
+                item = XML.make_element(item_tag)
                 set_string = '<generic>'
             else:
-                item = ET.Element(item_tag, {self.ITEM_CONFIG: set_string})
-                final_set = set(set_string.split())
+                item = XML.make_element(item_tag,
+                                        {self.ITEM_CONFIG: set_string})
             logger.spam("set string: %s; final_set: %s", set_string, final_set)
             for name in sorted(self.property_names):
                 val = self.get_value(name, final_set)
@@ -807,7 +970,7 @@ class OVFItem(object):
                     child.set(child_attrib.group(2), val)
                 elif custom_elem:
                     # Recreate the element in question and append it
-                    item.append(ET.fromstring(val))
+                    item.append(XML.from_string(val))
                 else:
                     # Children of Item must be in sorted order
                     XML.set_or_make_child(item, self.namespace + name, val,
@@ -117,6 +117,37 @@ class _Tag(object):
 CIM_URI = "http://schemas.dmtf.org/wbem/wscim/1"
 
 
+def _resolve_names(cls):
+    """Class decorator resolving all XML names for an OVF version up front.
+
+    Every namespace (``OVF``, ``RASD``, ...), namespaced tag (``ITEM``,
+    ``DISK_SECTION``, ...), and Item child tag (``INSTANCE_ID``, ...) is
+    computed once from the class's :attr:`NSM`, ``_raw``, and
+    ``_item_children`` tables and stored as a plain class attribute, as
+    well as in the class's :attr:`NAMES` table.
+
+    Args:
+      cls (type): :class:`OVFNameHelper1` or a subclass thereof.
+    Returns:
+      type: The same class, updated.
+    """
+    names = {}
+    for (prefix, uri) in cls.NSM.items():
+        names[prefix.upper()] = "{" + uri + "}"
+    # Older OVF versions have ethernet and storage items
+    # in the same RASD namespace as other hardware
+    names.setdefault('EPASD', names['RASD'])
+    names.setdefault('SASD', names['RASD'])
+    for (name, raw) in cls._raw.items():
+        names[name] = names[raw.namespace_name] + raw.tag
+    names.update(cls._item_children)
+    for (name, value) in names.items():
+        setattr(cls, name, value)
+    cls.NAMES = names
+    return cls
+
+
+@_resolve_names
 class OVFNameHelper1(object):
     """Helper class for :class:`OVF` version 1.x.
 
@@ -173,8 +204,12 @@ class OVFNameHelper1(object):
     for more details.
     """     # noqa: E501
 
-    # Cached strings, built on the fly
-    _cache = {}
+    NAMES = {}
+    """Table of all XML names for this OVF version, populated automatically.
+
+    Each of these names is also available directly as an attribute,
+    such as :attr:`ITEM` or :attr:`INSTANCE_ID`.
+    """
 
     # XML elements we care about in the OVF descriptor
     # TagPlusNamespace objects
@@ -314,29 +349,17 @@ class OVFNameHelper1(object):
     )
 
     def __getattr__(self, name):
-        """Transparently pass attribute lookups to _raw and _cache.
+        """Report a lookup of an unknown name.
+
+        All known names are resolved in advance as class attributes (see
+        :attr:`NAMES`), so this is only reached for unknown names.
 
         Args:
-          name (str): Attribute name to look up.
-        Returns:
-          Value looked up from :attr:`_raw` and/or :attr:`_cache`.
+          name (str): Attribute name being looked up.
         Raises:
-          AttributeError: if the given ``name`` is not found.
+          AttributeError: always.
         """
-        if name in self._item_children:
-            return self._item_children[name]
-        if name not in self._cache:
-            if name.lower() in self.NSM:
-                self._cache[name] = "{%s}" % self.NSM[name.lower()]
-            elif name == "EPASD" or name == "SASD":
-                self._cache[name] = self.RASD
-            elif name not in self._raw:
-                raise AttributeError("Unknown attribute '{0}'".format(name))
-            else:
-                namespace = getattr(self, self._raw[name].namespace_name)
-                tag = self._raw[name].tag
-                self._cache[name] = namespace + tag
-        return self._cache[name]
+        raise AttributeError("Unknown attribute '{0}'".format(name))
 
     def __init__(self):
         """Create a name helper for OVF version 1.x."""
@@ -382,6 +405,21 @@ class OVFNameHelper1(object):
         self.EULA_SECTION_ATTRIB = {}
         self.VIRTUAL_HW_SECTION_ATTRIB = {}
 
+    def bind_names(self, obj):
+        """Store all of the names known to this helper as attributes of obj.
+
+        Objects that would otherwise look up names like ``INSTANCE_ID``
+        through this helper on every access, such as
+        :class:`~COT.vm_description.ovf.ovf.OVF`, can instead hold them
+        directly.
+
+        Args:
+          obj (object): Object to update.
+        """
+        obj.__dict__.update(self.NAMES)
+        obj.__dict__.update(vars(self))
+        obj.__dict__.update(NSM=self.NSM, RES_MAP=self.RES_MAP)
+
     def namespace_for_item_tag(self, tag):
         """Get the XML namespace for the given item tag.
 
@@ -436,6 +474,7 @@ class OVFNameHelper1(object):
                                         [self.RASD, self.SASD, self.EPASD])
 
 
+@_resolve_names
 class OVFNameHelper0(OVFNameHelper1):
     """Helper class for :class:`OVF` of versions prior to 1.0.
 
@@ -449,7 +488,6 @@ class OVFNameHelper0(OVFNameHelper1):
     )
     """Shorthand for XML namespace URIs usually seen in a version 0.x OVF."""
 
-    _cache = dict(OVFNameHelper1._cache)
     _raw = dict(
         OVFNameHelper1._raw,
         NETWORK_SECTION=_Tag('ovf', 'Section'),
@@ -524,6 +562,7 @@ class OVFNameHelper0(OVFNameHelper1):
         }
 
 
+@_resolve_names
 class OVFNameHelper2(OVFNameHelper1):
     """Helper class for :class:`OVF` of version 2.x. TODO.
 
@@ -542,7 +581,6 @@ class OVFNameHelper2(OVFNameHelper1):
     )
     """Shorthand for XML namespace URIs usually seen in a version 2.x OVF."""
 
-    _cache = dict(OVFNameHelper1._cache)
     _raw = dict(
         OVFNameHelper1._raw,
         STORAGE_ITEM=_Tag('ovf', 'StorageItem'),
@@ -24,13 +24,13 @@
   OVF
 """
 
+import hashlib
+import io
 import logging
 import os
 import os.path
 import re
 import tarfile
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import ParseError
 import textwrap
 
 from COT.xml_file import XML
@@ -38,7 +38,9 @@ from COT.data_validation import (
     match_or_die, check_for_conflict, file_checksum,
     ValueTooHighError, ValueUnsupportedError, canonicalize_nic_subtype,
 )
-from COT.file_reference import FileReference, FileOnDisk
+from COT.file_reference import (
+    FileReference, FileOnDisk, FileInTAR, TarIndex, TarWriter,
+)
 from COT.platforms import Platform
 from COT.disks import DiskRepresentation
 from COT.utilities import pretty_bytes, tar_entry_size
@@ -46,7 +48,7 @@ from COT.utilities import pretty_bytes, tar_entry_size
 from ..vm_description import VMDescription, VMInitError
 from .name_helper import name_helper, CIM_URI
 from .hardware import OVFHardware, OVFHardwareDataError
-from .item import list_union
+from .item import list_union, ProfileRegistry
 from .utilities import (
     int_bytes_to_programmatic_units, parse_manifest, programmatic_bytes_to_int,
 )
@@ -143,7 +145,7 @@ class OVF(VMDescription, XML):
         else:
             return None
 
-    def __init__(self, input_file, output_file):
+    def __init__(self, input_file, output_file, verify=None):
         """Open the specified OVF and read its XML into memory.
 
         Args:
@@ -152,6 +154,13 @@ class OVF(VMDescription, XML):
               (there will never be an output file) this value should be
               ``None``; if the output filename is not yet known, use ``""``
               and subsequently set :attr:`output_file` when it is determined.
+              For a read-only OVA, the OVF descriptor is parsed directly
+              from the archive instead of being extracted to
+              :attr:`working_dir`.
+          verify (str): When to verify files against the manifest, if any;
+              see :meth:`VMDescription.__init__`. With ``'lazy'``, the OVF
+              descriptor is verified immediately, but other files are only
+              verified once their contents are actually needed.
 
         Raises:
           VMInitError:
@@ -164,24 +173,27 @@ class OVF(VMDescription, XML):
         """
         try:
             self.output_extension = None
-            VMDescription.__init__(self, input_file, output_file)
-
-            # Make sure we know how to read the input
-            self.ovf_descriptor = self._ovf_descriptor_from_name(input_file)
-            if self.ovf_descriptor is None:
-                # We should never get here, but be safe...
-                raise VMInitError(
-                    2,
-                    "File does not appear to be an OVA or OVF",
+            VMDescription.__init__(self, input_file, output_file, verify)
+
+            if (output_file is None and
+                    self.detect_type_from_name(input_file) in ['.ova',
+                                                               '.box']):
+                # Read-only access to an OVA - there's no need to extract
+                # the OVF descriptor, we can parse it directly from the TAR.
+                self._read_descriptor_from_tar(input_file)
+            else:
+                # Make sure we know how to read the input
+                self.ovf_descriptor = self._ovf_descriptor_from_name(
                     input_file)
+                if self.ovf_descriptor is None:
+                    # We should never get here, but be safe...
+                    raise VMInitError(
+                        2,
+                        "File does not appear to be an OVA or OVF",
+                        input_file)
 
-            # Open the provided OVF
-            try:
-                XML.__init__(self, self.ovf_descriptor)
-            except ParseError as exc:
-                raise VMInitError(2,
-                                  "XML error in parsing file: " + str(exc),
-                                  self.ovf_descriptor)
+                # Open the provided OVF
+                self._parse_descriptor(self.ovf_descriptor)
 
             # Quick sanity check before we go any further:
             if ((not re.search(r"Envelope", self.root.tag)) or
@@ -195,15 +207,16 @@ class OVF(VMDescription, XML):
 
             self._ovf_version = None
             self.name_helper = name_helper(self.ovf_version)
+            self.name_helper.bind_names(self)
 
             for (prefix, uri) in self.NSM.items():
-                ET.register_namespace(prefix, uri)
+                XML.register_namespace(prefix, uri)
 
             # Register additional non-standard namespaces we're aware of:
-            ET.register_namespace('vmw', "http://www.vmware.com/schema/ovf")
-            ET.register_namespace('vbox',
-                                  "http://www.virtualbox.org/ovf/machine")
-            ET.register_namespace(
+            XML.register_namespace('vmw', "http://www.vmware.com/schema/ovf")
+            XML.register_namespace('vbox',
+                                   "http://www.virtualbox.org/ovf/machine")
+            XML.register_namespace(
                 'pasd',
                 CIM_URI + "/cim-schema/2/CIM_ProcessorAllocationSettingData")
 
@@ -248,6 +261,7 @@ class OVF(VMDescription, XML):
             self._configuration_profiles = None
             self._file_references = {}
             self._platform = None
+            self.profile_registry = ProfileRegistry()
 
             try:
                 self.hardware = OVFHardware(self)
@@ -349,12 +363,13 @@ class OVF(VMDescription, XML):
         if m_algo and m_algo != self.checksum_algorithm:
             # TODO: log a warning? Discard the checksum?
             pass
-        FileReference.create(
+        descriptor_ref = FileReference.create(
             input_path, os.path.basename(self.ovf_descriptor),
             checksum_algorithm=self.checksum_algorithm,
-            expected_checksum=m_cksum)
+            expected_checksum=m_cksum,
+            verify='off')
 
-        # Now check the checksum of the other files
+        # Now check the other files
         for file_href, file_size in descriptor_files.items():
             m_algo, m_cksum = manifest_entries.get(file_href, (None, None))
             if m_algo and m_algo != self.checksum_algorithm:
@@ -365,12 +380,27 @@ class OVF(VMDescription, XML):
                     input_path, file_href,
                     checksum_algorithm=self.checksum_algorithm,
                     expected_checksum=m_cksum,
-                    expected_size=file_size)
+                    expected_size=file_size,
+                    verify=('lazy' if self.verify == 'lazy' else 'off'))
             except IOError:
                 logger.error("File '%s' referenced in the OVF descriptor "
                              "does not exist.", file_href)
                 continue
 
+        # Verify checksums against the manifest, hashing concurrently.
+        # In lazy mode we only verify the descriptor, which has already
+        # been read in full anyway; other files verify themselves on use.
+        to_verify = {
+            'eager': [descriptor_ref] + list(file_references.values()),
+            'lazy': [descriptor_ref],
+            'off': [],
+        }[self.verify]
+        to_verify = [ref for ref in to_verify
+                     if ref.expected_checksum is not None]
+        FileReference.compute_checksums(to_verify)
+        for file_ref in to_verify:
+            file_ref.check_checksum()
+
         return file_references
 
     @property
@@ -753,7 +783,7 @@ class OVF(VMDescription, XML):
               through but will raise an AttributeError as usual.
         """
         # Don't pass 'special' attributes through to the helper
-        if re.match(r"^__", name):
+        if name.startswith("__"):
             raise AttributeError("'OVF' object has no attribute '{0}'"
                                  .format(name))
         return getattr(self.name_helper, name)
@@ -775,7 +805,7 @@ class OVF(VMDescription, XML):
             :attr:`output_file` (plus any associated files).
         """
         # Size of the OVF descriptor
-        needed = tar_entry_size(len(ET.tostring(self.root)))
+        needed = tar_entry_size(self.xml_size())
 
         # Account for the size of all the referenced files
         manifest_size = 0
@@ -805,6 +835,28 @@ class OVF(VMDescription, XML):
         logger.debug("Estimated output size is %s", pretty_bytes(needed))
         return needed
 
+    def predicted_working_dir_size(self):
+        """Estimate how much disk space (in bytes) the working dir may need.
+
+        Like :meth:`predicted_output_size`, but files that can be reflinked
+        or hardlinked into :attr:`working_dir` (see
+        :func:`~COT.file_reference.materialize`) are assumed to consume
+        no additional space, as are all files if the input OVA will be
+        updated in place (see :meth:`tar`).
+
+        Returns:
+          int: Estimated number of bytes consumed in :attr:`working_dir`.
+        """
+        needed = self.predicted_output_size()
+        in_place = (self.output_file is not None and
+                    os.path.realpath(self.output_file) ==
+                    os.path.realpath(self.input_file) and
+                    self._tar_in_place_offset(self.output_file) is not None)
+        for file_ref in self.file_references.values():
+            if in_place or file_ref.shares_storage_with(self.working_dir):
+                needed -= tar_entry_size(file_ref.size)
+        return needed
+
     def write(self):
         """Write OVF or OVA to :attr:`output_file`, if set."""
         if not self.output_file:
@@ -833,11 +885,16 @@ class OVF(VMDescription, XML):
         if extension == '.ova':
             ovf_file = os.path.join(self.working_dir, "{0}.ovf"
                                     .format(os.path.basename(prefix)))
-            self.write_xml(ovf_file)
-            self.generate_manifest(ovf_file)
-            self.tar(ovf_file, self.output_file)
+            ovf_checksum = self.write_xml(
+                ovf_file, [self.checksum_algorithm])[self.checksum_algorithm]
+            # The manifest is generated while the OVA is written,
+            # to avoid reading each file once to hash it and again to copy it
+            self.tar(ovf_file, self.output_file, generate_manifest=True,
+                     ovf_checksum=ovf_checksum)
         elif extension == '.ovf':
-            self.write_xml(self.output_file)
+            ovf_checksum = self.write_xml(
+                self.output_file,
+                [self.checksum_algorithm])[self.checksum_algorithm]
             # Copy all files from working directory to destination
             dest_dir = os.path.dirname(os.path.abspath(self.output_file))
 
@@ -845,7 +902,7 @@ class OVF(VMDescription, XML):
                 file_ref.copy_to(dest_dir)
 
             # Generate manifest
-            self.generate_manifest(self.output_file)
+            self.generate_manifest(self.output_file, ovf_checksum)
         else:
             # We should never get here, but to be safe:
             raise NotImplementedError("Not sure how to write a '{0}' file"
@@ -858,13 +915,15 @@ class OVF(VMDescription, XML):
         """
         # Refresh the file references
         to_delete = []
+        to_refresh = []
         for filename, file_ref in self.file_references.items():
             if file_ref.exists:
-                file_ref.refresh()
+                to_refresh.append(file_ref)
             else:
                 # file used to exist but no longer does??
                 logger.error("Referenced file '%s' does not exist!", filename)
                 to_delete.append(filename)
+        FileReference.refresh_all(to_refresh)
 
         for filename in to_delete:
             del self.file_references[filename]
@@ -874,7 +933,7 @@ class OVF(VMDescription, XML):
             if href not in self.file_references:
                 # TODO this should probably have a confirm() check...
                 logger.notice("Removing reference to missing file %s", href)
-                self.references.remove(file_elem)
+                self.remove_child(self.references, file_elem)
                 # TODO remove references to this file from Disk, Item?
 
         for filename, file_ref in self.file_references.items():
@@ -927,11 +986,11 @@ class OVF(VMDescription, XML):
             name = net.get(self.NETWORK_NAME)
             if name not in connected_networks:
                 logger.notice("Removing unused network %s", name)
-                self.network_section.remove(net)
+                self.remove_child(self.network_section, net)
         # If all networks were removed, remove the NetworkSection too
         if not self.network_section.findall(self.NETWORK):
             logger.notice("No networks left - removing NetworkSection")
-            self.envelope.remove(self.network_section)
+            self.remove_child(self.envelope, self.network_section)
             self.network_section = None
 
     def _info_string_header(self, width):
@@ -1549,8 +1608,8 @@ class OVF(VMDescription, XML):
                               attrib={self.CONFIG_ID: pid})
         if cfg is None:
             logger.debug("Creating new Configuration element")
-            cfg = ET.SubElement(self.deploy_opt_section, self.CONFIG,
-                                {self.CONFIG_ID: pid})
+            cfg = self.make_child(self.deploy_opt_section, self.CONFIG,
+                                  {self.CONFIG_ID: pid})
 
         self.set_or_make_child(cfg, self.CFG_LABEL, label)
         self.set_or_make_child(cfg, self.CFG_DESC, description)
@@ -1583,10 +1642,10 @@ class OVF(VMDescription, XML):
             item.remove_profile(profile, split_default=False)
 
         # Delete the profile declaration itself
-        self.deploy_opt_section.remove(cfg)
+        self.remove_child(self.deploy_opt_section, cfg)
 
         if not self.deploy_opt_section.findall(self.CONFIG):
-            self.envelope.remove(self.deploy_opt_section)
+            self.remove_child(self.envelope, self.deploy_opt_section)
 
         # Clear cache
         logger.debug("Profile %s deleted - clear config_profiles cache",
@@ -1820,14 +1879,38 @@ class OVF(VMDescription, XML):
             return None
         return prop.get(self.PROP_VALUE)
 
-    def _validate_value_for_property(self, prop, value):
+    _QUALIFIER_LIMITS = {}
+    """Cache of property qualifiers string --> (MinLen, MaxLen)."""
+
+    @classmethod
+    def _qualifier_limits(cls, qualifiers):
+        """Get the length limits, if any, from a property's qualifiers.
+
+        Args:
+          qualifiers (str): Value of the property's qualifiers attribute.
+
+        Returns:
+          tuple: (MinLen, MaxLen), either of which may be None.
+        """
+        try:
+            return cls._QUALIFIER_LIMITS[qualifiers]
+        except KeyError:
+            pass
+        limits = []
+        for pattern in [r"MinLen\((\d+)\)", r"MaxLen\((\d+)\)"]:
+            match = re.search(pattern, qualifiers)
+            limits.append(int(match.group(1)) if match else None)
+        cls._QUALIFIER_LIMITS[qualifiers] = tuple(limits)
+        return cls._QUALIFIER_LIMITS[qualifiers]
+
+    def _validate_value_for_property(self, attrib, value):
         """Check whether the proposed value is valid for the given property.
 
         This applies agnostic criteria such as property type and qualifiers;
         it knows nothing of the property's actual meaning.
 
         Args:
-          prop (xml.etree.ElementTree.Element): Existing Property element.
+          attrib (dict): Attributes of the Property element.
           value (str): Proposed value to set for this property.
 
         Returns:
@@ -1836,10 +1919,10 @@ class OVF(VMDescription, XML):
         Raises:
           ValueUnsupportedError: if the value does not meet criteria.
         """
-        key = prop.get(self.PROP_KEY)
+        key = attrib.get(self.PROP_KEY)
 
         # Check type validity and canonicalize if needed
-        prop_type = prop.get(self.PROP_TYPE, "")
+        prop_type = attrib.get(self.PROP_TYPE, "")
         if prop_type == "boolean":
             # XML prefers to represent booleans as 'true' or 'false'
             value = str(value).lower()
@@ -1853,22 +1936,16 @@ class OVF(VMDescription, XML):
             value = str(value)
 
         # Check property qualifiers
-        prop_qual = prop.get(self.PROP_QUAL, "")
-        if prop_qual:
-            match = re.search(r"MaxLen\((\d+)\)", prop_qual)
-            if match:
-                max_len = int(match.group(1))
-                if len(value) > max_len:
-                    raise ValueUnsupportedError(
-                        key, value, "string no longer than {0} characters"
-                        .format(max_len))
-            match = re.search(r"MinLen\((\d+)\)", prop_qual)
-            if match:
-                min_len = int(match.group(1))
-                if len(value) < min_len:
-                    raise ValueUnsupportedError(
-                        key, value, "string no shorter than {0} characters"
-                        .format(min_len))
+        (min_len, max_len) = self._qualifier_limits(
+            attrib.get(self.PROP_QUAL, ""))
+        if max_len is not None and len(value) > max_len:
+            raise ValueUnsupportedError(
+                key, value, "string no longer than {0} characters"
+                .format(max_len))
+        if min_len is not None and len(value) < min_len:
+            raise ValueUnsupportedError(
+                key, value, "string no shorter than {0} characters"
+                .format(min_len))
 
         return value
 
@@ -1893,6 +1970,60 @@ class OVF(VMDescription, XML):
           NotImplementedError: if :attr:`ovf_version` is less than 1.0;
               OVF version 0.9 is not currently supported.
         """
+        return self.import_properties([{
+            'key': key,
+            'value': value,
+            'user_configurable': user_configurable,
+            'property_type': property_type,
+            'label': label,
+            'description': description,
+        }])[0]
+
+    def set_property_values(self, values, user_configurable=None):
+        """Set the values of many properties at once.
+
+        Args:
+          values (object): Dict of property identifier --> value, or list
+              of (identifier, value) pairs.
+          user_configurable (bool): Should these properties be configurable
+              at deployment time by the user?
+
+        Returns:
+          list: The (converted) value that was set for each property.
+
+        Raises:
+          NotImplementedError: if :attr:`ovf_version` is less than 1.0;
+              OVF version 0.9 is not currently supported.
+        """
+        if hasattr(values, 'items'):
+            values = values.items()
+        return self.import_properties(
+            {'key': key, 'value': value,
+             'user_configurable': user_configurable}
+            for (key, value) in values)
+
+    def import_properties(self, properties):
+        """Create or update many properties at once.
+
+        Equivalent to calling :meth:`set_property_value` for each property
+        in turn, but the existing properties are indexed only once, and
+        every value is validated before any changes are made.
+
+        Args:
+          properties (list): Dicts of keyword arguments (``key``, ``value``,
+              and optionally ``user_configurable``, ``property_type``,
+              ``label``, and ``description``) to
+              :meth:`set_property_value`.
+
+        Returns:
+          list: The (converted) value that was set for each property.
+
+        Raises:
+          NotImplementedError: if :attr:`ovf_version` is less than 1.0;
+              OVF version 0.9 is not currently supported.
+          ValueUnsupportedError: if any value is invalid for its property,
+              in which case no properties are changed.
+        """
         if self.ovf_version < 1.0:
             raise NotImplementedError("No support for setting environment "
                                       "properties under OVF v0.9")
@@ -1901,33 +2032,87 @@ class OVF(VMDescription, XML):
             "Product Information",
             attrib=self.PRODUCT_SECTION_ATTRIB,
             parent=self.virtual_system)
-        prop = self.find_child(self.product_section, self.PROPERTY,
-                               attrib={self.PROP_KEY: key})
-        if prop is None:
-            prop = self.set_or_make_child(self.product_section, self.PROPERTY,
-                                          attrib={self.PROP_KEY: key})
-            # Properties *must* have a type to be valid
-            if property_type is None:
-                property_type = 'string'
-
-        if user_configurable is not None:
-            prop.set(self.PROP_USER_CONFIGABLE, str(user_configurable).lower())
-        if property_type is not None:
-            prop.set(self.PROP_TYPE, property_type)
-            # Revalidate any existing value if not setting a new value
-            if value is None:
-                value = prop.get(self.PROP_VALUE)
+        existing = {}
+        for prop in self.product_section.findall(self.PROPERTY):
+            existing.setdefault(prop.get(self.PROP_KEY), prop)
+
+        # Work out the final attributes of each property, validating values
+        attribs = {}
+        keys = []
+        children = []
+        values = []
+        for entry in properties:
+            key = entry['key']
+            attrib = attribs.get(key)
+            if attrib is None:
+                keys.append(key)
+                if key in existing:
+                    attrib = dict(existing[key].attrib)
+                else:
+                    attrib = {self.PROP_KEY: key}
+                    # Properties *must* have a type to be valid
+                    if entry.get('property_type') is None:
+                        entry = dict(entry, property_type='string')
+                attribs[key] = attrib
+            values.append(self._update_property_attrib(attrib, entry))
+            children.append((key, entry.get('label'),
+                             entry.get('description')))
+
+        # Apply the changes, appending any new Properties in order
+        for key in keys:
+            prop = existing.get(key)
+            if prop is None:
+                existing[key] = self.make_child(self.product_section,
+                                                self.PROPERTY, attribs[key])
+            else:
+                for name, value in attribs[key].items():
+                    prop.set(name, value)
+        for (key, label, description) in children:
+            self._set_property_text(existing[key], label, description)
 
-        if value is not None:
-            # Make sure the requested value is valid
-            value = self._validate_value_for_property(prop, value)
-            prop.set(self.PROP_VALUE, value)
+        return values
 
+    def _set_property_text(self, prop, label, description):
+        """Set the label and/or description of a Property, if requested.
+
+        Args:
+          prop (xml.etree.ElementTree.Element): Property element
+          label (str): Brief explanatory label for this property
+          description (str): Detailed description of this property
+        """
         if label is not None:
             self.set_or_make_child(prop, self.PROPERTY_LABEL, label)
         if description is not None:
             self.set_or_make_child(prop, self.PROPERTY_DESC, description)
 
+    def _update_property_attrib(self, attrib, entry):
+        """Update the attributes of a Property as requested.
+
+        Args:
+          attrib (dict): Attributes of the Property, updated in place.
+          entry (dict): See :meth:`import_properties`.
+
+        Returns:
+          str: the (converted) value that was set.
+
+        Raises:
+          ValueUnsupportedError: if the value is invalid for this property.
+        """
+        value = entry.get('value')
+        if entry.get('user_configurable') is not None:
+            attrib[self.PROP_USER_CONFIGABLE] = str(
+                entry['user_configurable']).lower()
+        if entry.get('property_type') is not None:
+            attrib[self.PROP_TYPE] = entry['property_type']
+            # Revalidate any existing value if not setting a new value
+            if value is None:
+                value = attrib.get(self.PROP_VALUE)
+
+        if value is not None:
+            # Make sure the requested value is valid
+            value = self._validate_value_for_property(attrib, value)
+            attrib[self.PROP_VALUE] = value
+
         return value
 
     def config_file_to_properties(self, file_path, user_configurable=None):
@@ -1946,19 +2131,18 @@ class OVF(VMDescription, XML):
         if not self.platform.LITERAL_CLI_STRING:
             raise NotImplementedError("no known support for literal CLI on " +
                                       str(self.platform))
-        property_num = 0
+        values = []
         with open(file_path, 'r') as fileobj:
             for line in fileobj:
                 line = line.strip()
                 # Skip blank lines and comment lines
                 if (not line) or line[0] == '!':
                     continue
-                property_num += 1
-                self.set_property_value(
+                values.append((
                     "{0}-{1:04d}".format(self.platform.LITERAL_CLI_STRING,
-                                         property_num),
-                    line,
-                    user_configurable)
+                                         len(values) + 1),
+                    line))
+        self.set_property_values(values, user_configurable)
 
     def convert_disk_if_needed(self, disk_image, kind):
         """Convert the disk to a more appropriate format if needed.
@@ -2347,7 +2531,7 @@ class OVF(VMDescription, XML):
 
             file_obj.clear()
         elif disk is None:
-            file_obj = ET.SubElement(self.references, self.FILE)
+            file_obj = self.make_child(self.references, self.FILE)
         else:
             # The OVF standard requires that Disks which reference a File
             # be listed in the same order as the Files.
@@ -2372,7 +2556,7 @@ class OVF(VMDescription, XML):
                     break
                 disk_index += 1
 
-            file_obj = ET.Element(self.FILE)
+            file_obj = self.make_element(self.FILE)
             self.references.insert(file_index, file_obj)
 
         file_size_string = str(os.path.getsize(file_path))
@@ -2381,6 +2565,7 @@ class OVF(VMDescription, XML):
         file_obj.set(self.FILE_ID, file_id)
         file_obj.set(self.FILE_HREF, file_name)
         file_obj.set(self.FILE_SIZE, file_size_string)
+        self.children_changed(self.references)
 
         # Make a note of the file's location - we'll copy it at write time.
         # The file_path is always a FileOnDisk
@@ -2403,11 +2588,11 @@ class OVF(VMDescription, XML):
           ValueUnsupportedError: If the ``disk_drive`` is a device type other
               than 'cdrom' or 'harddisk'
         """
-        self.references.remove(file_obj)
+        self.remove_child(self.references, file_obj)
         del self.file_references[file_obj.get(self.FILE_HREF)]
 
         if disk is not None:
-            self.disk_section.remove(disk)
+            self.remove_child(self.disk_section, disk)
 
         if disk_drive is not None:
             # For a CD-ROM drive, we can simply unmap the file.
@@ -2440,10 +2625,10 @@ class OVF(VMDescription, XML):
                 logger.notice("CD-ROMs do not require a Disk element. "
                               "Existing element will be deleted.")
                 if self.disk_section is not None:
-                    self.disk_section.remove(disk)
+                    self.remove_child(self.disk_section, disk)
                     if not self.disk_section.findall(self.DISK):
                         logger.notice("No Disks left - removing DiskSection")
-                        self.envelope.remove(self.disk_section)
+                        self.remove_child(self.envelope, self.disk_section)
                         self.disk_section = None
                 disk = None
             else:
@@ -2464,7 +2649,7 @@ class OVF(VMDescription, XML):
             disk.clear()
         else:
             disk_id = file_id
-            disk = ET.SubElement(self.disk_section, self.DISK)
+            disk = self.make_child(self.disk_section, self.DISK)
 
         self.set_capacity_of_disk(disk, disk_repr.capacity)
 
@@ -2473,6 +2658,7 @@ class OVF(VMDescription, XML):
         disk.set(self.DISK_FORMAT,
                  ("http://www.vmware.com/interfaces/"
                   "specifications/vmdk.html#streamOptimized"))
+        self.children_changed(self.disk_section)
         return disk
 
     def add_controller_device(self, device_type, subtype, address,
@@ -2627,6 +2813,131 @@ class OVF(VMDescription, XML):
 
     # Helper methods - for internal use only
 
+    def _parse_descriptor(self, xml_source, location=None):
+        """Parse the OVF descriptor XML into memory.
+
+        Args:
+          xml_source (object): File path or readable file object
+          location (tuple): See :meth:`XML.__init__`.
+
+        Raises:
+          VMInitError: if an XML parsing error occurs
+        """
+        try:
+            XML.__init__(self, xml_source, location)
+        except self.PARSE_ERRORS as exc:
+            raise VMInitError(2,
+                              "XML error in parsing file: " + str(exc),
+                              self.ovf_descriptor)
+
+    def _check_tar_member_path(self, pathname, file_path):
+        """Make sure the given TAR member name is not a malicious path.
+
+        See http://stackoverflow.com/questions/8112742/
+
+        Args:
+          pathname (str): Name of a member of the TAR file
+          file_path (str): OVA file path
+
+        Raises:
+          VMInitError: if the path would escape the working directory.
+        """
+        logger.debug("Examining path of %s prior to untar", pathname)
+        if not (os.path.abspath(os.path.join(self.working_dir, pathname))
+                .startswith(self.working_dir)):
+            raise VMInitError(1, "Tar file contains malicious/unsafe "
+                              "file path '{0}'!".format(pathname),
+                              file_path)
+
+    def _find_descriptor_in_tar(self, tarf, file_path):
+        """Locate the OVF descriptor in an OVA, reading no further than needed.
+
+        The OVF standard says, with regard to OVAs:
+        ...the files shall be in the following order inside the archive:
+
+        1) OVF descriptor
+        2) OVF manifest (optional)
+        3) OVF certificate (optional)
+        4) The remaining files shall be in the same order as listed
+           in the References section...
+        5) OVF manifest (optional)
+        6) OVF certificate (optional)
+
+        For now we just validate #1. As the descriptor is normally first,
+        TAR headers are only read up to the first ``.ovf`` file found.
+
+        Args:
+          tarf (tarfile.TarFile): Opened OVA archive
+          file_path (str): OVA file path
+
+        Returns:
+          tarfile.TarInfo: OVF descriptor member
+
+        Raises:
+          VMInitError: if the archive is empty or contains no descriptor,
+              or if a malicious path is encountered
+        """
+        first = tarf.next()
+        if first is None:
+            raise VMInitError(1, "No files to untar", file_path)
+        member = first
+        while member is not None:
+            self._check_tar_member_path(member.name, file_path)
+            if os.path.splitext(member.name)[1] == '.ovf':
+                break
+            member = tarf.next()
+        if member is None:
+            raise VMInitError(1,
+                              "TAR file does not seem to contain any"
+                              " .ovf file to serve as OVF descriptor"
+                              " - OVA is invalid!",
+                              file_path)
+        if member is not first:
+            logger.error(
+                "OVF file %s found, but is not the first file in the TAR "
+                "as it should be - OVA is not standard-compliant!",
+                member.name)
+        return member
+
+    @staticmethod
+    def _open_tar(file_path):
+        """Open the given OVA for reading.
+
+        Args:
+          file_path (str): OVA file path
+
+        Returns:
+          tarfile.TarFile: Opened archive
+
+        Raises:
+          VMInitError: if the given file doesn't represent a valid OVA archive.
+        """
+        try:
+            return tarfile.open(file_path, 'r')
+        except (EOFError, tarfile.TarError) as exc:
+            raise VMInitError(1, "Could not untar file: {0}".format(exc.args),
+                              file_path)
+
+    def _read_descriptor_from_tar(self, file_path):
+        """Parse the OVF descriptor directly out of an .ova without extracting.
+
+        Sets :attr:`ovf_descriptor` to the name of the descriptor within the
+        archive.
+
+        Args:
+          file_path (str): OVA file path
+
+        Raises:
+          VMInitError: if the given file doesn't represent a valid OVA archive.
+        """
+        logger.verbose("Reading OVF descriptor directly from %s", file_path)
+        with self._open_tar(file_path) as tarf:
+            member = self._find_descriptor_in_tar(tarf, file_path)
+            self.ovf_descriptor = member.name
+            self._parse_descriptor(
+                tarf.extractfile(member),
+                (file_path, member.offset_data, member.size))
+
     def untar(self, file_path):
         """Untar the OVF descriptor from an .ova to the working directory.
 
@@ -2642,71 +2953,28 @@ class OVF(VMDescription, XML):
         logger.verbose("Untarring %s to working directory %s",
                        file_path, self.working_dir)
 
-        try:
-            tarf = tarfile.open(file_path, 'r')
-        except (EOFError, tarfile.TarError) as exc:
-            raise VMInitError(1, "Could not untar file: {0}".format(exc.args),
-                              file_path)
+        with self._open_tar(file_path) as tarf:
+            ovf_descriptor = self._find_descriptor_in_tar(tarf, file_path)
+            # Make sure the rest of the file doesn't contain any malicious
+            # paths either, since we may extract other files later on.
+            for tarinfo in tarf:
+                self._check_tar_member_path(tarinfo.name, file_path)
 
-        try:
-            # The OVF standard says, with regard to OVAs:
-            # ...the files shall be in the following order inside the archive:
-            # 1) OVF descriptor
-            # 2) OVF manifest (optional)
-            # 3) OVF certificate (optional)
-            # 4) The remaining files shall be in the same order as listed
-            #    in the References section...
-            # 5) OVF manifest (optional)
-            # 6) OVF certificate (optional)
-            #
-            # For now we just validate #1.
-            if not tarf.getmembers():
-                raise VMInitError(1, "No files to untar", file_path)
-            # Make sure the provided file doesn't contain any malicious paths
-            # http://stackoverflow.com/questions/8112742/
-            for pathname in tarf.getnames():
-                logger.debug("Examining path of %s prior to untar", pathname)
-                if not (os.path.abspath(os.path.join(self.working_dir,
-                                                     pathname))
-                        .startswith(self.working_dir)):
-                    raise VMInitError(1, "Tar file contains malicious/unsafe "
-                                      "file path '{0}'!".format(pathname),
-                                      file_path)
-
-            ovf_descriptor = tarf.getmembers()[0]
-            if os.path.splitext(ovf_descriptor.name)[1] != '.ovf':
-                # Do we have an OVF descriptor elsewhere in the file?
-                candidates = [mem for mem in tarf.getmembers() if
-                              os.path.splitext(mem.name)[1] == '.ovf']
-                if not candidates:
-                    raise VMInitError(1,
-                                      "TAR file does not seem to contain any"
-                                      " .ovf file to serve as OVF descriptor"
-                                      " - OVA is invalid!",
-                                      file_path)
-                ovf_descriptor = candidates[0]
-                logger.error(
-                    "OVF file %s found, but is not the first file in the TAR "
-                    "as it should be - OVA is not standard-compliant!",
-                    ovf_descriptor.name)
-
-            # TODO: In theory we could read the ovf descriptor XML directly
-            # from the TAR and not need to even extract this file to disk...
             tarf.extract(ovf_descriptor, path=self.working_dir)
             logger.debug(
                 "Extracted OVF descriptor from %s to working dir %s",
                 file_path, self.working_dir)
-        finally:
-            tarf.close()
 
         # Find the OVF file
         return os.path.join(self.working_dir, ovf_descriptor.name)
 
-    def generate_manifest(self, ovf_file):
+    def generate_manifest(self, ovf_file, ovf_checksum=None):
         """Construct the manifest file for this package, if possible.
 
         Args:
           ovf_file (str): OVF descriptor file path
+          ovf_checksum (str): Checksum of the OVF descriptor, if already
+            known (such as from :meth:`write_xml`).
 
         Returns:
           bool: True if the manifest was successfully generated,
@@ -2716,38 +2984,62 @@ class OVF(VMDescription, XML):
         (prefix, _) = os.path.splitext(ovf_file)
         logger.verbose("Generating manifest for %s", ovf_file)
         manifest = prefix + '.mf'
-        with open(ovf_file, 'rb') as ovfobj:
-            checksum = file_checksum(ovfobj, self.checksum_algorithm)
+        if ovf_checksum is None:
+            with open(ovf_file, 'rb') as ovfobj:
+                ovf_checksum = file_checksum(ovfobj, self.checksum_algorithm)
+        # Checksum all referenced files concurrently up front, except for
+        # those carried over unchanged from the input manifest.
+        FileReference.compute_checksums(self.file_references.values(),
+                                        reuse_expected=True)
         with open(manifest, 'wb') as mfobj:
-            mfobj.write("{algo}({file})= {sum}\n"
-                        .format(algo=self.checksum_algorithm.upper(),
-                                file=os.path.basename(ovf_file),
-                                sum=checksum)
-                        .encode('utf-8'))
-            # Checksum all referenced files as well
-            for file_obj in self.references.findall(self.FILE):
-                file_name = file_obj.get(self.FILE_HREF)
-                file_ref = self.file_references[file_name]
-
-                mfobj.write("{algo}({file})= {sum}\n"
-                            .format(algo=self.checksum_algorithm.upper(),
-                                    file=file_name, sum=file_ref.checksum)
-                            .encode('utf-8'))
+            mfobj.write(self._manifest_contents(ovf_file, ovf_checksum))
 
         logger.debug("Manifest generated successfully")
         return True
 
-    def tar(self, ovf_descriptor, tar_file):
+    def _manifest_contents(self, ovf_file, ovf_checksum, checksum=None):
+        """Construct the contents of the manifest file for this package.
+
+        Args:
+          ovf_file (str): OVF descriptor file path
+          ovf_checksum (str): Checksum of the OVF descriptor
+          checksum (str): If set, use this placeholder value in place of the
+            actual checksum of each referenced file.
+
+        Returns:
+          bytes: Manifest file contents
+        """
+        lines = [(os.path.basename(ovf_file), ovf_checksum)]
+        for file_obj in self.references.findall(self.FILE):
+            file_name = file_obj.get(self.FILE_HREF)
+            lines.append((file_name, checksum or
+                          self.file_references[file_name].manifest_checksum))
+        return b"".join("{algo}({file})= {sum}\n"
+                        .format(algo=self.checksum_algorithm.upper(),
+                                file=file_name, sum=file_sum).encode('utf-8')
+                        for file_name, file_sum in lines)
+
+    def tar(self, ovf_descriptor, tar_file, generate_manifest=False,
+            ovf_checksum=None):
         """Create a .ova tar file based on the given OVF descriptor.
 
         Args:
           ovf_descriptor (str): File path for an OVF descriptor
           tar_file (str): File path for the desired OVA archive.
+          generate_manifest (bool): If True, generate the manifest on the fly,
+              hashing each file as it is copied into the archive. Otherwise,
+              include the existing manifest alongside ``ovf_descriptor``,
+              if any.
+          ovf_checksum (str): Checksum of ``ovf_descriptor``, if already
+              known (such as from :meth:`write_xml`), so that it need not
+              be hashed again as it is copied into the archive.
+
+        If ``tar_file`` is the input OVA and ``generate_manifest`` is True,
+        then where possible only the descriptor and manifest at the start of
+        the OVA are rewritten, leaving all other files untouched.
         """
         logger.verbose("Creating tar file %s", tar_file)
 
-        (prefix, _) = os.path.splitext(ovf_descriptor)
-
         # Issue #66 - need to detect any of the possible scenarios:
         # 1) output path and input path are the same real path
         #    (not just string-equal!)
@@ -2757,11 +3049,19 @@ class OVF(VMDescription, XML):
             (os.path.exists(tar_file) and
              os.path.samefile(self.input_file, tar_file))):
             # We're about to overwrite the input OVA with a new OVA.
-            # (Python tarfile module doesn't support in-place edits.)
-            # Any files that we need to carry over need to be extracted NOW!
+            # Any descriptor text still left in the OVA must be read first.
+            self.load_lazy_text()
+            # If only the descriptor and manifest changed, we can just
+            # rewrite them in place and leave the other files untouched.
+            if (generate_manifest and
+                    self._update_tar_in_place(ovf_descriptor, tar_file)):
+                return
+            # Otherwise, any files that we need to carry over need to be
+            # extracted NOW!
             logger.info(
                 "Input OVA will be overwritten. Extracting files from %s to"
                 " working directory before overwriting it.", self.input_file)
+            extracted = []
             for filename in self.file_references:
                 file_ref = self.file_references[filename]
                 if file_ref.file_path is None:
@@ -2770,30 +3070,179 @@ class OVF(VMDescription, XML):
                         self.working_dir, filename,
                         checksum_algorithm=self.checksum_algorithm,
                         expected_checksum=file_ref.checksum,
-                        expected_size=file_ref.size)
-
-        # Be sure to dereference any links to the actual file content!
-        with tarfile.open(tar_file, 'w', dereference=True) as tarf:
-            # OVF is always first
-            logger.debug("Adding OVF descriptor %s to %s",
-                         ovf_descriptor, tar_file)
-            tarf.add(ovf_descriptor, os.path.basename(ovf_descriptor))
-            # Add manifest if present
-            manifest_path = prefix + '.mf'
-            if os.path.exists(manifest_path):
-                logger.debug("Adding manifest to %s", tar_file)
-                tarf.add(manifest_path, os.path.basename(manifest_path))
-            if os.path.exists("{0}.cert".format(prefix)):
-                logger.warning("COT doesn't know how to re-sign a certificate"
-                               " file, so the existing certificate will be"
-                               " omitted from %s.", tar_file)
-            # Add all other files mentioned in the OVF
-            for file_obj in self.references.findall(self.FILE):
-                file_name = file_obj.get(self.FILE_HREF)
-                file_ref = self.file_references[file_name]
-                logger.debug("Adding associated file %s to %s",
-                             file_name, tar_file)
-                file_ref.add_to_archive(tarf)
+                        expected_size=file_ref.size,
+                        verify='off')
+                    extracted.append(self.file_references[filename])
+            FileReference.compute_checksums(extracted)
+            for file_ref in extracted:
+                file_ref.check_checksum()
+
+        # TarWriter always dereferences links to the actual file content,
+        # and copies file contents without passing them through Python.
+        try:
+            with TarWriter(tar_file) as tarf:
+                self._add_files_to_tar(tarf, ovf_descriptor,
+                                       generate_manifest, ovf_checksum)
+        except Exception:
+            # Don't leave a partial (and possibly truncated) OVA behind
+            if os.path.exists(tar_file):
+                os.remove(tar_file)
+            raise
+
+    def _add_files_to_tar(self, tarf, ovf_descriptor, generate_manifest,
+                          ovf_checksum):
+        """Add the OVF descriptor, manifest, and files to a new OVA.
+
+        Helper method for :meth:`tar`.
+
+        Args:
+          tarf (TarWriter): OVA being written.
+          ovf_descriptor (str): File path for an OVF descriptor
+          generate_manifest (bool): See :meth:`tar`.
+          ovf_checksum (str): See :meth:`tar`.
+        """
+        tar_file = tarf.path
+        (prefix, _) = os.path.splitext(ovf_descriptor)
+        # OVF is always first
+        logger.debug("Adding OVF descriptor %s to %s",
+                     ovf_descriptor, tar_file)
+        checksums = tarf.add(
+            ovf_descriptor, os.path.basename(ovf_descriptor),
+            [] if ovf_checksum else [self.checksum_algorithm])
+        ovf_checksum = (ovf_checksum or
+                        checksums[self.checksum_algorithm])
+        # Add manifest if present
+        manifest_path = prefix + '.mf'
+        manifest_offset = None
+        if generate_manifest:
+            # The manifest must precede the files it describes, but we
+            # don't know their checksums yet. Its size is predictable,
+            # though, so reserve space for it and fill it in at the end.
+            logger.debug("Reserving space for manifest in %s", tar_file)
+            tarinfo = tarf.gettarinfo(ovf_descriptor,
+                                      os.path.basename(manifest_path))
+            placeholder = "0" * len(ovf_checksum)
+            tarinfo.size = len(self._manifest_contents(
+                ovf_descriptor, ovf_checksum, placeholder))
+            manifest_offset = tarf.reserve(tarinfo)
+        elif os.path.exists(manifest_path):
+            logger.debug("Adding manifest to %s", tar_file)
+            tarf.add(manifest_path, os.path.basename(manifest_path))
+        if os.path.exists("{0}.cert".format(prefix)):
+            logger.warning("COT doesn't know how to re-sign a certificate"
+                           " file, so the existing certificate will be"
+                           " omitted from %s.", tar_file)
+        # Add all other files mentioned in the OVF
+        for file_obj in self.references.findall(self.FILE):
+            file_name = file_obj.get(self.FILE_HREF)
+            file_ref = self.file_references[file_name]
+            logger.debug("Adding associated file %s to %s",
+                         file_name, tar_file)
+            file_ref.add_to_archive(tarf)
+
+        if manifest_offset is not None:
+            logger.verbose("Generating manifest for %s", tar_file)
+            tarf.fill(manifest_offset,
+                      self._manifest_contents(ovf_descriptor,
+                                              ovf_checksum))
+
+    def _tar_in_place_offset(self, tar_file):
+        """Check whether an OVA can be updated by rewriting only its start.
+
+        This is possible if the OVA contains exactly the files referenced by
+        this OVF, in order, preceded only by the OVF descriptor and
+        (optionally) the manifest, and if every file reference still points
+        into this OVA.
+
+        Args:
+          tar_file (str): Path to the OVA to be overwritten.
+
+        Returns:
+          int: Offset of the header of the first referenced file in the OVA,
+          or None if the OVA cannot be updated in place.
+        """
+        try:
+            index = TarIndex.for_path(tar_file)
+        except (EnvironmentError, EOFError, tarfile.TarError):
+            return None
+        if not index.seekable:
+            return None
+        entries = []
+        for file_obj in self.references.findall(self.FILE):
+            file_ref = self.file_references.get(file_obj.get(self.FILE_HREF))
+            if (not isinstance(file_ref, FileInTAR) or
+                    file_ref.index is not index):
+                return None
+            entries.append(index.lookup(file_ref.filename))
+        members = [index.members[name] for name in index.names]
+        leading = members[:len(members) - len(entries)]
+        if (not entries or members[len(leading):] != entries or
+                [os.path.splitext(entry.tarinfo.name)[1]
+                 for entry in leading] not in (['.ovf'], ['.ovf', '.mf'])):
+            return None
+        return entries[0].tarinfo.offset
+
+    def _update_tar_in_place(self, ovf_descriptor, tar_file):
+        """Update the descriptor and manifest of an existing OVA in place.
+
+        The new descriptor and manifest must fit in the space occupied by
+        the old ones, as the referenced files are left exactly where they
+        are. Any remaining space is filled by padding the descriptor with
+        trailing whitespace, which is permitted after the end of an XML
+        document.
+
+        Args:
+          ovf_descriptor (str): File path for the new OVF descriptor.
+          tar_file (str): File path of the OVA to update.
+
+        Returns:
+          bool: True if the OVA was updated, False if it must be rewritten
+          by :meth:`tar` instead.
+        """
+        slot = self._tar_in_place_offset(tar_file)
+        if slot is None:
+            return False
+        (prefix, _) = os.path.splitext(ovf_descriptor)
+        ovf_info = TarWriter.gettarinfo(ovf_descriptor,
+                                        os.path.basename(ovf_descriptor))
+        mf_info = TarWriter.gettarinfo(ovf_descriptor,
+                                       os.path.basename(prefix + '.mf'))
+        with open(ovf_descriptor, 'rb') as obj:
+            ovf_data = obj.read()
+        placeholder = "0" * (hashlib.new(self.checksum_algorithm)
+                             .digest_size * 2)
+        mf_info.size = len(self._manifest_contents(ovf_descriptor,
+                                                   placeholder, placeholder))
+        ovf_info.size = (slot - len(ovf_info.tobuf(tarfile.DEFAULT_FORMAT)) -
+                         len(mf_info.tobuf(tarfile.DEFAULT_FORMAT)) -
+                         tar_entry_size(mf_info.size) + tarfile.BLOCKSIZE)
+        if ovf_info.size < len(ovf_data):
+            logger.debug("New descriptor (%d bytes) doesn't fit in the %d "
+                         "bytes available in %s", len(ovf_data),
+                         ovf_info.size, tar_file)
+            return False
+        ovf_data += b" " * (ovf_info.size - len(ovf_data))
+
+        logger.info("Input OVA will be overwritten. Only its descriptor and"
+                    " manifest have changed, so updating them in place.")
+        FileReference.compute_checksums(self.file_references.values(),
+                                        reuse_expected=True)
+        manifest = self._manifest_contents(
+            ovf_descriptor, file_checksum(io.BytesIO(ovf_data),
+                                          self.checksum_algorithm))
+        data = b"".join([
+            ovf_info.tobuf(tarfile.DEFAULT_FORMAT), ovf_data,
+            mf_info.tobuf(tarfile.DEFAULT_FORMAT), manifest,
+            tarfile.NUL * (-len(manifest) % tarfile.BLOCKSIZE),
+        ])
+        if len(data) != slot:
+            logger.debug("Unexpected manifest size - can't update in place")
+            return False
+        with open(tar_file, 'r+b') as obj:
+            obj.write(data)
+            obj.flush()
+            os.fsync(obj.fileno())
+        return True
 
     def _ensure_section(self, section_tag, info_string,
                         attrib=None, parent=None):
@@ -2819,10 +3268,7 @@ class OVF(VMDescription, XML):
 
         logger.notice("No existing %s. Creating it.",
                       XML.strip_ns(section_tag))
-        if attrib:
-            section = ET.Element(section_tag, attrib=attrib)
-        else:
-            section = ET.Element(section_tag)
+        section = self.make_element(section_tag, attrib)
         # Section elements may be in arbitrary order relative to one another,
         # but they MUST come after the References and before the VirtualSystem.
         # We'll construct them immediately before the VirtualSystem.
@@ -2832,6 +3278,7 @@ class OVF(VMDescription, XML):
                 break
             index += 1
         parent.insert(index, section)
+        self.children_changed(parent)
 
         # All Sections must have an Info child
         self.set_or_make_child(section, self.INFO, info_string)
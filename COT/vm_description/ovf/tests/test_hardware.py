@@ -15,6 +15,7 @@
 """Unit test cases for COT.vm_description.ovf.OVFHardware class."""
 
 from COT.tests import COTTestCase
+from COT.data_validation import natural_sort
 from COT.vm_description.ovf import OVF
 
 
@@ -54,3 +55,93 @@ class TestOVFHardware(COTTestCase):
         """Test that find_item returns None if no matches are found."""
         with OVF(self.input_ovf, None) as ovf:
             self.assertEqual(None, ovf.hardware.find_item(resource_type='usb'))
+
+    def test_indexes(self):
+        """Indexed lookups stay consistent with the underlying items."""
+        with OVF(self.input_ovf, None) as ovf:
+            hardware = ovf.hardware
+
+            def check(resource_type=None, properties=None, profiles=None):
+                """Compare find_all_items against a brute-force search."""
+                expected = [
+                    hardware.item_dict[instance] for instance in
+                    natural_sort(hardware.item_dict)
+                    if hardware.item_match(hardware.item_dict[instance],
+                                           resource_type, properties or {},
+                                           profiles)]
+                self.assertEqual(expected, hardware.find_all_items(
+                    resource_type, properties, profiles))
+                return expected
+
+            def check_all():
+                """Check a variety of lookups."""
+                self.assertEqual(3, len(check('ethernet')))
+                check('ide', {ovf.ADDRESS: '1'})
+                check('harddisk', {ovf.ADDRESS_ON_PARENT: '0'})
+                check(None, {ovf.PARENT: '4'})
+                check('cdrom', {ovf.HOST_RESOURCE: None})
+                check(None, {ovf.HOST_RESOURCE: 'ovf:/disk/vmdisk1'})
+                check('ethernet', profiles=['4CPU-4GB-3NIC'])
+                check()
+
+            check_all()
+            self.assertEqual(1, len(check('ide', {ovf.ADDRESS: '1'})))
+
+            hardware.set_item_count_per_profile('ethernet', 3, None)
+            hardware.set_value_for_all_items('harddisk', ovf.ADDRESS_ON_PARENT,
+                                             '1', None)
+            self.assertEqual(0, len(check('harddisk',
+                                          {ovf.ADDRESS_ON_PARENT: '0'})))
+            self.assertEqual(1, len(check('harddisk',
+                                          {ovf.ADDRESS_ON_PARENT: '1'})))
+            # A value differing between profiles isn't matched
+            nic = hardware.find_all_items('ethernet')[0]
+            nic.set_property(ovf.ADDRESS_ON_PARENT, '5', ['4CPU-4GB-3NIC'])
+            nic.set_property(ovf.ADDRESS_ON_PARENT, '6', ['1CPU-1GB-1NIC'])
+            self.assertEqual([], check(None, {ovf.ADDRESS_ON_PARENT: '5'}))
+
+            hardware.delete_item(hardware.find_item('harddisk'))
+            self.assertEqual([], check('harddisk'))
+            check_all()
+
+            # Clones share the OVF rather than copying it
+            (_, clone) = hardware.clone_item(nic, ['4CPU-4GB-3NIC'])
+            self.assertIs(clone.ovf, ovf)
+            self.assertEqual(4, len(check('ethernet')))
+
+    def test_update_xml(self):
+        """Only changed Items are regenerated when updating the XML."""
+        with OVF(self.input_ovf, None) as ovf:
+            hardware = ovf.hardware
+            section = ovf.virtual_hw_section
+            before = list(section)
+
+            disk = hardware.find_item('harddisk')
+            old_elements = disk.elements
+            self.assertEqual(1, len(old_elements))
+            disk.set_property(ovf.ADDRESS_ON_PARENT, '1')
+            hardware.update_xml()
+            after = list(section)
+            self.assertEqual(len(before), len(after))
+            for (old, new) in zip(before, after):
+                if old in old_elements:
+                    self.assertEqual(disk.elements, [new])
+                    self.assertEqual('1', new.find(
+                        disk.namespace + ovf.ADDRESS_ON_PARENT).text)
+                else:
+                    self.assertIs(old, new)
+            self.assertFalse(disk.modified)
+
+            # Nothing left to update
+            hardware.update_xml()
+            self.assertEqual(after, list(section))
+
+            # New items are inserted, deleted items removed
+            (_, serial) = hardware.new_item('serial')
+            hardware.update_xml()
+            self.assertEqual(len(after) + 1, len(section))
+            self.assertIn(serial.elements[0], list(section))
+            hardware.delete_item(disk)
+            hardware.update_xml()
+            self.assertEqual(len(after), len(section))
+            self.assertNotIn(disk.elements[0], list(section))
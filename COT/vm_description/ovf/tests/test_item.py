@@ -23,8 +23,10 @@ import xml.etree.ElementTree as ET
 from COT.tests import COTTestCase
 
 from COT.vm_description.ovf import OVF
-from COT.vm_description.ovf.name_helper import OVFNameHelper1
-from COT.vm_description.ovf.item import OVFItem
+from COT.vm_description.ovf.name_helper import (
+    OVFNameHelper0, OVFNameHelper1, OVFNameHelper2,
+)
+from COT.vm_description.ovf.item import OVFItem, ProfileRegistry
 
 
 class TestOVFItem(COTTestCase):
@@ -141,6 +143,81 @@ OVFItem:
          <rasd:AddressOnParent>11</rasd:AddressOnParent>
 """)
 
+    def test_names(self):
+        """Test the XML names bound to an item for each OVF version."""
+        ovfitem = OVFItem(None)
+        self.assertEqual(ovfitem.INSTANCE_ID, "InstanceID")
+        self.assertIn("INSTANCE_ID", vars(ovfitem))
+        self.assertEqual(ovfitem.ITEM,
+                         "{http://schemas.dmtf.org/ovf/envelope/1}Item")
+        self.assertEqual(ovfitem.EPASD, ovfitem.RASD)
+        with self.assertRaises(AttributeError):
+            ovfitem.NOT_A_NAME
+
+        helper = OVFNameHelper0()
+        self.assertEqual(helper.INSTANCE_ID, "InstanceId")
+        self.assertEqual(helper.DISK_SECTION, helper.OVF + "Section")
+        helper = OVFNameHelper2()
+        self.assertEqual(helper.ETHERNET_PORT_ITEM,
+                         helper.OVF + "EthernetPortItem")
+        self.assertNotEqual(helper.EPASD, helper.RASD)
+        self.assertEqual(helper.NAMES['SASD'], helper.SASD)
+        with self.assertRaises(AttributeError):
+            helper.NOT_A_NAME
+
+    def test_profile_registry(self):
+        """Test the profile masks shared by all items in an OVF."""
+        registry = ProfileRegistry()
+        self.assertEqual(registry.mask([None]), ProfileRegistry.ANY)
+        self.assertEqual(registry.mask([]), 0)
+        foo = registry.bit("foo")
+        bar = registry.bit("bar")
+        self.assertEqual(registry.mask(["bar", "foo"]), foo | bar)
+        self.assertEqual(registry.bit("foo"), foo)
+        self.assertEqual(registry.profiles(foo | ProfileRegistry.ANY),
+                         set([None, "foo"]))
+        self.assertEqual(registry.profiles(0), set())
+
+        ovf = OVF(self.input_ovf, None)
+        try:
+            item = ovf.hardware.item_dict['11']
+            self.assertIs(item.profile_registry, ovf.profile_registry)
+            clone = ovf.hardware.clone_item(item, ["2CPU-2GB-1NIC"])[1]
+            self.assertIs(clone.profile_registry, ovf.profile_registry)
+            self.assertTrue(clone.has_profile("2CPU-2GB-1NIC"))
+            self.assertFalse(clone.has_profile("4CPU-4GB-3NIC"))
+            self.assertEqual(item.property_profiles(ovf.ADDRESS_ON_PARENT,
+                                                    "11"),
+                             set([None]))
+        finally:
+            ovf.destroy()
+
+    def test_get_nonintersecting_set_list(self):
+        """Test grouping of profiles by their property values."""
+        ovf = OVF(self.input_ovf, None)
+        try:
+            # InstanceID 11, NIC 0 (default, under all profiles)
+            item = ovf.hardware.item_dict['11']
+            self.assertEqual([""], item.get_nonintersecting_set_list())
+
+            item.set_property(ovf.ADDRESS_ON_PARENT, "12",
+                              ["1CPU-1GB-1NIC"])
+            self.assertEqual(["", "1CPU-1GB-1NIC"],
+                             item.get_nonintersecting_set_list())
+
+            item.set_property(ovf.ELEMENT_NAME, "eth0",
+                              ["4CPU-4GB-3NIC", "1CPU-1GB-1NIC"])
+            item.remove_profile("2CPU-2GB-1NIC")
+            self.assertEqual(["1CPU-1GB-1NIC", "4CPU-4GB-3NIC"],
+                             item.get_nonintersecting_set_list())
+
+            item.set_property(ovf.ADDRESS_ON_PARENT, "12",
+                              ["4CPU-4GB-3NIC"])
+            self.assertEqual(["1CPU-1GB-1NIC 4CPU-4GB-3NIC"],
+                             item.get_nonintersecting_set_list())
+        finally:
+            ovf.destroy()
+
     def test_set_property(self):
         """Test cases for set_property() and related methods."""
         ovf = OVF(self.input_ovf, self.temp_file)
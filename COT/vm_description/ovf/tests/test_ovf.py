@@ -28,9 +28,10 @@ import mock
 
 from COT.tests import COTTestCase
 from COT.vm_description.ovf import OVF
-from COT.vm_description import VMInitError
-from COT.data_validation import ValueUnsupportedError
+from COT.vm_description import VMDescription, VMInitError
+from COT.data_validation import ValueUnsupportedError, file_checksum
 from COT.helpers import helpers, HelperError
+from COT.utilities import tar_entry_size
 
 logger = logging.getLogger(__name__)
 
@@ -270,6 +271,16 @@ ovf:size="{cfg_size}" />
         # self.assertLogged(msg="Capacity of disk.*seems to have changed.*"
         #                  "The updated OVF will reflect this change.")
 
+    def test_tar_error(self):
+        """A partially written OVA is not left behind after an error."""
+        ova_path = os.path.join(self.temp_dir, "temp.ova")
+        with mock.patch('COT.file_reference.FileOnDisk.add_to_archive',
+                        side_effect=IOError("oops")):
+            ovf = OVF(self.input_ovf, ova_path)
+            self.assertRaises(IOError, ovf.write)
+            ovf.destroy()
+        self.assertFalse(os.path.exists(ova_path))
+
     def test_tar_untar(self):
         """Output OVF to OVA and vice versa."""
         # Read OVF and write to OVA
@@ -319,6 +330,188 @@ ovf:size="{cfg_size}" />
                     "{0} file changed after OVF->OVA->OVF conversion"
                     .format(ext))
 
+    def test_read_only_ova(self):
+        """Read-only access to an OVA reads the descriptor in place."""
+        ova_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_path, 'w') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+            tarf.add(self.input_manifest, 'input.mf')
+            tarf.add(self.input_vmdk, 'input.vmdk')
+            tarf.add(self.input_iso, 'input.iso')
+            tarf.add(self.sample_cfg, 'sample_cfg.txt')
+        with OVF(ova_path, None) as ova:
+            self.assertEqual(ova.ovf_descriptor, 'input.ovf')
+            # Nothing was extracted to the working directory
+            self.assertEqual(os.listdir(ova.working_dir), [])
+            self.assertEqual(ova.product, "PRODUCT")
+            self.assertEqual(sorted(ova.file_references.keys()),
+                             ['input.iso', 'input.vmdk', 'sample_cfg.txt'])
+
+    def test_verify_policy(self):
+        """Verification of an OVA against its manifest can be deferred."""
+        ova_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_path, 'w') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+            tarf.add(self.input_manifest, 'input.mf')
+            # Wrong contents, and hence wrong size and checksum
+            tarf.add(self.blank_vmdk, 'input.vmdk')
+            tarf.add(self.input_iso, 'input.iso')
+            tarf.add(self.sample_cfg, 'sample_cfg.txt')
+        size_msg = {
+            'levelname': 'WARNING',
+            'msg': "The size of file '%s' is expected to be %s bytes,"
+                   " but is actually %s bytes.",
+        }
+        checksum_msg = {
+            'levelname': 'ERROR',
+            'msg': "The %s checksum for file '%s' is expected to be",
+        }
+
+        with OVF(ova_path, None) as ova:
+            self.assertEqual(ova.verify, 'eager')
+            self.assertLogged(**size_msg)
+            self.assertLogged(**checksum_msg)
+
+        with OVF(ova_path, None, verify='lazy') as ova:
+            self.assertLogged(**size_msg)
+            self.assertNoLogsOver(logging.INFO)
+            ova.file_references['input.iso'].copy_to(self.temp_dir)
+            self.assertNoLogsOver(logging.INFO)
+            ova.file_references['input.vmdk'].copy_to(self.temp_dir)
+            self.assertLogged(**checksum_msg)
+
+        with OVF(ova_path, None, verify='off') as ova:
+            self.assertLogged(**size_msg)
+            ova.file_references['input.vmdk'].copy_to(self.temp_dir)
+            self.assertNoLogsOver(logging.INFO)
+
+        self.assertRaises(VMInitError, VMDescription.factory,
+                          ova_path, None, verify='sometimes')
+
+    def test_rewrite_reuses_checksums(self):
+        """Files carried over unchanged are not rehashed when writing."""
+        ova_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_path, 'w') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+            tarf.add(self.input_manifest, 'input.mf')
+            tarf.add(self.input_vmdk, 'input.vmdk')
+            tarf.add(self.input_iso, 'input.iso')
+            tarf.add(self.sample_cfg, 'sample_cfg.txt')
+        output_ova = os.path.join(self.temp_dir, "output.ova")
+
+        # Eager verification hashes each file once, when loading
+        with OVF(ova_path, output_ova) as ova:
+            with mock.patch('COT.file_reference.file_checksums') as mock_cksum:
+                ova.write()
+                mock_cksum.assert_not_called()
+        # Other than the descriptor itself, the manifest is unchanged
+        with tarfile.open(output_ova, 'r') as tarf:
+            output_mf = tarf.extractfile('output.mf').read().splitlines()
+        with open(self.input_manifest, 'rb') as mfobj:
+            input_mf = mfobj.read().splitlines()
+        self.assertEqual(output_mf[1:], input_mf[1:])
+
+        # Lazy verification defers hashing until the files are copied
+        with OVF(ova_path, output_ova, verify='lazy') as ova:
+            with mock.patch.object(ova, 'tar'):
+                with mock.patch('COT.file_reference.file_checksums') as mcs:
+                    ova.write()
+                    mcs.assert_not_called()
+
+    def test_update_in_place(self):
+        """Overwriting an OVA only rewrites its descriptor and manifest."""
+        ova_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_path, 'w') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+            tarf.add(self.input_manifest, 'input.mf')
+            tarf.add(self.input_vmdk, 'input.vmdk')
+            tarf.add(self.input_iso, 'input.iso')
+            tarf.add(self.sample_cfg, 'sample_cfg.txt')
+        with tarfile.open(ova_path, 'r') as tarf:
+            offsets = [(tarinfo.name, tarinfo.offset_data)
+                       for tarinfo in tarf.getmembers()[2:]]
+        size = os.path.getsize(ova_path)
+
+        ova = OVF(ova_path, ova_path)
+        ova.product = "New product"
+        # No working directory space needed for the referenced files
+        self.assertEqual(ova.predicted_working_dir_size(),
+                         ova.predicted_output_size() -
+                         sum(tar_entry_size(file_ref.size) for file_ref
+                             in ova.file_references.values()))
+        ova.write()
+        self.assertLogged(msg="Only its descriptor and manifest have"
+                              " changed, so updating them in place.")
+        # Nothing was extracted
+        self.assertEqual(os.listdir(ova.working_dir), ['input.ovf'])
+        ova.destroy()
+
+        self.assertEqual(os.path.getsize(ova_path), size)
+        with tarfile.open(ova_path, 'r') as tarf:
+            self.assertEqual(tarf.getnames()[:2], ['input.ovf', 'input.mf'])
+            self.assertEqual([(tarinfo.name, tarinfo.offset_data)
+                              for tarinfo in tarf.getmembers()[2:]],
+                             offsets)
+            tarf.extract('input.vmdk', self.temp_dir)
+        self.assertTrue(filecmp.cmp(self.input_vmdk,
+                                    os.path.join(self.temp_dir,
+                                                 'input.vmdk')))
+        # The updated OVA is valid, and its manifest is correct
+        with OVF(ova_path, None) as ova:
+            self.assertEqual(ova.product, "New product")
+        self.assertNoLogsOver(logging.INFO)
+
+        # If the new descriptor doesn't fit, fall back to a full rewrite
+        ova = OVF(ova_path, ova_path)
+        ova.product = "x" * 2048
+        ova.write()
+        self.assertLogged(msg="Input OVA will be overwritten. Extracting"
+                              " files from %s to working directory"
+                              " before overwriting it.")
+        ova.destroy()
+        with OVF(ova_path, None) as ova:
+            self.assertEqual(ova.product, "x" * 2048)
+        self.assertNoLogsOver(logging.INFO)
+
+    def test_hash_while_writing(self):
+        """Files are hashed as they are copied into the output OVA."""
+        ova_path = os.path.join(self.temp_dir, "input.ova")
+        with tarfile.open(ova_path, 'w') as tarf:
+            tarf.add(self.input_ovf, 'input.ovf')
+            tarf.add(self.input_manifest, 'input.mf')
+            tarf.add(self.input_vmdk, 'input.vmdk')
+            tarf.add(self.input_iso, 'input.iso')
+            tarf.add(self.sample_cfg, 'sample_cfg.txt')
+        output_ova = os.path.join(self.temp_dir, "output.ova")
+
+        with OVF(ova_path, output_ova, verify='lazy') as ova:
+            with mock.patch('COT.file_reference.file_checksums') as mcs:
+                ova.write()
+                mcs.assert_not_called()
+
+        with tarfile.open(output_ova, 'r') as tarf:
+            self.assertEqual(tarf.getnames(),
+                             ['output.ovf', 'output.mf', 'input.vmdk',
+                              'input.iso', 'sample_cfg.txt'])
+            output_mf = tarf.extractfile('output.mf').read().splitlines()
+            ovf_checksum = file_checksum(tarf.extractfile('output.ovf'),
+                                         'sha1')
+        with open(self.input_manifest, 'rb') as mfobj:
+            input_mf = mfobj.read().splitlines()
+        self.assertEqual(output_mf[0],
+                         "SHA1(output.ovf)= {0}".format(ovf_checksum)
+                         .encode('utf-8'))
+        self.assertEqual(output_mf[1:], input_mf[1:])
+
+        # Likewise when extracting files from an OVA to an OVF
+        output_ovf = os.path.join(self.temp_dir, "output.ovf")
+        with OVF(ova_path, output_ovf, verify='lazy') as ova:
+            with mock.patch('COT.file_reference.file_checksums') as mcs:
+                ova.write()
+                mcs.assert_not_called()
+        with open(os.path.join(self.temp_dir, "output.mf"), 'rb') as mfobj:
+            self.assertEqual(mfobj.read().splitlines()[1:], input_mf[1:])
+
     def test_tar_links(self):
         """Check that OVA dereferences symlinks and hard links."""
         self.staging_dir = tempfile.mkdtemp(prefix="cot_ut_ovfio_stage")
@@ -517,6 +710,21 @@ class TestOVFAPI(COTTestCase):
                 "predicted output size of {0} was {1} but actual size is {2}"
                 .format(input_file, predicted, actual))
 
+    def test_predicted_working_dir_size(self):
+        """Files that can share storage need no working dir space."""
+        with OVF(self.input_ovf, None) as ovf:
+            predicted = ovf.predicted_output_size()
+            with mock.patch('COT.file_reference.shares_storage',
+                            return_value=False):
+                self.assertEqual(ovf.predicted_working_dir_size(), predicted)
+            with mock.patch('COT.file_reference.shares_storage',
+                            return_value=True):
+                self.assertEqual(
+                    ovf.predicted_working_dir_size(),
+                    predicted - sum(tar_entry_size(file_ref.size)
+                                    for file_ref in
+                                    ovf.file_references.values()))
+
     def test_configuration_profiles(self):
         """Check profile id list APIs."""
         # No profiles defined
@@ -71,6 +71,7 @@ class TestVMDescription(unittest.TestCase):
                           ins.write)
 
         self.assertRaises(NotImplementedError, ins.predicted_output_size)
+        self.assertRaises(NotImplementedError, ins.predicted_working_dir_size)
 
         ins.destroy()
         self.assertFalse(os.path.exists(ins.working_dir))
@@ -226,6 +227,10 @@ class TestVMDescription(unittest.TestCase):
                           ins.get_property_value, None)
         self.assertRaises(NotImplementedError,
                           ins.set_property_value, None, None)
+        self.assertRaises(NotImplementedError,
+                          ins.set_property_values, {})
+        self.assertRaises(NotImplementedError,
+                          ins.import_properties, [])
         self.assertRaises(NotImplementedError,
                           ins.config_file_to_properties, self.TEXT_FILE)
 
@@ -34,6 +34,7 @@ import tempfile
 import warnings
 
 from COT.data_validation import ValueUnsupportedError
+from COT.file_reference import VERIFY_POLICIES
 from COT.utilities import directory_size, pretty_bytes
 
 logger = logging.getLogger(__name__)
@@ -100,6 +101,13 @@ class VMDescription(object):
       version_long
     """
 
+    VERIFY_POLICY = 'eager'
+    """Default checksum verification policy for files in a VM description.
+
+    One of :data:`~COT.file_reference.VERIFY_POLICIES`; see
+    :class:`~COT.file_reference.FileReference` for details.
+    """
+
     # Many of these methods are abstract interfaces, so quiet, Pylint!
     # pylint: disable=missing-raises-doc
     # pylint: disable=redundant-returns-doc
@@ -129,7 +137,9 @@ class VMDescription(object):
           input_file (str): Input file to test against each class's
             :meth:`detect_type_from_name` implementation.
           *args: Passed through to selected subclass :meth:`__init__`.
-          **kwargs: Passed through to selected subclass :meth:`__init__`.
+          **kwargs: Passed through to selected subclass :meth:`__init__`,
+            notably ``verify`` to select the checksum verification policy
+            (default :attr:`VERIFY_POLICY`).
 
         Returns:
           VMDescription: appropriate subclass instance.
@@ -169,7 +179,7 @@ class VMDescription(object):
 
         return vm
 
-    def __init__(self, input_file, output_file=None):
+    def __init__(self, input_file, output_file=None, verify=None):
         """Read the given VM description file into memory.
 
         Also creates a temporary directory as a working directory.
@@ -182,6 +192,12 @@ class VMDescription(object):
                 this value should be ``None``
               * If the output filename is not yet known, use ``""`` and
                 subsequently set :attr:`output` when it is determined.
+          verify (str): When to verify the checksums of files referenced by
+            this VM, one of :data:`~COT.file_reference.VERIFY_POLICIES`.
+            If unset, :attr:`VERIFY_POLICY` is used.
+
+        Raises:
+          ValueUnsupportedError: if ``verify`` is not a supported policy.
         """
         self._input_file = input_file
         self._product_class = None
@@ -191,6 +207,12 @@ class VMDescription(object):
         self._output_file = None
         self.output_file = output_file
         atexit.register(self.destroy)
+        if verify is None:
+            verify = self.VERIFY_POLICY
+        if verify not in VERIFY_POLICIES:
+            raise ValueUnsupportedError("verify", verify, VERIFY_POLICIES)
+        self.verify = verify
+        """Checksum verification policy for files referenced by this VM."""
 
     def __enter__(self):
         """Begin a block using this VM as a context manager object."""
@@ -367,6 +389,18 @@ class VMDescription(object):
         """
         raise NotImplementedError("predicted_output_size not implemented")
 
+    def predicted_working_dir_size(self):
+        """Estimate how much disk space (in bytes) the working dir may need.
+
+        By default, assumes the entire VM may be written to the working
+        directory. Subclasses may refine this, for example by excluding
+        files whose copies would share storage with the originals.
+
+        Returns:
+          int: Estimated number of bytes consumed in :attr:`working_dir`.
+        """
+        return self.predicted_output_size()
+
     # API methods needed for add-disk
     def convert_disk_if_needed(self,   # pylint: disable=no-self-use
                                disk_image,
@@ -832,6 +866,34 @@ class VMDescription(object):
         """
         raise NotImplementedError("set_property_value not implemented")
 
+    def set_property_values(self, values, user_configurable=None):
+        """Set the values of many properties at once.
+
+        Args:
+          values (object): Dict of property identifier --> value, or list
+              of (identifier, value) pairs.
+          user_configurable (bool): Should these properties be configurable
+              at deployment time by the user?
+
+        Returns:
+          list: The (converted) value that was set for each property.
+        """
+        raise NotImplementedError("set_property_values not implemented")
+
+    def import_properties(self, properties):
+        """Create or update many properties at once.
+
+        Args:
+          properties (list): Dicts of keyword arguments (``key``, ``value``,
+              and optionally ``user_configurable``, ``property_type``,
+              ``label``, and ``description``) to
+              :meth:`set_property_value`.
+
+        Returns:
+          list: The (converted) value that was set for each property.
+        """
+        raise NotImplementedError("import_properties not implemented")
+
     def config_file_to_properties(self, file_path, user_configurable=None):
         """Import each line of a text file into a configuration property.
 
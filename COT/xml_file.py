@@ -14,18 +14,605 @@
 # of COT, including this file, may be copied, modified, propagated, or
 # distributed except according to the terms contained in the LICENSE.txt file.
 
-"""Reading, editing, and writing XML files."""
+"""Reading, editing, and writing XML files.
+
+If :mod:`lxml` is installed (``pip install cot[lxml]``), it is used to parse XML and to construct new
+elements, as it is considerably faster than :mod:`xml.etree.ElementTree`
+for large documents. Otherwise (or if the ``COT_NO_LXML`` environment
+variable is set), :mod:`xml.etree.ElementTree` is used instead. Either way,
+XML is always written out by :mod:`xml.etree.ElementTree`, so the output
+is identical regardless of which backend is in use.
+
+XML is written by :meth:`XML.serialize_xml`, which streams the indented
+document in chunks without modifying the element tree, producing exactly the
+same bytes as :meth:`XML.xml_reindent` followed by
+:meth:`xml.etree.ElementTree.ElementTree.write` would.
+
+When :mod:`xml.etree.ElementTree` is in use, large documents are parsed
+with :mod:`xml.parsers.expat` directly, so that the text of very long
+elements (such as license agreements) can be left in the file, only being
+read into memory if it is actually accessed, and otherwise copied verbatim
+when writing the XML back out. See :meth:`XML.__init__`.
+"""
 
 import xml.etree.ElementTree as ET
+from xml.etree import ElementPath
+from xml.parsers import expat
+import codecs
+import hashlib
 import logging
+import os
 import re
+import sys
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 logger = logging.getLogger(__name__)
 
+# Escape text exactly as xml.etree.ElementTree does,
+# as its behavior varies between Python versions.
+if sys.version_info[0] >= 3:
+    _escape_cdata = ET._escape_cdata      # pylint: disable=protected-access
+    _escape_attrib = ET._escape_attrib    # pylint: disable=protected-access
+else:   # pragma: no cover
+    # Python 2.x ElementTree encodes its output as it escapes it
+    def _escape_cdata(text):
+        """Escape element text. Returns unicode."""
+        return ET._escape_cdata(text, 'utf-8').decode('utf-8')
+
+    def _escape_attrib(text):
+        """Escape an attribute value. Returns unicode."""
+        return ET._escape_attrib(text, 'utf-8').decode('utf-8')
+
+_SORT_ATTRIBUTES = (sys.version_info < (3, 8))
+"""ElementTree sorts attributes by name in Python versions before 3.8."""
+
+
+def _namespaces(root):
+    """Assign a prefix to each namespace used in the given tree.
+
+    Namespaces are numbered and registered prefixes are used exactly as
+    ElementTree does when writing XML, but unlike ElementTree, element text
+    is never examined, so lazily loaded text is not read.
+
+    Args:
+      root (xml.etree.ElementTree.Element): Root of the tree.
+    Returns:
+      tuple: (qualified name --> prefixed name, namespace URI --> prefix)
+    """
+    qnames = {}
+    namespaces = {}
+    for elem in root.iter():
+        names = [elem.tag]
+        for key, value in elem.items():
+            names.append(key)
+            if isinstance(value, ET.QName):
+                names.append(value)
+        for name in names:
+            if isinstance(name, ET.QName):
+                name = name.text
+            if name not in qnames:
+                qnames[name] = _prefixed_name(name, namespaces)
+    return (qnames, namespaces)
+
+
+def _prefixed_name(qname, namespaces):
+    """Get the prefixed form of a qualified name, as ElementTree would.
+
+    Args:
+      qname (str): Name in "{namespace}name" form, or an unqualified name.
+      namespaces (dict): Namespace URI --> prefix, updated as needed.
+    Returns:
+      str: Name in "prefix:name" form.
+    """
+    if qname[:1] != "{":
+        return qname
+    (uri, local) = qname[1:].rsplit("}", 1)
+    prefix = namespaces.get(uri)
+    if prefix is None:
+        # pylint: disable=protected-access
+        prefix = ET._namespace_map.get(uri)
+        if prefix is None:
+            prefix = "ns{0}".format(len(namespaces))
+        if prefix != "xml":
+            namespaces[uri] = prefix
+    return "{0}:{1}".format(prefix, local) if prefix else local
+
+
+_ELEMENT_TEXT = ET.Element.__dict__.get('text')
+"""Descriptor providing access to the text stored in an element."""
+
+_LAZY_TEXT_SUPPORTED = hasattr(_ELEMENT_TEXT, '__set__')
+"""Whether element text can be loaded lazily (see :class:`_LazyTextElement`).
+
+This requires the C implementation of ElementTree, as it is the only one in
+which element text is stored separately from the ``text`` attribute.
+"""
+
+
+class _TextSource(object):
+    """File from which the text of :class:`_LazyTextElement` is read."""
+
+    READ_SIZE = 64 * 1024
+    """Number of bytes to read at a time."""
+
+    def __init__(self, path, offset):
+        """Record the identity of the file the XML is being parsed from.
+
+        Args:
+          path (str): Path to the file
+          offset (int): Offset of the start of the XML within the file
+        """
+        self.path = path
+        self.offset = offset
+        self.identity = self._identity()
+
+    def _identity(self):
+        """Get the values that change whenever the file is modified.
+
+        Returns:
+          tuple: (device, inode, size, modification time)
+        """
+        stat = os.stat(self.path)
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def iter_bytes(self, start, end):
+        """Read the given byte range of the XML, in pieces.
+
+        Args:
+          start (int): Offset of the data within the XML
+          end (int): Offset of the end of the data within the XML
+
+        Yields:
+          bytes: Successive pieces of the data.
+
+        Raises:
+          IOError: if the file has been modified since it was parsed.
+        """
+        if self._identity() != self.identity:
+            raise IOError("{0} has been modified since it was read, so text "
+                          "can no longer be loaded from it".format(self.path))
+        with open(self.path, 'rb') as fileobj:
+            fileobj.seek(self.offset + start)
+            remaining = end - start
+            while remaining > 0:
+                buf = fileobj.read(min(remaining, self.READ_SIZE))
+                if not buf:
+                    raise IOError("Unexpected end of file in {0}"
+                                  .format(self.path))
+                remaining -= len(buf)
+                yield buf
+
+
+class _SourceElement(ET.Element):
+    """Element constructed by :class:`_LazyTextParser`.
+
+    As the C implementation of ElementTree bypasses the ``text`` attribute of
+    child elements in :meth:`findtext` and :meth:`itertext`, these use the
+    Python implementation instead, so that :class:`_LazyTextElement` children
+    are handled properly.
+    """
+
+    __slots__ = ()
+
+    def findtext(self, path, default=None, namespaces=None):
+        """See :meth:`xml.etree.ElementTree.Element.findtext`."""
+        return ElementPath.findtext(self, path, default, namespaces)
+
+    def itertext(self):
+        """See :meth:`xml.etree.ElementTree.Element.itertext`."""
+        if self.text:
+            yield self.text
+        for child in self:
+            for text in child.itertext():
+                yield text
+            if child.tail:
+                yield child.tail
+
+
+class _LazyTextElement(_SourceElement):
+    """Element whose text is left in the source file until first accessed.
+
+    Until then, :meth:`raw_text` provides the original markup of the text,
+    which :meth:`XML.serialize_xml` writes out verbatim.
+    """
+
+    __slots__ = ('_text_range',)
+
+    def set_text_range(self, source, start, end):
+        """Set the location of this element's text.
+
+        Args:
+          source (_TextSource): File containing the text
+          start (int): Offset of the first byte of the text within the XML
+          end (int): Offset of the byte after the text
+        """
+        self._text_range = (source, start, end)
+
+    def raw_text(self):
+        """Get the original markup of this element's text, if not yet loaded.
+
+        Returns:
+          generator: Yielding successive pieces of the text (as str),
+          or None if the text has already been loaded or replaced.
+        """
+        if self._text_range is None:
+            return None
+        (source, start, end) = self._text_range
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        return (decoder.decode(buf) for buf in source.iter_bytes(start, end))
+
+    @property
+    def text(self):
+        """Element text, loaded from the source file when first accessed."""
+        pieces = self.raw_text()
+        if pieces is not None:
+            markup = "<t>" + "".join(pieces) + "</t>"
+            _ELEMENT_TEXT.__set__(
+                self, ET.fromstring(markup.encode('utf-8')).text or "")
+            self._text_range = None
+        return _ELEMENT_TEXT.__get__(self)
+
+    @text.setter
+    def text(self, value):
+        """Replace the element text, discarding its original location."""
+        self._text_range = None
+        _ELEMENT_TEXT.__set__(self, value)
+
+    def __copy__(self):
+        """Copy this element, loading its text first."""
+        _ = self.text
+        return ET.Element.__copy__(self)
+
+    def __deepcopy__(self, memo):
+        """Deep-copy this element, loading its text first."""
+        _ = self.text
+        return ET.Element.__deepcopy__(self, memo)
+
+
+class _LazyTextParser(object):
+    """Parse XML into a tree, leaving long element text in the source file.
+
+    :func:`xml.etree.ElementTree.iterparse` does not report where in the file
+    each event occurred, so this uses :mod:`xml.parsers.expat` directly,
+    building a tree just as :class:`xml.etree.ElementTree.XMLParser` does.
+    Element text at least :attr:`XML.LAZY_TEXT_MIN_SIZE` characters long
+    is not kept in memory; instead, the element is a
+    :class:`_LazyTextElement` that records where the text can be found.
+    """
+
+    def __init__(self, source, min_size):
+        """Create a parser.
+
+        Args:
+          source (_TextSource): File being parsed
+          min_size (int): Minimum length of text to leave in the file
+        """
+        self.source = source
+        self.min_size = min_size
+        self.lazy_elements = []
+        self.root = None
+        self._stack = []
+        self._last = None
+        self._in_tail = False
+        self._names = {}
+        # Current run of character data
+        self._pieces = []
+        self._size = 0
+        self._start = None
+        self._lazy_allowed = True
+
+        parser = expat.ParserCreate(namespace_separator="}")
+        parser.ordered_attributes = True
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._data
+        parser.StartCdataSectionHandler = self._start_cdata
+        parser.XmlDeclHandler = self._xml_decl
+        parser.StartDoctypeDeclHandler = self._doctype
+        self._parser = parser
+
+    def parse(self, fileobj):
+        """Parse the XML read from the given file object.
+
+        Args:
+          fileobj (file): File object to read from
+        Returns:
+          xml.etree.ElementTree.Element: Root element of the parsed tree.
+        Raises:
+          xml.etree.ElementTree.ParseError: if parsing fails
+        """
+        try:
+            while True:
+                buf = fileobj.read(self.source.READ_SIZE)
+                if not buf:
+                    break
+                self._parser.Parse(buf, False)
+            self._parser.Parse(b"", True)
+        except expat.ExpatError as exc:
+            # Report errors exactly as xml.etree.ElementTree would
+            err = ET.ParseError(str(exc))
+            err.code = exc.code
+            err.position = (exc.lineno, exc.offset)
+            raise err
+        return self.root
+
+    def _fixname(self, key):
+        """Convert an expat name to ElementTree "{namespace}name" form."""
+        try:
+            return self._names[key]
+        except KeyError:
+            name = key
+            if "}" in name:
+                name = "{" + name
+            self._names[key] = name
+            return name
+
+    def _xml_decl(self, _version, encoding, _standalone):
+        """Only UTF-8 text can be written out verbatim when lazily loaded."""
+        if encoding and encoding.lower() not in ['utf-8', 'utf8', 'us-ascii']:
+            self._lazy_allowed = False
+
+    def _doctype(self, *_):
+        """Text may depend on entities declared in the DTD, so load it all."""
+        self._lazy_allowed = False
+
+    def _start_cdata(self):
+        """Note the start of a CDATA section, if it starts some text."""
+        if self._start is None:
+            self._start = self._parser.CurrentByteIndex
+
+    def _data(self, text):
+        """Accumulate character data, dropping it if it becomes too long."""
+        if self._start is None:
+            self._start = self._parser.CurrentByteIndex
+        self._size += len(text)
+        if self._pieces is not None:
+            self._pieces.append(text)
+            if (self._size >= self.min_size and self._lazy_allowed and
+                    not self._in_tail):
+                self._pieces = None
+
+    def _flush(self):
+        """Store the current run of character data as text or tail."""
+        if self._start is None:
+            return
+        if self._pieces is None:
+            # Swap the current element for a lazy one. As this is its text,
+            # rather than its tail, it doesn't have any children yet.
+            elem = _LazyTextElement(self._last.tag, self._last.attrib)
+            elem.set_text_range(self.source, self._start,
+                                self._parser.CurrentByteIndex)
+            if len(self._stack) > 1:
+                self._stack[-2][-1] = elem
+            else:
+                self.root = elem
+            self._stack[-1] = elem
+            self._last = elem
+            self.lazy_elements.append(elem)
+        elif self._in_tail:
+            self._last.tail = "".join(self._pieces)
+        else:
+            self._last.text = "".join(self._pieces)
+        self._pieces = []
+        self._size = 0
+        self._start = None
+
+    def _start_element(self, tag, attrib_list):
+        """Create a new element."""
+        self._flush()
+        attrib = {}
+        for i in range(0, len(attrib_list), 2):
+            attrib[self._fixname(attrib_list[i])] = attrib_list[i + 1]
+        elem = _SourceElement(self._fixname(tag), attrib)
+        if self._stack:
+            self._stack[-1].append(elem)
+        else:
+            self.root = elem
+        self._stack.append(elem)
+        self._last = elem
+        self._in_tail = False
+
+    def _end_element(self, _tag):
+        """Close the current element."""
+        self._flush()
+        self._last = self._stack.pop()
+        self._in_tail = True
+
 
 class XML(object):
     """Class capable of reading, editing, and writing XML files."""
 
+    ETREE = (lxml_etree if os.environ.get('COT_NO_LXML') is None and
+             lxml_etree is not None else ET)
+    """ElementTree implementation used to parse XML and create elements.
+
+    This is :mod:`lxml.etree` if available, else
+    :mod:`xml.etree.ElementTree`.
+    """
+
+    PARSE_ERRORS = ((ET.ParseError,) if lxml_etree is None else
+                    (ET.ParseError, lxml_etree.ParseError))
+    """Exception classes that may be raised when XML parsing fails."""
+
+    _xpaths = {}
+    """Cache of compiled :mod:`lxml` XPath child queries."""
+
+    INDEX_MIN_CHILDREN = 16
+    """Parents with at least this many children have them indexed.
+
+    See :meth:`find_all_children`.
+    """
+
+    INDEX_MAX_PARENTS = 64
+    """Maximum number of parent elements to keep child indexes for."""
+
+    LAZY_TEXT_MIN_SIZE = 64 * 1024
+    """Element text at least this long may be left on disk until needed.
+
+    See :meth:`__init__`.
+    """
+
+    _child_index = {}
+    """Parent --> {(tag, attribute names) --> {attribute values --> children}}.
+
+    See :meth:`find_all_children` and :meth:`children_changed`.
+    """
+
+    @classmethod
+    def make_element(cls, tag, attrib=None):
+        """Create a new XML element using the current :attr:`ETREE`.
+
+        Args:
+          tag (str): Element tag
+          attrib (dict): Element attributes, if any
+
+        Returns:
+          xml.etree.ElementTree.Element: New element
+        """
+        return cls.ETREE.Element(tag, attrib or {})
+
+    @classmethod
+    def make_child(cls, parent, tag, attrib=None):
+        """Create a new XML element as the last child of the given parent.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Element tag
+          attrib (dict): Element attributes, if any
+
+        Returns:
+          xml.etree.ElementTree.Element: New element
+        """
+        child = cls.ETREE.SubElement(parent, tag, attrib or {})
+        cls._child_added(parent, child)
+        return child
+
+    @classmethod
+    def from_string(cls, text):
+        """Parse an XML element from the given string.
+
+        Args:
+          text (str): XML text
+
+        Returns:
+          xml.etree.ElementTree.Element: Parsed element
+        """
+        return cls.ETREE.fromstring(text)
+
+    @staticmethod
+    def register_namespace(prefix, uri):
+        """Register a namespace prefix to use when writing XML.
+
+        Args:
+          prefix (str): Namespace prefix, such as "ovf"
+          uri (str): Namespace URI
+        """
+        ET.register_namespace(prefix, uri)
+        if lxml_etree is not None:
+            lxml_etree.register_namespace(prefix, uri)
+
+    @staticmethod
+    def child_index(parent, child):
+        """Get the position of the given child element under its parent.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Child element
+
+        Returns:
+          int: Index of ``child`` in ``parent``
+
+        Raises:
+          ValueError: if ``child`` is not a child of ``parent``.
+        """
+        if hasattr(parent, 'getparent'):
+            # lxml can do this natively
+            return parent.index(child)
+        return list(parent).index(child)
+
+    @classmethod
+    def remove_child(cls, parent, child):
+        """Remove the given child element from the given parent element.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Child element to remove
+        """
+        parent.remove(child)
+        cls.children_changed(parent)
+
+    @classmethod
+    def children_changed(cls, parent):
+        """Discard any index of the children of the given parent element.
+
+        The methods of this class that add or remove child elements take
+        care of this automatically, but any other code that adds, removes,
+        or changes the attributes of children of a parent must call this
+        afterwards, as :meth:`find_all_children` may otherwise give stale
+        results.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+        """
+        cls._child_index.pop(parent, None)
+
+    @classmethod
+    def _child_added(cls, parent, child):
+        """Update the index of the given parent's children after an addition.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          child (xml.etree.ElementTree.Element): Newly added child element
+        """
+        indexes = cls._child_index.get(parent)
+        if indexes is None:
+            return
+        if parent[-1] is not child:
+            # Not appended, so we can't easily preserve document order
+            cls.children_changed(parent)
+            return
+        for ((tag, keys), index) in indexes.items():
+            if child.tag == tag:
+                index.setdefault(tuple(child.get(key) for key in keys),
+                                 []).append(child)
+
+    @classmethod
+    def _indexed_children(cls, parent, tag, attrib):
+        """Find matching children using (and if needed, building) an index.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Child tag to match on
+          attrib (dict): Child attributes to match on
+
+        Returns:
+          list: (Possibly empty) list of matching child Elements, or None
+          if the parent has too few children to be worth indexing.
+        """
+        indexes = cls._child_index.get(parent)
+        if indexes is None:
+            if len(parent) < cls.INDEX_MIN_CHILDREN:
+                return None
+            if len(cls._child_index) >= cls.INDEX_MAX_PARENTS:
+                cls._child_index.clear()
+            indexes = cls._child_index[parent] = {}
+        keys = tuple(sorted(attrib))
+        index = indexes.get((tag, keys))
+        if index is None:
+            logger.spam("Indexing %s children of %s by %s",
+                        XML.strip_ns(tag), XML.strip_ns(parent.tag),
+                        [XML.strip_ns(key) for key in keys])
+            index = {}
+            for child in parent.findall(tag):
+                index.setdefault(tuple(child.get(key) for key in keys),
+                                 []).append(child)
+            indexes[(tag, keys)] = index
+        return list(index.get(tuple(attrib[key] for key in keys), []))
+
     @staticmethod
     def get_ns(text):
         """Get the namespace prefix from an XML element or attribute name.
@@ -60,34 +647,116 @@ class XML(object):
         else:
             return match.group(1)
 
-    def __init__(self, xml_file):
+    def __init__(self, xml_file, location=None):
         """Read the given XML file and store it in memory.
 
         The memory representation is available as properties :attr:`tree` and
         :attr:`root`.
 
+        If :mod:`xml.etree.ElementTree` is in use and the file is at least
+        :attr:`LAZY_TEXT_MIN_SIZE` bytes long, the text of any element at
+        least that long is not kept in memory; it is only read back from
+        the file when first accessed, and otherwise is copied verbatim from
+        the file by :meth:`write_xml`.
+
         Args:
-          xml_file (str): File path to read.
+          xml_file (object): File path or readable file object.
+          location (tuple): If ``xml_file`` is a file object, the
+            ``(path, offset, size)`` at which its data can be found on disk,
+            allowing element text to be loaded lazily as described above.
 
         Raises:
-          xml.etree.ElementTree.ParseError: if parsing fails
+          xml.etree.ElementTree.ParseError: if parsing fails (or the
+            equivalent :mod:`lxml` exception; see :attr:`PARSE_ERRORS`)
         """
+        self._text_source = self._lazy_text_source(xml_file, location)
+        self._lazy_elements = []
         # Parse the XML into memory
-        self.tree = ET.parse(xml_file)
+        if self._text_source is not None:
+            parser = _LazyTextParser(self._text_source,
+                                     self.LAZY_TEXT_MIN_SIZE)
+            if location is None:
+                with open(xml_file, 'rb') as fileobj:
+                    self.tree = ET.ElementTree(parser.parse(fileobj))
+            else:
+                self.tree = ET.ElementTree(parser.parse(xml_file))
+            self._lazy_elements = parser.lazy_elements
+            logger.debug("Parsed %s, leaving the text of %d elements on disk",
+                         self._text_source.path, len(self._lazy_elements))
+        elif self.ETREE is ET:
+            self.tree = ET.parse(xml_file)
+        else:
+            # Discard comments and processing instructions,
+            # just as xml.etree.ElementTree does.
+            self.tree = self.ETREE.parse(
+                xml_file, self.ETREE.XMLParser(remove_comments=True,
+                                               remove_pis=True))
         """:class:`xml.etree.ElementTree.ElementTree` describing this file."""
         self.root = self.tree.getroot()
         """Root :class:`xml.etree.ElementTree.Element` instance of the tree."""
 
-    def write_xml(self, xml_file):
-        """Write pretty XML out to the given file.
+    def _lazy_text_source(self, xml_file, location):
+        """Determine whether element text can be loaded lazily from the file.
 
         Args:
-          xml_file (str): Filename to write to
+          xml_file (object): File path or readable file object.
+          location (tuple): See :meth:`__init__`.
+        Returns:
+          _TextSource: Source to load text from, or None.
         """
-        logger.verbose("Writing XML to %s", xml_file)
+        if self.ETREE is not ET or not _LAZY_TEXT_SUPPORTED:
+            return None
+        if location is None:
+            if not isinstance(xml_file, str):
+                return None
+            location = (xml_file, 0, os.path.getsize(xml_file))
+        (path, offset, size) = location
+        if size < self.LAZY_TEXT_MIN_SIZE:
+            return None
+        return _TextSource(path, offset)
+
+    def load_lazy_text(self):
+        """Read into memory any element text not yet loaded from the file.
+
+        This is done automatically by :meth:`write_xml` before overwriting
+        the file, but must be done explicitly before otherwise modifying it.
+        """
+        if self._text_source is None:
+            return
+        logger.debug("Loading text of %d elements from %s",
+                     len(self._lazy_elements), self._text_source.path)
+        for elem in self._lazy_elements:
+            _ = elem.text
+        self._lazy_elements = []
+        self._text_source = None
+
+    SERIALIZE_CHUNK_SIZE = 64 * 1024
+    """Approximate size of each chunk produced by :meth:`serialize_xml`."""
 
-        # Pretty-print the XML for readability
-        self.xml_reindent(self.root, 0)
+    XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+    """Declaration written at the start of each XML file."""
+
+    def serialize_xml(self, write):
+        """Serialize this XML as pretty-printed UTF-8, in chunks.
+
+        Unlike :meth:`xml_reindent`, the tree itself is not modified; the
+        indentation is generated as the XML is serialized.
+
+        Args:
+          write (function): Called with each successive chunk (as bytes) of
+            the serialized XML.
+        """
+        pending = [self.XML_DECLARATION]
+        pending_len = [0]
+
+        def emit(text):
+            """Buffer the given text, passing on full chunks to ``write``."""
+            pending.append(text)
+            pending_len[0] += len(text)
+            if pending_len[0] >= self.SERIALIZE_CHUNK_SIZE:
+                write("".join(pending).encode('utf-8', 'xmlcharrefreplace'))
+                del pending[:]
+                pending_len[0] = 0
 
         # We could make cleaner XML by passing "default_namespace=NSM['ovf']",
         # which will leave off the "ovf:" prefix on elements and attributes in
@@ -99,7 +768,123 @@ class XML(object):
         # option
         #
         # This is a bug - see http://bugs.python.org/issue17088
-        self.tree.write(xml_file, xml_declaration=True, encoding='utf-8')
+        (qnames, namespaces) = _namespaces(self.root)
+        if len(self.root):
+            tail = "\n"
+        else:
+            tail = _escape_cdata(self.root.tail or "")
+        self._serialize_element(emit, self.root, qnames, namespaces, 0, tail)
+        write("".join(pending).encode('utf-8', 'xmlcharrefreplace'))
+
+    @classmethod
+    def _serialize_element(cls, emit, elem, qnames, namespaces, depth, tail):
+        """Recursively serialize an element, indenting its children.
+
+        Args:
+          emit (function): Called with each successive piece of text.
+          elem (xml.etree.ElementTree.Element): Element to serialize
+          qnames (dict): Qualified name --> prefixed name
+          namespaces (dict): Namespace URI --> prefix, to declare on this
+            element, if any.
+          depth (int): Indentation of this element
+          tail (str): Text to emit after this element
+        """
+        tag = qnames[elem.tag]
+        emit("<" + tag)
+        cls._serialize_attributes(emit, elem, qnames, namespaces)
+        if len(elem):
+            emit(">\n" + " " * (depth + 2))
+            last = len(elem) - 1
+            for i, child in enumerate(elem):
+                cls._serialize_element(
+                    emit, child, qnames, None, depth + 2,
+                    "\n" + " " * (depth if i == last else depth + 2))
+            emit("</" + tag + ">")
+        elif isinstance(elem, _LazyTextElement) and elem.raw_text():
+            # Copy the text from the source file as-is
+            emit(">")
+            for piece in elem.raw_text():
+                emit(piece)
+            emit("</" + tag + ">")
+        elif elem.text:
+            emit(">" + _escape_cdata(elem.text) + "</" + tag + ">")
+        else:
+            emit(" />")
+        emit(tail)
+
+    @staticmethod
+    def _serialize_attributes(emit, elem, qnames, namespaces):
+        """Serialize the attributes of an element.
+
+        Args:
+          emit (function): Called with each successive piece of text.
+          elem (xml.etree.ElementTree.Element): Element to serialize
+          qnames (dict): Qualified name --> prefixed name
+          namespaces (dict): Namespace URI --> prefix, to declare on this
+            element, if any.
+        """
+        if namespaces:
+            for uri, prefix in sorted(namespaces.items(),
+                                      key=lambda x: x[1]):
+                emit(' xmlns{0}="{1}"'.format(":" + prefix if prefix else "",
+                                              _escape_attrib(uri)))
+        items = list(elem.items())
+        if _SORT_ATTRIBUTES:
+            items.sort()
+        for key, value in items:
+            if isinstance(key, ET.QName):
+                key = key.text
+            if isinstance(value, ET.QName):
+                value = qnames[value.text]
+            else:
+                value = _escape_attrib(value)
+            emit(' {0}="{1}"'.format(qnames[key], value))
+
+    def write_xml(self, xml_file, checksum_algorithms=None):
+        """Write pretty XML out to the given file.
+
+        Args:
+          xml_file (str): Filename to write to
+          checksum_algorithms (list): Checksums, such as 'sha1', to compute
+            over the XML as it is written.
+
+        Returns:
+          dict: Algorithm --> checksum of the written file, for each
+          requested algorithm.
+        """
+        logger.verbose("Writing XML to %s", xml_file)
+        if (self._text_source is not None and os.path.exists(xml_file) and
+                os.path.samefile(xml_file, self._text_source.path)):
+            self.load_lazy_text()
+        hashers = [(algorithm, hashlib.new(algorithm))
+                   for algorithm in (checksum_algorithms or [])]
+
+        with open(xml_file, 'wb') as fileobj:
+            def write(chunk):
+                """Write the given chunk to the file and checksum it."""
+                for _, hasher in hashers:
+                    hasher.update(chunk)
+                fileobj.write(chunk)
+
+            self.serialize_xml(write)
+
+        return dict((algorithm, hasher.hexdigest())
+                    for algorithm, hasher in hashers)
+
+    def xml_size(self):
+        """Get the size of the XML as :meth:`write_xml` would write it.
+
+        Returns:
+          int: Size in bytes.
+        """
+        size = [0]
+
+        def count(chunk):
+            """Tally the size of the given chunk."""
+            size[0] += len(chunk)
+
+        self.serialize_xml(count)
+        return size[0]
 
     @staticmethod
     def xml_reindent(parent, depth=0):
@@ -174,8 +959,20 @@ class XML(object):
 
         Returns:
           list: (Possibly empty) list of matching child Elements
+
+        Note:
+          When searching by ``attrib`` under a parent with at least
+          :attr:`INDEX_MIN_CHILDREN` children, an index of the children by
+          these attributes is built and kept for subsequent searches.
+          See :meth:`children_changed`.
         """
         assert parent is not None
+        if attrib and isinstance(tag, str):
+            child_list = cls._find_by_attrib(parent, tag, attrib)
+            if child_list is not None:
+                logger.spam("Found %s matching %s elements",
+                            len(child_list), XML.strip_ns(tag))
+                return child_list
         if isinstance(tag, str):
             elements = parent.findall(tag)
             label = tag
@@ -211,6 +1008,60 @@ class XML(object):
         logger.spam("Found %s matching %s elements", len(child_list), label)
         return child_list
 
+    @classmethod
+    def _find_by_attrib(cls, parent, tag, attrib):
+        """Find matching children by attribute using an index or XPath.
+
+        Args:
+          parent (xml.etree.ElementTree.Element): Parent element
+          tag (str): Child tag to match on
+          attrib (dict): Child attributes to match on
+
+        Returns:
+          list: (Possibly empty) list of matching child Elements, or None
+          if neither an index nor XPath is applicable.
+        """
+        child_list = cls._indexed_children(parent, tag, attrib)
+        if child_list is None and hasattr(parent, 'xpath'):
+            if None not in attrib.values():
+                keys = sorted(attrib)
+                child_list = cls._xpath_query(tag, keys)(
+                    parent, **dict(("v{0}".format(i), attrib[key])
+                                   for (i, key) in enumerate(keys)))
+        return child_list
+
+    @classmethod
+    def _xpath_query(cls, tag, keys):
+        """Get a compiled XPath query for children with the given attributes.
+
+        Args:
+          tag (str): Child tag to match on
+          keys (list): Attribute names to match on. The compiled query
+            takes the expected value of each as variables ``v0``, ``v1``...
+
+        Returns:
+          lxml.etree.XPath: Compiled query
+        """
+        query = cls._xpaths.get((tag, tuple(keys)))
+        if query is None:
+            namespaces = {}
+
+            def qualify(name):
+                """Convert a namespaced name to XPath prefix:name form."""
+                match = re.match(r"\{(.*)\}(.*)", name)
+                if not match:
+                    return name
+                prefix = "n{0}".format(len(namespaces))
+                namespaces[prefix] = match.group(1)
+                return prefix + ":" + match.group(2)
+
+            path = qualify(tag) + "".join(
+                "[@{0}=$v{1}]".format(qualify(key), i)
+                for (i, key) in enumerate(keys))
+            query = lxml_etree.XPath(path, namespaces=namespaces)
+            cls._xpaths[(tag, tuple(keys))] = query
+        return query
+
     @classmethod
     def add_child(cls, parent, new_child, ordering=None,
                   known_namespaces=None):
@@ -276,6 +1127,7 @@ class XML(object):
                 parent.insert(index, new_child)
             else:
                 parent.append(new_child)
+        cls._child_added(parent, new_child)
 
     @classmethod
     def set_or_make_child(cls, parent, tag, text=None, attrib=None,
@@ -301,7 +1153,7 @@ class XML(object):
         if element is None:
             logger.spam("Creating new %s element under parent %s",
                         XML.strip_ns(tag), XML.strip_ns(parent.tag))
-            element = ET.Element(tag)
+            element = cls.make_element(tag, attrib)
             XML.add_child(parent, element, ordering, known_namespaces)
         if text is not None:
             element.text = str(text)
@@ -121,6 +121,7 @@ tests_require = install_requires + ['unittest2', 'mock']
 
 extras_require = {
     'tab-completion': ['argcomplete>=1.3.0'],
+    'lxml': ['lxml'],
 }
 
 cmdclass = versioneer.get_cmdclass()